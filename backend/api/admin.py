@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Movie, Watchlist, WatchlistMovie, Rating, Comment
+from django.db import connections, transaction
+from django.db.models.expressions import RawSQL
+from .models import Movie, MovieRatingStats, Watchlist, WatchlistMovie, Rating, Comment, LeaderboardEntry, MovieSimilarity
+from .leaderboards import remove_listings
+from .search import FTS_TABLE, match_expression, search_terms, uses_fts
 
 # NO registres el modelo User aquí - ya está registrado por Django
 # @admin.register(User)
@@ -12,6 +16,11 @@ class MovieAdmin(admin.ModelAdmin):
     list_display = ('id', 'externalId')
     search_fields = ('externalId',)
 
+@admin.register(MovieRatingStats)
+class MovieRatingStatsAdmin(admin.ModelAdmin):
+    list_display = ('movie', 'count', 'mean')
+    readonly_fields = ('count', 'total', 'mean', 'score1', 'score2', 'score3', 'score4', 'score5')
+
 @admin.register(Watchlist)
 class WatchlistAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'isPublic')
@@ -22,6 +31,13 @@ class WatchlistAdmin(admin.ModelAdmin):
 class WatchlistMovieAdmin(admin.ModelAdmin):
     list_display = ('watchlist', 'movie')
     search_fields = ('watchlist__name', 'movie__externalId')
+    
+    # Los borrados en bloque no descuentan fila a fila (ver api/signals.py)
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            remove_listings(queryset.values_list('movie_id', 'addedAt'))
+            Watchlist.touch_many(queryset.values('watchlist_id'))
+            super().delete_queryset(request, queryset)
 
 @admin.register(Rating)
 class RatingAdmin(admin.ModelAdmin):
@@ -33,4 +49,35 @@ class RatingAdmin(admin.ModelAdmin):
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('user', 'movie', 'createdAt')
     search_fields = ('user__username', 'text', 'movie__externalId')
-    list_filter = ('createdAt',)
\ No newline at end of file
+    list_filter = ('createdAt',)
+    
+    # El texto se busca en el índice FTS5 (api/search.py) en lugar de con LIKE '%...%'
+    def get_search_fields(self, request):
+        fields = super().get_search_fields(request)
+        if uses_fts(connections[self.model.objects.db]):
+            fields = tuple(field for field in fields if field != 'text')
+        return fields
+    
+    def get_search_results(self, request, queryset, search_term):
+        filtered = queryset
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        terms = search_terms(search_term)
+        if terms and uses_fts(connections[filtered.db]):
+            matches = RawSQL(
+                f'SELECT c.id FROM {FTS_TABLE} JOIN comments c ON c.rowid = {FTS_TABLE}.rowid WHERE {FTS_TABLE} MATCH %s',
+                [match_expression(terms)]
+            )
+            queryset |= filtered.filter(id__in=matches)
+        return queryset, may_have_duplicates
+
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'window', 'rank', 'movie', 'score', 'count', 'computedAt')
+    list_filter = ('kind', 'window')
+    readonly_fields = ('kind', 'window', 'rank', 'movie', 'score', 'count', 'computedAt')
+
+@admin.register(MovieSimilarity)
+class MovieSimilarityAdmin(admin.ModelAdmin):
+    list_display = ('movie', 'neighbor', 'score', 'support', 'computedAt')
+    search_fields = ('movie__externalId',)
+    readonly_fields = ('movie', 'neighbor', 'score', 'support', 'computedAt')
\ No newline at end of file
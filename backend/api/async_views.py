@@ -0,0 +1,260 @@
+import base64
+import functools
+import json
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .authentication import CachedTokenAuthentication
+from .bulk import abulk_rating_stats, aresolve_external_ids, parse_movie_ids
+from .conditional import etag_matches, object_etag, with_etag
+from .fieldsets import parse_fieldsets, shape_queryset
+from .models import Comment, Movie, Watchlist, WatchlistMovie
+from .renderers import dumps
+from .serializers import CommentSerializer, MovieRatingStatsSerializer, MovieResolveSerializer
+from .stats import aget_rating_stats
+from .tmdb import get_gateway
+from .views import (
+    WatchlistViewSet, contents_end, contents_item, decode_contents_cursor
+)
+
+# Variantes async de las lecturas más frecuentes (/api/async/...). Con un
+# servidor ASGI no ocupan un hilo mientras esperan a la base de datos o a
+# TMDB, así que un proceso atiende muchas a la vez. Responden lo mismo que
+# sus equivalentes de api/views.py, con los mismos permisos (IsAuthenticated)
+# y los mismos errores, pero son vistas de Django: DRF todavía no tiene vistas
+# async. Con WSGI también funcionan, aunque sin ninguna ventaja
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def error_response(exc):
+    """Respuesta de una APIException con el mismo formato que el exception_handler de DRF."""
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = json_response(data, exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        # Como en DRF: el esquema del primer autenticador (401 en vez de 403)
+        response['WWW-Authenticate'] = CachedTokenAuthentication().authenticate_header(None)
+    return response
+
+
+async def authenticate(request):
+    """Usuario de la petición con los autenticadores de DEFAULT_AUTHENTICATION_CLASSES: token o sesión."""
+    result = await CachedTokenAuthentication().aauthenticate(request)
+    if result is not None:
+        return result[0]
+    user = await request.auser()
+    if user.is_authenticated and user.is_active:
+        # La sesión exige el token CSRF en las escrituras, igual que SessionAuthentication
+        SessionAuthentication().enforce_csrf(request)
+    return user
+
+
+def async_api_view(*methods):
+    """
+    Vista async con la autenticación y la comprobación de IsAuthenticated de
+    las vistas de DRF. La vista devuelve la respuesta o lanza una APIException.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                request.user = await authenticate(request)
+                if not request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                if request.method not in methods:
+                    raise exceptions.MethodNotAllowed(request.method)
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                return error_response(exc)
+        return wrapper
+    return decorator
+
+
+def bad_request(message):
+    return exceptions.ValidationError({'error': message})
+
+
+# Cursor opaco de los comentarios de una película (createdAt e id del último enviado)
+def encode_comments_cursor(comment):
+    return base64.urlsafe_b64encode(json.dumps([comment.createdAt.isoformat(), str(comment.id)]).encode()).decode()
+
+
+def decode_comments_cursor(cursor):
+    created_at, comment_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(created_at), uuid.UUID(comment_id)
+
+
+def page_size(request):
+    """?page_size= como en DefaultCursorPagination: el tamaño por defecto si no es válido."""
+    default = settings.REST_FRAMEWORK['PAGE_SIZE']
+    try:
+        size = int(request.GET.get('page_size', default))
+    except ValueError:
+        return default
+    return min(size, settings.API_MAX_PAGE_SIZE) if size > 0 else default
+
+
+def parse_uuid(value, name):
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError):
+        raise bad_request(f'{name} must be a valid UUID')
+
+
+# Comentarios de una película, de los más recientes a los más antiguos:
+# /api/async/comments/?movie=<uuid>&page_size=<n>&cursor=<cursor>, con
+# ?fields= y ?expand= como en /api/comments/
+@async_api_view('GET')
+async def movie_comments(request):
+    if not request.GET.get('movie'):
+        raise bad_request('movie parameter is required')
+    movie_id = parse_uuid(request.GET['movie'], 'movie')
+
+    fields, expand = parse_fieldsets(request.GET)
+    serializer = CommentSerializer(fields=fields, expand=expand)
+    comments = shape_queryset(
+        Comment.objects.filter(movie_id=movie_id), serializer, ('createdAt',)
+    ).order_by('-createdAt', '-id')
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            created_at, last_id = decode_comments_cursor(cursor)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise bad_request('Invalid cursor')
+        comments = comments.filter(Q(createdAt__lt=created_at) | Q(createdAt=created_at, id__lt=last_id))
+
+    # Una fila de más para saber si hay página siguiente
+    size = page_size(request)
+    page = [comment async for comment in comments[:size + 1]]
+    next_link = None
+    if len(page) > size:
+        page = page[:size]
+        next_link = replace_query_param(
+            request.build_absolute_uri(), 'cursor', encode_comments_cursor(page[-1])
+        )
+    data = CommentSerializer(page, many=True, fields=fields, expand=expand).data
+    return json_response({'next': next_link, 'previous': None, 'results': data})
+
+
+# Genera el JSON del contenido mientras llegan las filas (ver stream_contents)
+async def astream_contents(rows, limit, next_url, metadata=None):
+    yield b'{"results":['
+    last = None
+    index = 0
+    async for row in rows:
+        if index == limit:
+            yield contents_end(last, next_url)
+            return
+        last = row
+        yield (b',' if index else b'') + dumps(contents_item(row, metadata))
+        index += 1
+    yield contents_end(None, next_url)
+
+
+# Contenido de una watchlist en orden y en streaming, como /api/watchlists/{id}/contents/:
+# /api/async/watchlists/{id}/contents/?cursor=<cursor>&limit=<n>&embed=tmdb
+@async_api_view('GET')
+async def watchlist_contents(request, pk):
+    user = request.user
+    try:
+        watchlist = await Watchlist.objects.visible_to(user).aget(pk=pk)
+    except Watchlist.DoesNotExist:
+        raise exceptions.NotFound('No Watchlist matches the given query.')
+
+    # Verificar que el usuario puede ver esta watchlist
+    if not watchlist.isPublic and watchlist.user_id != user.id:
+        raise exceptions.PermissionDenied({'error': 'No tienes permiso para ver esta watchlist'})
+
+    embed_tmdb = 'tmdb' in request.GET.get('embed', '').split(',')
+    etag = None if embed_tmdb else object_etag(watchlist)
+    if etag and etag_matches(request.headers.get('If-None-Match'), etag):
+        return with_etag(HttpResponse(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+    try:
+        limit = int(request.GET.get('limit', WatchlistViewSet.contents_page_size))
+    except ValueError:
+        limit = WatchlistViewSet.contents_page_size
+    max_page_size = (WatchlistViewSet.contents_tmdb_max_page_size if embed_tmdb
+                     else WatchlistViewSet.contents_max_page_size)
+    limit = max(1, min(limit, max_page_size))
+
+    # Recorrido del índice (watchlist, position, id)
+    rows = WatchlistMovie.objects.filter(watchlist=watchlist).order_by('position', 'id')
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            position, last_id = decode_contents_cursor(cursor)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise bad_request('Invalid cursor')
+        rows = rows.filter(Q(position__gt=position) | Q(position=position, id__gt=last_id))
+
+    # Una fila de más para saber si hay página siguiente
+    rows = rows.values('id', 'movie_id', 'movie__externalId', 'position')[:limit + 1]
+    next_url = remove_query_param(request.build_absolute_uri(), 'cursor')
+
+    if embed_tmdb:
+        # Mientras se espera a TMDB el proceso sigue con otras peticiones
+        rows = [row async for row in rows]
+        metadata = await get_gateway().aget_many([row['movie__externalId'] for row in rows[:limit]])
+        return StreamingHttpResponse(
+            astream_contents(_aiter(rows), limit, next_url, metadata),
+            content_type='application/json'
+        )
+
+    return with_etag(StreamingHttpResponse(
+        astream_contents(rows, limit, next_url),
+        content_type='application/json'
+    ), etag)
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+# Resolución en bloque de ids de TMDB, como /api/movies/resolve/:
+# POST /api/async/movies/resolve/ con {"externalIds": [...], "create": false}
+@async_api_view('POST')
+async def resolve_movies(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError as exc:
+        raise exceptions.ParseError(f'JSON parse error - {exc}')
+    serializer = MovieResolveSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    return json_response(await aresolve_external_ids(
+        request.user, serializer.validated_data['externalIds'], serializer.validated_data['create']
+    ))
+
+
+# Estadísticas de puntuación de una película: /api/async/movies/{id}/stats/
+@async_api_view('GET')
+async def movie_stats(request, pk):
+    if not await Movie.objects.filter(pk=pk).aexists():
+        raise exceptions.NotFound('No Movie matches the given query.')
+    stats = await aget_rating_stats([pk])
+    return json_response(MovieRatingStatsSerializer(stats[pk]).data)
+
+
+# Estadísticas de varias películas: /api/async/movies/stats/?ids=<uuid>,<uuid>
+@async_api_view('GET')
+async def bulk_movie_stats(request):
+    try:
+        movie_ids = parse_movie_ids(request.GET.get('ids', ''))
+    except ValueError as exc:
+        raise bad_request(str(exc))
+    stats = await abulk_rating_stats(movie_ids)
+    return json_response(MovieRatingStatsSerializer(stats.values(), many=True).data)
@@ -0,0 +1,445 @@
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import django
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections
+from django.db.models import Count
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .ids import uuid7
+from .models import Comment, Movie, Watchlist
+from .seeding import SEED_PASSWORD, seed_dataset
+from .serializers import CommentSerializer, RatingSerializer
+from .sqlite import apply_pragmas
+from .stats import get_rating_stats
+from .tmdb import reset_gateway, tmdb_settings
+
+# Tamaños de conjunto de datos predefinidos (argumentos de seed_dataset)
+SIZES = {
+    'small': {'users': 100, 'movies': 500},
+    'medium': {'users': 1000, 'movies': 5000},
+    'large': {'users': 10000, 'movies': 20000},
+}
+
+
+def _summary(timings, queries, size):
+    timings = sorted(timings)
+    return {
+        'n': len(timings),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        'p50_ms': round(timings[len(timings) // 2] * 1000, 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+        'max_ms': round(timings[-1] * 1000, 3),
+        'queries': max(queries),
+        'bytes': size,
+    }
+
+
+def _measure(request, repeat):
+    """
+    Ejecuta request() repeat veces y mide el tiempo y las consultas de cada
+    llamada, y el tamaño del cuerpo tal como se envía (comprimido si procede).
+    """
+    timings, queries = [], []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = request()
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            timings.append(time.perf_counter() - start)
+        queries.append(len(context.captured_queries))
+        if response.status_code >= 400:
+            raise RuntimeError(f'{response.status_code}: {response.content[:200]!r}')
+    return _summary(timings, queries, len(body))
+
+
+def _client(user):
+    # Como un navegador: acepta respuestas comprimidas
+    client = APIClient(HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get(user=user).key}')
+    return client
+
+
+def benchmark_endpoints(repeat=20, seed=0):
+    """Mide los endpoints más usados sobre los datos que haya en la base de datos."""
+    rng = random.Random(seed)
+    top_movie = Movie.objects.order_by('externalId').first()
+    watchlist = (Watchlist.objects.annotate(size=Count('watchlist_movies'))
+                 .select_related('user').order_by('-size').first())
+    movie_ids = list(Movie.objects.values_list('id', flat=True))
+    owner = _client(watchlist.user)
+    login = APIClient()
+
+    return {
+        'movies_list': _measure(lambda: owner.get('/api/movies/', {'page_size': 200}), repeat),
+        'public_watchlists': _measure(lambda: owner.get('/api/watchlists/', {'page_size': 200}), repeat),
+        'comments_by_movie': _measure(lambda: owner.get('/api/comments/', {'movie': str(top_movie.id)}), repeat),
+        'watchlist_contents': _measure(lambda: owner.get(f'/api/watchlists/{watchlist.id}/contents/'), repeat),
+        'rating_upsert': _measure(lambda: owner.post('/api/ratings/', {
+            'movie_uuid': str(rng.choice(movie_ids)), 'score': rng.randint(1, 5),
+        }, format='json'), repeat),
+        'login': _measure(lambda: login.post('/api/login/', {
+            'username': watchlist.user.username, 'password': SEED_PASSWORD,
+        }, format='json'), repeat),
+    }
+
+
+# TMDB falso para medir las peticiones que esperan a TMDB: responde a
+# /movie/{id} con un retraso fijo (el de una API remota)
+class _SlowTMDBHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        external_id = self.path.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+        body = json.dumps({'id': int(external_id), 'title': f'Movie {external_id}'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _SlowTMDBServer(ThreadingHTTPServer):
+    # Muchas conexiones a la vez: con la cola por defecto (5) se perderían y se reintentarían al segundo
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+@contextmanager
+def slow_tmdb(latency):
+    """TMDB falso con latency segundos de retraso y sin caché (TTL=0): cada petición va a TMDB."""
+    server = _SlowTMDBServer(('127.0.0.1', 0), _SlowTMDBHandler)
+    server.latency = latency
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    config = {**tmdb_settings(), 'BASE_URL': f'http://127.0.0.1:{server.server_port}', 'API_KEY': 'benchmark', 'TTL': 0}
+    try:
+        with override_settings(TMDB=config):
+            reset_gateway()
+            yield
+    finally:
+        reset_gateway()
+        server.shutdown()
+        server.server_close()
+
+
+def _check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f'{response.status_code}: {response.content[:200]!r}')
+
+
+def _wsgi_throughput(method, path, data, headers, total):
+    """
+    Peticiones por segundo de un worker WSGI síncrono: atiende una petición
+    cada vez, así que da igual cuántos clientes esperen.
+    """
+    client = Client()
+    start = time.perf_counter()
+    for _ in range(total):
+        response = getattr(client, method)(path, data, content_type='application/json', headers=headers)
+        b''.join(response.streaming_content) if response.streaming else response.content
+        _check(response)
+    return total / (time.perf_counter() - start)
+
+
+async def _asgi_throughput(method, path, data, headers, total, concurrency):
+    """Peticiones por segundo de un proceso ASGI con concurrency clientes a la vez."""
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request():
+        async with semaphore:
+            response = await getattr(client, method)(path, data, content_type='application/json', headers=headers)
+            if response.streaming:
+                [chunk async for chunk in response.streaming_content]
+            _check(response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def benchmark_concurrency(concurrency=16, total=200, upstream_latency=0.05):
+    """
+    Compara el rendimiento de las vistas síncronas (un worker WSGI) con el de
+    sus variantes async (api/async_views.py) en un proceso ASGI con
+    concurrency peticiones a la vez. Las consultas a SQLite se siguen
+    ejecutando de una en una en el hilo del ORM; la ganancia está en las
+    peticiones que esperan a TMDB (con un TMDB falso de upstream_latency s).
+    """
+    top_movie = Movie.objects.order_by('externalId').first()
+    watchlist = (Watchlist.objects.annotate(size=Count('watchlist_movies'))
+                 .select_related('user').order_by('-size').first())
+    movie_ids = [str(movie_id) for movie_id in Movie.objects.order_by('externalId').values_list('id', flat=True)[:50]]
+    external_ids = list(Movie.objects.order_by('externalId').values_list('externalId', flat=True)[:50])
+    headers = {
+        'Authorization': f'Token {Token.objects.get(user=watchlist.user).key}',
+        'Accept-Encoding': 'gzip, deflate, br',
+    }
+
+    # (método, ruta síncrona, ruta async, datos)
+    scenarios = {
+        'comments_by_movie': ('get', '/api/comments/', '/api/async/comments/', {'movie': str(top_movie.id)}),
+        'watchlist_contents': ('get', f'/api/watchlists/{watchlist.id}/contents/',
+                               f'/api/async/watchlists/{watchlist.id}/contents/', {}),
+        'movies_resolve': ('post', '/api/movies/resolve/', '/api/async/movies/resolve/',
+                           json.dumps({'externalIds': external_ids})),
+        'rating_stats': ('get', '/api/movies/stats/', '/api/async/movies/stats/', {'ids': ','.join(movie_ids)}),
+        'watchlist_contents_tmdb': ('get', f'/api/watchlists/{watchlist.id}/contents/',
+                                    f'/api/async/watchlists/{watchlist.id}/contents/', {'limit': 8, 'embed': 'tmdb'}),
+    }
+
+    results = {}
+    with slow_tmdb(upstream_latency):
+        for name, (method, sync_path, async_path, data) in scenarios.items():
+            # El número de peticiones con TMDB se reduce: cada una espera upstream_latency
+            count = max(concurrency, total // 4) if 'tmdb' in name else total
+            wsgi = _wsgi_throughput(method, sync_path, data, headers, count)
+            asgi = asyncio.run(_asgi_throughput(method, async_path, data, headers, count, concurrency))
+            results[name] = {
+                'requests': count,
+                'wsgi_req_per_s': round(wsgi, 1),
+                'asgi_req_per_s': round(asgi, 1),
+                'speedup': round(asgi / wsgi, 2),
+            }
+    return {'concurrency': concurrency, 'upstream_latency_ms': round(upstream_latency * 1000), 'endpoints': results}
+
+
+# Configuraciones de SQLite que compara benchmark_sqlite: (PRAGMAs, transaction_mode)
+SQLITE_PROFILES = {
+    'django_default': ({}, 'DEFERRED'),     # Diario de rollback, synchronous=FULL, BEGIN DEFERRED
+    'tuned': (None, 'IMMEDIATE'),           # El perfil de settings.SQLITE (api/sqlite.py)
+}
+
+
+@contextmanager
+def _sqlite_file(pragmas, transaction_mode):
+    """
+    Copia la base de datos de pruebas (en memoria) a un fichero temporal y
+    hace que las conexiones que se abran a partir de ahora lo usen con la
+    configuración dada. La conexión del hilo actual sigue en la original.
+    """
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'benchmark.sqlite3')
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+    finally:
+        target.close()
+    original = connections.settings[DEFAULT_DB_ALIAS]
+    connections.settings[DEFAULT_DB_ALIAS] = {
+        **original, 'NAME': path, 'OPTIONS': {**original.get('OPTIONS', {}), 'transaction_mode': transaction_mode},
+    }
+    try:
+        with override_settings(SQLITE={'PRAGMAS': pragmas} if pragmas is not None else {}):
+            yield path
+    finally:
+        connections.settings[DEFAULT_DB_ALIAS] = original
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _sqlite_workload(seconds, readers, writers, users, movie_ids):
+    """Lectores y escritores en hilos (cada uno con su conexión) durante seconds segundos."""
+    deadline = time.perf_counter() + seconds
+    counts = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+    lock = threading.Lock()
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def read(rng):
+        movie_id = rng.choice(movie_ids)
+        # Comentarios de una película y estadísticas de una rejilla de pósters
+        list(Comment.objects.filter(movie_id=movie_id).select_related('user').order_by('-createdAt', '-id')[:50])
+        get_rating_stats(rng.sample(movie_ids, 20))
+
+    def write(rng):
+        # Lo mismo que POST /api/ratings/ y /api/comments/: leer y escribir en una transacción
+        request = SimpleNamespace(user=rng.choice(users))
+        data = {'movie_uuid': str(rng.choice(movie_ids))}
+        if rng.random() < 0.5:
+            serializer = RatingSerializer(data={**data, 'score': rng.randint(1, 5)}, context={'request': request})
+        else:
+            serializer = CommentSerializer(data={**data, 'text': 'benchmark comment'}, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    def worker(index, operation, key):
+        rng = random.Random(index)
+        try:
+            while time.perf_counter() < deadline:
+                try:
+                    operation(rng)
+                    count(key + 's')
+                except OperationalError:
+                    # "database is locked"
+                    count(key + '_errors')
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(index, read, 'read')) for index in range(readers)]
+    threads += [threading.Thread(target=worker, args=(readers + index, write, 'write')) for index in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'reads_per_s': round(counts['reads'] / elapsed, 1),
+        'writes_per_s': round(counts['writes'] / elapsed, 1),
+        'read_errors': counts['read_errors'],
+        'write_errors': counts['write_errors'],
+    }
+
+
+def benchmark_sqlite(readers=4, writers=4, seconds=3.0):
+    """
+    Rendimiento de lectura y escritura con readers + writers hilos a la vez
+    sobre una copia en fichero de la base de datos, con la configuración por
+    defecto de Django y con el perfil de api/sqlite.py.
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    users = list(User.objects.order_by('id')[:200])
+    movie_ids = list(Movie.objects.values_list('id', flat=True)[:1000])
+    results = {}
+    for name, (pragmas, transaction_mode) in SQLITE_PROFILES.items():
+        with _sqlite_file(pragmas, transaction_mode):
+            results[name] = _sqlite_workload(seconds, readers, writers, users, movie_ids)
+    return {'readers': readers, 'writers': writers, 'seconds': seconds, 'profiles': results}
+
+
+def _index_shape(cursor, index):
+    """Páginas del índice y su ocupación media (las divisiones de página dejan páginas a medias)."""
+    cursor.execute('SELECT count(*), sum(unused), sum(pgsize) FROM dbstat WHERE name = ?', [index])
+    pages, unused, size = cursor.fetchone()
+    return pages, round(1 - unused / size, 3)
+
+
+def benchmark_inserts(rows=100000, batch_size=1000):
+    """
+    Inserta rows comentarios con ids UUID4 y UUID7 en la tabla comments de
+    una base de datos SQLite nueva y compara el tiempo y la forma del índice
+    de la clave primaria: con ids aleatorios cada lote modifica (y divide)
+    páginas por todo el B-tree; con ids crecientes solo las últimas.
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    table = Comment._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [table])
+        ddl = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name LIKE 'sqlite_autoindex%%'",
+            [table]
+        )
+        pk_index = cursor.fetchone()[0]
+    movie_ids = [uuid.uuid4().hex for _ in range(1000)]
+    now = timezone.now().isoformat()
+
+    results = {}
+    for name, generate in (('uuid4', uuid.uuid4), ('uuid7', uuid7)):
+        directory = tempfile.mkdtemp()
+        target = sqlite3.connect(os.path.join(directory, 'inserts.sqlite3'), isolation_level=None)
+        try:
+            # Sin checkpoints automáticos, las tramas del WAL son las páginas escritas por todos los COMMIT
+            apply_pragmas(target, {'journal_mode': 'WAL', 'wal_autocheckpoint': 0})
+            target.execute(ddl)
+            start = time.perf_counter()
+            for offset in range(0, rows, batch_size):
+                batch = [
+                    (generate().hex, 'benchmark comment', now, 1, movie_ids[(offset + i) % len(movie_ids)], now, 1)
+                    for i in range(min(batch_size, rows - offset))
+                ]
+                target.execute('BEGIN')
+                target.executemany(
+                    f'INSERT INTO {table} (id, text, "createdAt", user_id, movie_id, "updatedAt", version) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', batch
+                )
+                target.execute('COMMIT')
+            elapsed = time.perf_counter() - start
+            pages_written = target.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()[1]
+            pages, fill = _index_shape(target.cursor(), pk_index)
+            results[name] = {
+                'rows_per_s': round(rows / elapsed),
+                'pages_written_per_batch': round(pages_written * batch_size / rows, 1),
+                'pk_index_pages': pages,
+                'pk_index_fill': fill,
+                'file_bytes': target.execute('PRAGMA page_count').fetchone()[0] * target.execute('PRAGMA page_size').fetchone()[0],
+            }
+        finally:
+            target.close()
+            shutil.rmtree(directory, ignore_errors=True)
+    return {'rows': rows, 'batch_size': batch_size, 'keys': results}
+
+
+def run_benchmark(sizes=('small',), repeat=20, seed=0, log=None, concurrency=0, upstream_latency=0.05,
+                  sqlite_threads=0, inserts=0):
+    """
+    Para cada tamaño vacía la base de datos, genera los datos con seed_dataset
+    y mide los endpoints. Con concurrency compara además WSGI con ASGI
+    (benchmark_concurrency) y con sqlite_threads la configuración de SQLite
+    (benchmark_sqlite). Con inserts compara además las inserciones con ids
+    UUID4 y UUID7 (benchmark_inserts). Debe ejecutarse sobre una base de
+    datos de pruebas.
+    """
+    log = log or (lambda message: None)
+    results = []
+    for size in sizes:
+        call_command('flush', interactive=False, verbosity=0)
+        log(f'Generando datos ({size})...')
+        start = time.perf_counter()
+        counts = seed_dataset(seed=seed, **SIZES[size])
+        seeded = time.perf_counter() - start
+        log(f'Midiendo endpoints ({size})...')
+        result = {
+            'size': size,
+            'rows': counts,
+            'seed_seconds': round(seeded, 3),
+            'endpoints': benchmark_endpoints(repeat=repeat, seed=seed),
+        }
+        if concurrency:
+            log(f'Comparando WSGI y ASGI ({size}, {concurrency} peticiones a la vez)...')
+            result['wsgi_vs_asgi'] = benchmark_concurrency(concurrency, upstream_latency=upstream_latency)
+        if sqlite_threads:
+            log(f'Comparando perfiles de SQLite ({size}, {sqlite_threads} lectores y escritores)...')
+            result['sqlite'] = benchmark_sqlite(readers=sqlite_threads, writers=sqlite_threads)
+        if inserts:
+            log(f'Comparando inserciones con UUID4 y UUID7 ({inserts} filas)...')
+            result['inserts'] = benchmark_inserts(rows=inserts)
+        results.append(result)
+
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': f'{connection.vendor} {connection.Database.sqlite_version}'
+                    if connection.vendor == 'sqlite' else connection.vendor,
+        'repeat': repeat,
+        'seed': seed,
+        'results': results,
+    }
@@ -0,0 +1,91 @@
+import uuid
+
+from .models import Movie, Rating
+from .stats import aget_rating_stats, get_rating_stats
+
+# Lecturas en bloque de películas comunes a MovieViewSet (api/views.py) y a sus
+# variantes async (api/async_views.py). Cada consulta tiene su versión síncrona
+# y su versión async; la validación y el formato de la respuesta son los mismos
+
+# Número máximo de películas por petición en las consultas en bloque
+MAX_BULK_SIZE = 100
+
+
+def parse_movie_ids(value):
+    """
+    Ids únicos y en orden de ?ids=<uuid>,<uuid>. Lanza ValueError con el
+    mensaje de error de la API si falta, sobra o no es válido alguno.
+    """
+    raw_ids = [item for item in value.split(',') if item]
+    if not raw_ids:
+        raise ValueError('ids parameter is required')
+    if len(raw_ids) > MAX_BULK_SIZE:
+        raise ValueError(f'A maximum of {MAX_BULK_SIZE} ids is allowed')
+    try:
+        return list(dict.fromkeys(uuid.UUID(item) for item in raw_ids))
+    except ValueError:
+        raise ValueError('ids must be valid UUIDs')
+
+
+# Estadísticas de varias películas; las que no existen se omiten
+def bulk_rating_stats(movie_ids):
+    existing = set(Movie.objects.filter(id__in=movie_ids).values_list('id', flat=True))
+    return get_rating_stats([movie_id for movie_id in movie_ids if movie_id in existing])
+
+
+async def abulk_rating_stats(movie_ids):
+    existing = {movie_id async for movie_id in Movie.objects.filter(id__in=movie_ids).values_list('id', flat=True)}
+    return await aget_rating_stats([movie_id for movie_id in movie_ids if movie_id in existing])
+
+
+def resolution_results(external_ids, movie_ids, stats, user_scores):
+    """Filas de /movies/resolve/: id local, media, número de ratings y puntuación del usuario."""
+    results = []
+    for external_id in external_ids:
+        movie_id = movie_ids.get(external_id)
+        count = stats[movie_id].count if movie_id else 0
+        results.append({
+            'externalId': external_id,
+            'id': movie_id,
+            'mean': stats[movie_id].mean if count else None,
+            'count': count,
+            'userScore': user_scores.get(movie_id),
+        })
+    return results
+
+
+# Resolución de ids de TMDB con un número fijo de consultas. Con create=True
+# se crean las que falten (ignorando las que cree otra petición a la vez)
+def resolve_external_ids(user, external_ids, create=False):
+    external_ids = list(dict.fromkeys(external_ids))
+    movies = Movie.objects.values_list('externalId', 'id')
+    movie_ids = dict(movies.filter(externalId__in=external_ids))
+
+    missing = [external_id for external_id in external_ids if external_id not in movie_ids]
+    if missing and create:
+        Movie.objects.bulk_create([Movie(externalId=external_id) for external_id in missing], ignore_conflicts=True)
+        movie_ids.update(movies.filter(externalId__in=missing))
+
+    stats = get_rating_stats(list(movie_ids.values()))
+    user_scores = dict(
+        Rating.objects.filter(user=user, movie_id__in=movie_ids.values()).values_list('movie_id', 'score')
+    )
+    return resolution_results(external_ids, movie_ids, stats, user_scores)
+
+
+async def aresolve_external_ids(user, external_ids, create=False):
+    external_ids = list(dict.fromkeys(external_ids))
+    movies = Movie.objects.values_list('externalId', 'id')
+    movie_ids = {external_id: movie_id async for external_id, movie_id in movies.filter(externalId__in=external_ids)}
+
+    missing = [external_id for external_id in external_ids if external_id not in movie_ids]
+    if missing and create:
+        await Movie.objects.abulk_create([Movie(externalId=external_id) for external_id in missing], ignore_conflicts=True)
+        movie_ids.update({external_id: movie_id async for external_id, movie_id in movies.filter(externalId__in=missing)})
+
+    stats = await aget_rating_stats(list(movie_ids.values()))
+    user_scores = {
+        movie_id: score async for movie_id, score
+        in Rating.objects.filter(user=user, movie_id__in=movie_ids.values()).values_list('movie_id', 'score')
+    }
+    return resolution_results(external_ids, movie_ids, stats, user_scores)
@@ -0,0 +1,93 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+
+from .models import Watchlist
+from .serializers import WatchlistSerializer
+
+PUBLIC_WATCHLISTS_VERSION_KEY = 'watchlists:public:version'
+
+# Cambio de versión pendiente del contexto actual (ver invalidate_public_watchlists)
+_pending_bump = ContextVar('pending_public_watchlists_bump', default=None)
+
+
+def version_cache():
+    """
+    Caché de la versión del listado público. La tienen que compartir todos los
+    procesos: si no, los demás siguen sirviendo sus páginas antiguas hasta el TTL.
+    Las páginas sí pueden ir a la caché local, porque su clave lleva la versión.
+    """
+    return caches[getattr(settings, 'PUBLIC_WATCHLISTS_VERSION_CACHE', 'default')]
+
+
+def public_watchlists_version():
+    versions = version_cache()
+    version = versions.get(PUBLIC_WATCHLISTS_VERSION_KEY)
+    if version is None:
+        versions.add(PUBLIC_WATCHLISTS_VERSION_KEY, 1, timeout=None)
+        version = versions.get(PUBLIC_WATCHLISTS_VERSION_KEY, 1)
+    return version
+
+
+def _bump_public_watchlists_version():
+    versions = version_cache()
+    try:
+        versions.incr(PUBLIC_WATCHLISTS_VERSION_KEY)
+    except ValueError:
+        # La clave no existía (caché nueva o desalojada): cualquier versión nueva vale
+        versions.add(PUBLIC_WATCHLISTS_VERSION_KEY, 1, timeout=None)
+        versions.incr(PUBLIC_WATCHLISTS_VERSION_KEY)
+
+
+class _PendingBump:
+    def __init__(self):
+        self.done = False
+
+    def __call__(self):
+        if not self.done:
+            self.done = True
+            _bump_public_watchlists_version()
+
+
+def invalidate_public_watchlists():
+    """
+    Cambia la versión del listado público cuando se confirme la transacción
+    (antes, otra petición podría volver a cachear los datos antiguos), y una
+    sola vez por transacción aunque cambien muchas filas: los callbacks de la
+    misma transacción comparten un _PendingBump y solo el primero cambia la
+    versión. Si la transacción se deshace, sus callbacks no llegan a ejecutarse
+    y el siguiente cambio sigue usando el mismo _PendingBump pendiente.
+    """
+    pending = _pending_bump.get()
+    if pending is None or pending.done:
+        pending = _PendingBump()
+        _pending_bump.set(pending)
+    transaction.on_commit(pending)
+
+
+def public_watchlists_page(after, page_size):
+    """
+    Página del listado de watchlists públicas ordenado por id, a partir del id
+    `after` (None = desde el principio). Devuelve {'results': [...], 'last': id
+    de la última si hay más páginas o None, 'version': versión del listado}.
+    Es igual para todos los usuarios, así que se cachea por versión, cursor y
+    tamaño de página.
+    """
+    version = public_watchlists_version()
+    key = f'watchlists:public:v{version}:{after or ""}:{page_size}'
+    page = cache.get(key)
+    if page is None:
+        rows = Watchlist.objects.public().order_by('id')
+        if after:
+            rows = rows.filter(id__gt=after)
+        # Una fila de más para saber si hay página siguiente
+        rows = list(rows[:page_size + 1])
+        page = {
+            'results': list(WatchlistSerializer(rows[:page_size], many=True).data),
+            'last': str(rows[page_size - 1].id) if len(rows) > page_size else None,
+            'version': version,
+        }
+        cache.set(key, page, timeout=getattr(settings, 'PUBLIC_WATCHLISTS_CACHE_TTL', 300))
+    return page
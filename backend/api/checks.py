@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+from .routers import replication_settings
+
+# Backends de caché que guardan los datos en cada proceso
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def replica_pin_cache_check(app_configs, **kwargs):
+    """
+    Con réplicas, la petición siguiente a una escritura puede llegar a otro
+    proceso: si la fijación al primario no está en una caché compartida, ese
+    proceso lee de la réplica y el cliente no ve lo que acaba de escribir.
+    """
+    config = replication_settings()
+    if not config['REPLICAS']:
+        return []
+    alias = config['PIN_CACHE']
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend is None or backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            f"REPLICATION['PIN_CACHE'] ({alias!r}) must be a cache shared by all processes",
+            hint='Use Redis, Memcached, the database or a file-based cache for the pins to the primary.',
+            id='api.E001',
+        )]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def public_watchlists_version_cache_check(app_configs, **kwargs):
+    """
+    Con varios procesos, un cambio solo invalida el listado público en los
+    demás si la versión (api/caching.py) está en una caché compartida.
+    """
+    alias = getattr(settings, 'PUBLIC_WATCHLISTS_VERSION_CACHE', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend is None or backend in PROCESS_LOCAL_CACHES:
+        return [Warning(
+            f'PUBLIC_WATCHLISTS_VERSION_CACHE ({alias!r}) is local to each process',
+            hint='Other processes keep serving their cached public watchlists until PUBLIC_WATCHLISTS_CACHE_TTL.',
+            id='api.W002',
+        )]
+    return []
@@ -0,0 +1,131 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def object_etag(instance):
+    """ETag de un objeto versionado (api.models.VersionedModel), sin serializarlo."""
+    return quote_etag(f'{instance._meta.model_name}-{instance.pk}-{instance.version}')
+
+
+def page_etag(request, rows, *parts):
+    """
+    ETag de una página de un listado a partir de sus filas (id y versión), sin
+    consultas aparte: una alta, cambio o baja dentro de la página cambia las
+    filas. Cuentan también la query string normalizada (cursor, page_size,
+    ?fields=...), el formato de la respuesta y el usuario. parts añade lo que
+    cambia la respuesta sin estar en las filas (p. ej. la versión de una caché).
+    """
+    query = urlencode(sorted((key, value) for key, values in request.query_params.lists() for value in values))
+    renderer = getattr(request, 'accepted_media_type', '')
+    versions = ','.join(f'{row.pk}.{row.version}' for row in rows)
+    key = '|'.join(str(part) for part in (query, renderer, request.user.id, *parts, versions))
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest()[:20])
+
+
+def etag_matches(header, etag):
+    """
+    Si el ETag está en If-None-Match / If-Match. La comparación es débil también
+    en If-Match: los ETag salen de la versión, no de los bytes, y la compresión
+    los marca como débiles (W/).
+    """
+    if header is None:
+        return False
+    etags = [tag.removeprefix('W/') for tag in parse_etags(header)]
+    return '*' in etags or etag in etags
+
+
+def with_etag(response, etag):
+    # Los navegadores guardan la respuesta y la revalidan siempre con If-None-Match
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Accept', 'Authorization'])
+    return response
+
+
+def not_modified(request, etag):
+    """Respuesta 304 si el cliente ya tiene la versión actual; None si no."""
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+    return None
+
+
+def precondition_failed(request, instance):
+    """
+    Respuesta 412 si If-Match no es la versión actual; None si coincide o no
+    hay If-Match. La versión se relee con bloqueo, así que debe llamarse en la
+    transacción de la escritura.
+    """
+    header = request.headers.get('If-Match')
+    if header is None:
+        return None
+    instance.version = type(instance).objects.select_for_update().values_list('version', flat=True).get(pk=instance.pk)
+    if etag_matches(header, object_etag(instance)):
+        return None
+    return with_etag(Response(
+        {'error': 'The resource has been modified'},
+        status=status.HTTP_412_PRECONDITION_FAILED
+    ), object_etag(instance))
+
+
+# ETag y peticiones condicionales para los ViewSet de modelos versionados:
+# GET con If-None-Match responde 304 antes de serializar y PUT/PATCH/DELETE
+# con If-Match responden 412 si el objeto ha cambiado
+class ConditionalViewMixin:
+    # La versión se lee aunque el cliente pida solo algunos campos (ver api/fieldsets.py)
+    required_fields = ('version',)
+
+    def list_etag(self, rows):
+        """ETag de la página; None con ?expand= (los objetos expandidos no llevan versión)."""
+        if self.sparse_fieldsets()[1]:
+            return None
+        return page_etag(self.request, rows)
+
+    def list(self, request, *args, **kwargs):
+        # Primero la página (la misma consulta que sin ETag) y con sus filas el
+        # ETag: el 304 se ahorra la serialización sin recorrer el listado entero
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset) if page is None else page
+        etag = self.list_etag(rows)
+        if etag:
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+        data = self.get_serializer(rows, many=True).data
+        response = Response(data) if page is None else self.get_paginated_response(data)
+        return with_etag(response, etag) if etag else response
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = object_etag(instance)
+        response = not_modified(request, etag)
+        if response is None:
+            response = with_etag(Response(self.get_serializer(instance).data), etag)
+        return response
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        with transaction.atomic():
+            instance = self.get_object()
+            failed = precondition_failed(request, instance)
+            if failed is not None:
+                return failed
+            serializer = self.get_serializer(instance, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
+        return with_etag(Response(serializer.data), object_etag(serializer.instance))
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            instance = self.get_object()
+            failed = precondition_failed(request, instance)
+            if failed is not None:
+                return failed
+            self.perform_destroy(instance)
+        return Response(status=status.HTTP_204_NO_CONTENT)
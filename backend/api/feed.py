@@ -0,0 +1,146 @@
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from .models import Activity, FeedEntry, Follow, UserFollowStats
+
+logger = logging.getLogger(__name__)
+
+# Reparto híbrido del feed: la actividad de un usuario se copia en la bandeja
+# de cada seguidor al escribirse (push), salvo en las cuentas con más de
+# FANOUT_LIMIT seguidores, cuya actividad lee cada seguidor al pedir su feed
+# (pull) y se mezcla con su bandeja. Un usuario que pasa el límite deja de
+# repartir; lo que ya repartió sigue en las bandejas y se deduplica al leer
+
+
+def feed_settings():
+    return {
+        'FANOUT_LIMIT': 1000,       # Seguidores a partir de los que no se reparte
+        'BACKFILL': 50,             # Actividades recientes que se copian al empezar a seguir
+        'MAX_BULK_ACTIVITIES': 10,  # Actividades por alta en bloque en una watchlist
+        **getattr(settings, 'FEED', {}),
+    }
+
+
+def _followers(user_id):
+    stats = UserFollowStats.objects.filter(user_id=user_id).values_list('followers', flat=True).first()
+    return stats or 0
+
+
+def publish(actor_id, verb, movie_id, **targets):
+    """
+    Registra una actividad y la reparte a las bandejas de los seguidores si el
+    usuario no tiene demasiados. targets es el rating, comment o watchlistMovie
+    al que apunta.
+    """
+    with transaction.atomic():
+        activity = Activity.objects.create(actor_id=actor_id, verb=verb, movie_id=movie_id, **targets)
+        _push([activity])
+    return activity
+
+
+def publish_many(activities):
+    """Registra y reparte varias actividades (sin señales, para las altas en bloque)."""
+    if not activities:
+        return []
+    with transaction.atomic():
+        activities = Activity.objects.bulk_create(activities)
+        for actor_id in {activity.actor_id for activity in activities}:
+            _push([activity for activity in activities if activity.actor_id == actor_id])
+    return activities
+
+
+def _push(activities):
+    actor_id = activities[0].actor_id
+    if _followers(actor_id) > feed_settings()['FANOUT_LIMIT']:
+        return
+    follower_ids = list(Follow.objects.filter(followee_id=actor_id).values_list('follower_id', flat=True))
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=follower_id, activity_id=activity.id)
+         for follower_id in follower_ids for activity in activities],
+        batch_size=500
+    )
+
+
+def _change_counts(follower_id, followee_id, delta):
+    for user_id, field in ((followee_id, 'followers'), (follower_id, 'following')):
+        stats = UserFollowStats.objects.filter(user_id=user_id)
+        if not stats.update(**{field: F(field) + delta}) and delta > 0:
+            UserFollowStats.objects.bulk_create([UserFollowStats(user_id=user_id)], ignore_conflicts=True)
+            stats.update(**{field: F(field) + delta})
+
+
+def follow(follower_id, followee_id):
+    """Empieza a seguir a un usuario; devuelve False si ya lo seguía."""
+    try:
+        with transaction.atomic():
+            Follow.objects.create(follower_id=follower_id, followee_id=followee_id)
+            _change_counts(follower_id, followee_id, 1)
+            # La actividad reciente de las cuentas que reparten se copia para no empezar con el feed vacío
+            config = feed_settings()
+            if _followers(followee_id) <= config['FANOUT_LIMIT']:
+                recent = (
+                    Activity.objects.filter(actor_id=followee_id).order_by('-id')
+                    .values_list('id', flat=True)[:config['BACKFILL']]
+                )
+                FeedEntry.objects.bulk_create(
+                    [FeedEntry(user_id=follower_id, activity_id=activity_id) for activity_id in recent],
+                    ignore_conflicts=True
+                )
+    except IntegrityError:
+        return False
+    logger.info('follow.created', extra={'user_id': follower_id, 'followee_id': followee_id})
+    return True
+
+
+def unfollow(follower_id, followee_id):
+    """Deja de seguir a un usuario y quita su actividad de la bandeja; devuelve False si no lo seguía."""
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(follower_id=follower_id, followee_id=followee_id).delete()
+        if not deleted:
+            return False
+        _change_counts(follower_id, followee_id, -1)
+        FeedEntry.objects.filter(user_id=follower_id, activity__actor_id=followee_id).delete()
+    logger.info('follow.deleted', extra={'user_id': follower_id, 'followee_id': followee_id})
+    return True
+
+
+def _visible(prefix=''):
+    """Las actividades de watchlists que han dejado de ser públicas no se muestran."""
+    return (Q(**{f'{prefix}watchlistMovie__isnull': True})
+            | Q(**{f'{prefix}watchlistMovie__watchlist__isPublic': True}))
+
+
+def feed_page(user_id, before=None, limit=20, queryset=None):
+    """
+    Actividades del feed de un usuario, de la más reciente a la más antigua,
+    anteriores al id before. Devuelve (actividades, before de la página
+    siguiente o None si no hay más). Son consultas por índice: la bandeja,
+    las cuentas que no reparten y su actividad reciente. queryset permite
+    cargar solo parte de las actividades (por defecto, todo con sus objetos).
+    Las actividades ocultas se descartan antes del límite: si no, una página
+    podría salir corta (o vacía) aunque hubiera más actividades visibles.
+    """
+    inbox = FeedEntry.objects.filter(user_id=user_id).filter(_visible('activity__'))
+    if before is not None:
+        inbox = inbox.filter(activity_id__lt=before)
+    ids = set(inbox.order_by('-activity_id').values_list('activity_id', flat=True)[:limit + 1])
+
+    pulled = list(
+        Follow.objects.filter(
+            follower_id=user_id, followee__follow_stats__followers__gt=feed_settings()['FANOUT_LIMIT']
+        ).values_list('followee_id', flat=True)
+    )
+    if pulled:
+        recent = Activity.objects.filter(actor_id__in=pulled).filter(_visible())
+        if before is not None:
+            recent = recent.filter(id__lt=before)
+        ids.update(recent.order_by('-id').values_list('id', flat=True)[:limit + 1])
+
+    ids = sorted(ids, reverse=True)
+    if queryset is None:
+        queryset = Activity.objects.select_related('actor', 'movie', 'rating', 'comment', 'watchlistMovie__watchlist')
+    activities = queryset.filter(id__in=ids[:limit]).order_by('-id')
+    return list(activities), (ids[limit - 1] if len(ids) > limit else None)
@@ -0,0 +1,149 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import BaseSerializer
+
+
+def _names(value):
+    return [name for name in (part.strip() for part in value.split(',')) if name]
+
+
+def parse_fieldsets(params):
+    """(fields, expand) de ?fields= y ?expand=; fields es None si no se limita."""
+    fields = _names(params['fields']) if 'fields' in params else None
+    return fields, _names(params.get('expand', ''))
+
+
+def shape_queryset(queryset, serializer, required=()):
+    """
+    Acota queryset a lo que lee serializer (con select_related y only()).
+    required son los campos que se leen además de los del serializador.
+    """
+    only, related = serializer.model_paths()
+    if related:
+        queryset = queryset.select_related(*related)
+    if only is not None:
+        queryset = queryset.only(*only, *required)
+    return queryset
+
+
+def _model_path(model, source):
+    """
+    Ruta de only() de un source de DRF (a.b -> a__b) y relaciones que hay
+    que traer con select_related; None si no son campos del modelo.
+    """
+    attrs = source.split('.')
+    names, related = [], []
+    for index, attr in enumerate(attrs):
+        if model is None:
+            return None
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete and not field.is_relation:
+            return None
+        if field.is_relation and not (field.many_to_one or field.one_to_one):
+            return None
+        names.append(field.name)
+        if index < len(attrs) - 1:
+            related.append('__'.join(names))
+        model = field.related_model
+    return '__'.join(names), related
+
+
+# Campos a la carta para los serializadores de modelos:
+# - fields=[...] deja solo esos campos en la respuesta
+# - expand=[...] añade los objetos relacionados de Meta.expandable_fields,
+#   {nombre: (serializador, source)}
+# Meta.field_sources da las rutas del modelo de los campos que DRF no puede
+# describir (SerializerMethodField, source='*'). model_paths() traduce los
+# campos que quedan a only()/select_related
+class SparseFieldsetsMixin:
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        expand = list(expand or [])
+        unknown = [name for name in expand if name not in expandable]
+        if unknown:
+            raise ParseError({'error': f"Unknown expand: {', '.join(unknown)}"})
+        for name in expand:
+            serializer_class, source = expandable[name]
+            options = {'source': source} if source != name else {}
+            self.fields[name] = serializer_class(read_only=True, **options)
+
+        if fields is not None:
+            # Los de solo escritura no salen en la respuesta: pedirlos es un error
+            unknown = [name for name in fields if name not in self.fields or self.fields[name].write_only]
+            if unknown:
+                raise ParseError({'error': f"Unknown fields: {', '.join(unknown)}"})
+            for name in list(self.fields):
+                if name not in fields and name not in expand:
+                    self.fields.pop(name)
+
+    def model_paths(self):
+        """
+        (only, select_related) que necesitan los campos de lectura. only es
+        None si alguno no se puede acotar a campos del modelo (se carga todo).
+        """
+        model = self.Meta.model
+        sources = getattr(self.Meta, 'field_sources', {})
+        only, related = set(), set()
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, BaseSerializer):
+                # Objeto expandido: su propia forma bajo el prefijo de la relación
+                path = _model_path(model, field.source) if hasattr(field, 'model_paths') else None
+                if path is None:
+                    return None, related
+                prefix, parents = path
+                nested_only, nested_related = field.model_paths()
+                related.update(parents, [prefix], (f'{prefix}__{item}' for item in nested_related))
+                only.update([f'{prefix}__{item}' for item in nested_only] if nested_only is not None else [prefix])
+                continue
+            paths = sources.get(name)
+            if paths is None:
+                if field.source == '*':
+                    return None, related
+                paths = [field.source]
+            for source in paths:
+                path = _model_path(model, source.replace('__', '.'))
+                if path is None:
+                    return None, related
+                only.add(path[0])
+                related.update(path[1])
+        return only, related
+
+
+# Para las vistas de los serializadores con SparseFieldsetsMixin: en las
+# lecturas pasa ?fields= y ?expand= al serializador y acota el queryset a lo
+# que este va a leer. Las escrituras usan siempre el objeto y la forma
+# completos. required_fields son los campos que la vista lee además de los
+# del serializador (p. ej. la versión para el ETag)
+class SparseFieldsetsViewMixin:
+    required_fields = ()
+
+    def sparse_fieldsets(self):
+        """(fields, expand) de la petición; fields es None si no se limita."""
+        return parse_fieldsets(self.request.query_params)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        if self.request.method in SAFE_METHODS and issubclass(serializer_class, SparseFieldsetsMixin):
+            fields, expand = self.sparse_fieldsets()
+            kwargs.setdefault('fields', fields)
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def shape_queryset(self, queryset):
+        if self.request.method not in SAFE_METHODS or not issubclass(self.get_serializer_class(), SparseFieldsetsMixin):
+            return queryset
+        ordering = getattr(self.paginator, 'ordering', None) or ()
+        if isinstance(ordering, str):
+            ordering = [ordering]
+        required = [*self.required_fields, *(item.lstrip('-') for item in ordering)]
+        return shape_queryset(queryset, self.get_serializer(), required)
+
+    def filter_queryset(self, queryset):
+        return self.shape_queryset(super().filter_queryset(queryset))
@@ -0,0 +1,34 @@
+import os
+import threading
+import time
+import uuid
+
+# UUID versión 7 (RFC 9562): 48 bits con los milisegundos Unix, un contador
+# de 12 bits dentro del mismo milisegundo y 62 bits aleatorios. Los ids
+# nuevos son crecientes, así que se insertan al final de los índices en vez
+# de repartirse por todo el B-tree, y ordenar por id es ordenar por creación.
+# Los ids UUID4 que ya existen siguen siendo válidos (misma columna)
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7():
+    """UUID7 creciente dentro del proceso, aunque se generen varios en el mismo milisegundo."""
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            # Se empieza por la mitad baja para dejar sitio al contador
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                # Contador agotado (o reloj hacia atrás): se toma el milisegundo siguiente
+                _last_ms += 1
+                _counter = 0
+        ms, counter = _last_ms, _counter
+    random_bits = int.from_bytes(os.urandom(8), 'big') & 0x3FFF_FFFF_FFFF_FFFF
+    return uuid.UUID(int=(ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | random_bits)
@@ -0,0 +1,177 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Comment, LeaderboardEntry, MovieActivity, Rating, WatchlistMovie
+
+# Ventanas en días (None = desde siempre). Los días fuera de la más larga se pliegan en el histórico
+WINDOWS = {'all': None, '7d': 7, '30d': 30}
+RETENTION_DAYS = max(days for days in WINDOWS.values() if days)
+COUNTERS = ('ratings', 'ratingTotal', 'listings', 'comments')
+
+
+def leaderboard_settings():
+    return {
+        'SIZE': 1000,           # Puestos que se guardan por leaderboard y ventana
+        'PRIOR_VOTES': 10,      # Peso de la media global en la media bayesiana
+        **getattr(settings, 'LEADERBOARDS', {}),
+    }
+
+
+def _bucket(day):
+    """Día del contador; None (histórico) si ya no entra en ninguna ventana."""
+    return day if day > timezone.localdate() - timedelta(days=RETENTION_DAYS) else None
+
+
+def record_activity(movie_id, created_at, **deltas):
+    """
+    Suma los deltas (ratings, ratingTotal, listings, comments) a los contadores
+    de la película en el día de created_at, la fecha del rating, comentario o
+    relación afectado, para que los borrados descuenten del mismo día.
+    Debe llamarse dentro de la misma transacción que la escritura.
+    """
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not changes:
+        return
+    day = _bucket(timezone.localdate(created_at))
+    rows = MovieActivity.objects.filter(movie_id=movie_id, day=day)
+    # Sin fila no hay nada que descontar (y la película puede estar borrándose en cascada)
+    if rows.update(**changes) or any(delta < 0 for delta in deltas.values()):
+        return
+    MovieActivity.objects.bulk_create([MovieActivity(movie_id=movie_id, day=day)], ignore_conflicts=True)
+    rows.update(**changes)
+
+
+def record_listings(movie_ids, created_at):
+    """Una relación más para cada película, con sentencias fijas (para las altas en bloque)."""
+    if not movie_ids:
+        return
+    day = _bucket(timezone.localdate(created_at))
+    MovieActivity.objects.bulk_create(
+        [MovieActivity(movie_id=movie_id, day=day) for movie_id in movie_ids],
+        ignore_conflicts=True
+    )
+    MovieActivity.objects.filter(movie_id__in=movie_ids, day=day).update(listings=F('listings') + 1)
+
+
+def remove_listings(rows):
+    """
+    Una relación menos por cada (movie_id, addedAt) de rows, para los borrados
+    en bloque y en cascada: una sentencia por día y número de relaciones
+    borradas en lugar de una por relación.
+    """
+    removed = Counter((movie_id, _bucket(timezone.localdate(added_at))) for movie_id, added_at in rows)
+    groups = defaultdict(list)
+    for (movie_id, day), count in removed.items():
+        groups[day, count].append(movie_id)
+    for (day, count), movie_ids in groups.items():
+        MovieActivity.objects.filter(movie_id__in=movie_ids, day=day).update(listings=F('listings') - count)
+
+
+def fold_history():
+    """Pliega en el histórico de cada película los días que ya no entran en ninguna ventana."""
+    cutoff = timezone.localdate() - timedelta(days=RETENTION_DAYS)
+    old = MovieActivity.objects.filter(day__lte=cutoff)
+    movie_ids = list(old.order_by().values_list('movie_id', flat=True).distinct())
+    if not movie_ids:
+        return 0
+
+    MovieActivity.objects.bulk_create(
+        [MovieActivity(movie_id=movie_id, day=None) for movie_id in movie_ids],
+        ignore_conflicts=True
+    )
+    folded = old.filter(movie_id=OuterRef('movie_id')).order_by().values('movie_id')
+    MovieActivity.objects.filter(movie_id__in=movie_ids, day__isnull=True).update(**{
+        field: F(field) + Coalesce(Subquery(folded.annotate(total=Sum(field)).values('total')), 0)
+        for field in COUNTERS
+    })
+    old.delete()
+    return len(movie_ids)
+
+
+def purge_empty():
+    """Borra los días que se han quedado a cero tras descontar borrados."""
+    return MovieActivity.objects.filter(day__isnull=False, **dict.fromkeys(COUNTERS, 0)).delete()[0]
+
+
+def _ranked(kind, days, size, prior_votes):
+    """(movie_id, score, count) de los primeros puestos de un leaderboard."""
+    rows = MovieActivity.objects.order_by()
+    if days:
+        rows = rows.filter(day__gt=timezone.localdate() - timedelta(days=days))
+    totals = rows.values('movie_id').annotate(**{f'sum_{field}': Sum(field) for field in COUNTERS})
+
+    if kind == 'top-rated':
+        # Media bayesiana: (total + m·C) / (votos + m), con C la media global de la ventana
+        overall = rows.aggregate(votes=Sum('ratings'), points=Sum('ratingTotal'))
+        if not overall['votes']:
+            return []
+        prior = prior_votes * overall['points'] / overall['votes']
+        rows = totals.filter(sum_ratings__gt=0).annotate(score=ExpressionWrapper(
+            (Cast('sum_ratingTotal', FloatField()) + Value(prior)) / (F('sum_ratings') + Value(prior_votes)),
+            output_field=FloatField(),
+        ))
+        rows = rows.order_by('-score', '-sum_ratings', 'movie_id')
+        return [(row['movie_id'], row['score'], row['sum_ratings']) for row in rows[:size]]
+
+    field = 'sum_listings' if kind == 'most-listed' else 'sum_comments'
+    rows = totals.filter(**{f'{field}__gt': 0}).order_by(f'-{field}', 'movie_id')
+    return [(row['movie_id'], float(row[field]), row[field]) for row in rows[:size]]
+
+
+def compact_leaderboards():
+    """
+    Pliega el histórico y recalcula todos los leaderboards a partir de los
+    contadores diarios. Cada leaderboard se sustituye en una transacción, así
+    que las lecturas ven siempre una versión completa.
+    """
+    config = leaderboard_settings()
+    now = timezone.now()
+    with transaction.atomic():
+        fold_history()
+        purge_empty()
+
+    written = 0
+    for kind, _ in LeaderboardEntry.KIND_CHOICES:
+        for window, days in WINDOWS.items():
+            ranked = _ranked(kind, days, config['SIZE'], config['PRIOR_VOTES'])
+            with transaction.atomic():
+                LeaderboardEntry.objects.filter(kind=kind, window=window).delete()
+                LeaderboardEntry.objects.bulk_create([
+                    LeaderboardEntry(kind=kind, window=window, rank=rank, movie_id=movie_id,
+                                     score=score, count=count, computedAt=now)
+                    for rank, (movie_id, score, count) in enumerate(ranked, start=1)
+                ], batch_size=500)
+            written += len(ranked)
+    return written
+
+
+def rebuild_activity(batch_size=1000):
+    """Recalcula los contadores diarios desde ratings, comentarios y watchlists. Devuelve el número de filas."""
+    counters = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    def collect(queryset, date_field, **aggregates):
+        rows = (
+            queryset.order_by().annotate(day=TruncDate(date_field))
+            .values('movie_id', 'day').annotate(**aggregates)
+        )
+        for row in rows.iterator(chunk_size=batch_size):
+            bucket = counters[(row['movie_id'], _bucket(row['day']))]
+            for field in aggregates:
+                bucket[field] += row[field]
+
+    collect(Rating.objects.all(), 'createdAt', ratings=Count('id'), ratingTotal=Sum('score'))
+    collect(Comment.objects.all(), 'createdAt', comments=Count('id'))
+    collect(WatchlistMovie.objects.all(), 'addedAt', listings=Count('id'))
+
+    MovieActivity.objects.all().delete()
+    MovieActivity.objects.bulk_create(
+        [MovieActivity(movie_id=movie_id, day=day, **values) for (movie_id, day), values in counters.items()],
+        batch_size=batch_size
+    )
+    return len(counters)
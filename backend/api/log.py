@@ -0,0 +1,69 @@
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+# Id de la petición en curso, para correlacionar todas sus líneas de log
+request_id_var = ContextVar('request_id', default=None)
+
+# Atributos estándar de LogRecord: lo demás viene de extra={...}
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def get_request_id():
+    return request_id_var.get()
+
+
+# Añade request_id a cada registro (lo fija RequestIdMiddleware)
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+# Limita los eventos por fila (p. ej. uno por objeto serializado) a `rate`
+# por segundo con ráfagas de hasta `burst`, con un cubo de tokens por mensaje.
+# Los descartados se cuentan y se informan en el siguiente registro que pasa
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate=5, burst=20, name=''):
+        super().__init__(name)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, dropped = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, dropped + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        if dropped:
+            record.sampled_out = dropped
+        return True
+
+
+# Una línea JSON por registro con los campos de extra={...} al mismo nivel
+class StructuredFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
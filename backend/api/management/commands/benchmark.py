@@ -0,0 +1,54 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from api.benchmark import SIZES, run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Mide los endpoints principales con datos sintéticos sobre una base de datos de pruebas y emite JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='small', help=f"Tamaños separados por comas: {', '.join(SIZES)}")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--concurrency', type=int, default=0,
+                            help='Compara WSGI con ASGI con estas peticiones a la vez (0 para no hacerlo)')
+        parser.add_argument('--upstream-latency', type=float, default=50,
+                            help='Retraso en ms del TMDB falso de la comparación WSGI/ASGI')
+        parser.add_argument('--sqlite-threads', type=int, default=0,
+                            help='Compara los perfiles de SQLite con N lectores y N escritores a la vez (0 para no hacerlo)')
+        parser.add_argument('--inserts', type=int, default=0,
+                            help='Compara las inserciones con ids UUID4 y UUID7 con N filas (0 para no hacerlo)')
+        parser.add_argument('--output', help='Fichero donde guardar el JSON (por defecto, la salida estándar)')
+
+    def handle(self, *args, **options):
+        sizes = [size.strip() for size in options['sizes'].split(',') if size.strip()]
+        unknown = [size for size in sizes if size not in SIZES]
+        if unknown:
+            raise CommandError(f"Tamaños desconocidos: {', '.join(unknown)}")
+
+        # Nunca sobre la base de datos real: se crea una de pruebas y se destruye al final.
+        # Los logs INFO por petición se silencian para no medir la escritura en consola
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        logging.disable(logging.INFO)
+        try:
+            report = run_benchmark(
+                sizes, repeat=options['repeat'], seed=options['seed'], log=self.stderr.write,
+                concurrency=options['concurrency'], upstream_latency=options['upstream_latency'] / 1000,
+                sqlite_threads=options['sqlite_threads'], inserts=options['inserts']
+            )
+        finally:
+            logging.disable(logging.NOTSET)
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Resultados guardados en {options['output']}"))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.leaderboards import compact_leaderboards, rebuild_activity
+
+
+class Command(BaseCommand):
+    help = 'Pliega los contadores antiguos y recalcula los leaderboards (ejecutar periódicamente, p. ej. desde cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recalcula antes los contadores diarios desde ratings, comentarios y watchlists')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            with transaction.atomic():
+                rows = rebuild_activity(batch_size=options['batch_size'])
+            self.stdout.write(f'Contadores recalculados: {rows} filas')
+        written = compact_leaderboards()
+        self.stdout.write(self.style.SUCCESS(f'Leaderboards recalculados: {written} puestos'))
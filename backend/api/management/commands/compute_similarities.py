@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.similarity import TooManyRatings, compute_similarities
+
+
+class Command(BaseCommand):
+    help = ('Recalcula las películas similares de las películas con ratings nuevos '
+            '(ejecutar periódicamente, p. ej. desde cron, y con --full de vez en cuando). '
+            'Carga todos los ratings en memoria, unos 100 bytes por rating más '
+            'SIMILARITY["MEMORY_MB"], y se detiene si hay más de SIMILARITY["MAX_RATINGS"]')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recalcula todas las películas')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Ratings leídos por consulta al cargar la matriz')
+
+    def handle(self, *args, **options):
+        try:
+            count = compute_similarities(full=options['full'], batch_size=options['batch_size'], log=self.stdout.write)
+        except TooManyRatings as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'Similitudes recalculadas: {count} películas'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.db.models.functions import Length
+from api.models import WatchlistMovie
+from api.ranking import REBALANCE_LENGTH, rebalance_watchlist
+
+
+class Command(BaseCommand):
+    help = 'Reparte las posiciones de las watchlists que tienen posiciones demasiado largas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-length', type=int, default=REBALANCE_LENGTH,
+                            help='Reparte las watchlists con alguna posición más larga que esto')
+
+    def handle(self, *args, **options):
+        watchlist_ids = (
+            WatchlistMovie.objects.order_by().values('watchlist_id')
+            .annotate(longest=Max(Length('position')))
+            .filter(longest__gt=options['min_length'])
+            .values_list('watchlist_id', flat=True)
+        )
+        count = 0
+        for watchlist_id in list(watchlist_ids):
+            rebalance_watchlist(watchlist_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'{count} watchlists repartidas'))
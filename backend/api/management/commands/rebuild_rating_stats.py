@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.stats import rebuild_rating_stats
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero las estadísticas de puntuación (MovieRatingStats) a partir de los ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = rebuild_rating_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Estadísticas recalculadas para {created} películas'))
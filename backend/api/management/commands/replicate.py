@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from api.routers import beat, replication_settings
+
+
+class Command(BaseCommand):
+    help = (
+        'Actualiza el latido de replicación en el primario y copia el primario en las réplicas SQLite '
+        '(en PostgreSQL las réplicas se replican solas: solo hace falta el latido). Debe ejecutarse con '
+        "--interval menor que REPLICATION['MAX_LAG']: una réplica con un latido más viejo no se usa"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Repite cada N segundos en lugar de ejecutarse una sola vez')
+
+    def handle(self, *args, **options):
+        while True:
+            beat()
+            copied = [alias for alias in replication_settings()['REPLICAS'] if self.copy_sqlite(alias)]
+            if copied:
+                self.stdout.write(f"Réplicas copiadas: {', '.join(copied)}")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS('Latido actualizado'))
+
+    def copy_sqlite(self, alias):
+        """Copia el primario en la réplica con la API de backup de SQLite; False si no son SQLite."""
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            return False
+        primary.ensure_connection()
+        # La copia se escribe sobre el fichero: las conexiones abiertas a la réplica ven el resultado
+        replica.close()
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        return True
@@ -0,0 +1,48 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.seeding import SEED_PASSWORD, seed_dataset
+
+
+class Command(BaseCommand):
+    help = 'Genera un conjunto de datos sintético (usuarios, películas, ratings, comentarios y watchlists)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--movies', type=int, default=5000)
+        parser.add_argument('--ratings-per-user', type=int, default=20)
+        parser.add_argument('--comments-per-user', type=int, default=5)
+        parser.add_argument('--watchlists-per-user', type=int, default=2)
+        parser.add_argument('--max-watchlist-size', type=int, default=500)
+        parser.add_argument('--zipf', type=float, default=1.1, help='Exponente de la popularidad de las películas')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed', help='Prefijo de los nombres de usuario generados')
+        parser.add_argument('--first-external-id', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--replace', action='store_true',
+                            help='Borra antes los usuarios con el mismo prefijo (y sus datos)')
+
+    def handle(self, *args, **options):
+        existing = User.objects.filter(username__startswith=f"{options['prefix']}_user_")
+        if existing.exists():
+            if not options['replace']:
+                raise CommandError(f"Ya hay usuarios con el prefijo '{options['prefix']}'. Usa --replace o --prefix")
+            existing.delete()
+
+        with transaction.atomic():
+            counts = seed_dataset(
+                users=options['users'],
+                movies=options['movies'],
+                ratings_per_user=options['ratings_per_user'],
+                comments_per_user=options['comments_per_user'],
+                watchlists_per_user=options['watchlists_per_user'],
+                max_watchlist_size=options['max_watchlist_size'],
+                zipf_s=options['zipf'],
+                seed=options['seed'],
+                prefix=options['prefix'],
+                first_external_id=options['first_external_id'],
+                batch_size=options['batch_size'],
+                log=self.stdout.write,
+            )
+        summary = ', '.join(f'{count} {table}' for table, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Datos generados: {summary} (contraseña: {SEED_PASSWORD})'))
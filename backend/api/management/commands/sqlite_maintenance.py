@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from api.sqlite import checkpoint, optimize, vacuum
+
+
+class Command(BaseCommand):
+    help = 'Checkpoint del WAL (TRUNCATE) y PRAGMA optimize de SQLite (ejecutar periódicamente, p. ej. desde cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='Hace además VACUUM (bloquea la base de datos mientras dura)')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Repite cada N segundos en lugar de ejecutarse una sola vez')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"{options['database']} no es una base de datos SQLite")
+
+        while True:
+            if options['vacuum']:
+                vacuum(connection)
+                self.stdout.write('VACUUM completado')
+            result = checkpoint(connection, 'TRUNCATE')
+            if result is not None:
+                busy, wal_pages, checkpointed = result
+                self.stdout.write(f'Checkpoint: {checkpointed}/{wal_pages} páginas{" (ocupado)" if busy else ""}')
+            optimize(connection)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS('Mantenimiento completado'))
@@ -0,0 +1,128 @@
+import threading
+from bisect import bisect_left
+
+from .authentication import token_cache
+from .routers import replica_health
+
+# Límites fijos de los histogramas (el +Inf se añade al exportar)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+# Nombre, ayuda y buckets de cada histograma por ruta y método
+HISTOGRAMS = (
+    ('api_request_duration_seconds', 'Wall time spent handling the request.', DURATION_BUCKETS),
+    ('api_request_sql_queries', 'SQL queries executed by the request.', QUERY_BUCKETS),
+    ('api_request_sql_duration_seconds', 'Time spent in SQL queries by the request.', DURATION_BUCKETS),
+    ('api_response_size_bytes', 'Size of the response body.', SIZE_BUCKETS),
+)
+
+
+# Métricas en memoria del proceso. Todas las escrituras y la exportación
+# pasan por el mismo lock, así que una lectura nunca ve una petición a medias
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}   # (route, method) -> [Histogram, ...] en el orden de HISTOGRAMS
+        self._responses = {}    # (route, method, status) -> int
+
+    def observe(self, route, method, status, duration, queries, sql_duration, size):
+        values = (duration, queries, sql_duration, size)
+        with self._lock:
+            histograms = self._histograms.get((route, method))
+            if histograms is None:
+                histograms = self._histograms[(route, method)] = [Histogram(b) for _, _, b in HISTOGRAMS]
+            for histogram, value in zip(histograms, values):
+                histogram.observe(value)
+            key = (route, method, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._responses.clear()
+
+    def render(self):
+        """Exporta las métricas en el formato de texto de Prometheus (0.0.4)."""
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP api_requests_total Responses by route, method and status.',
+                '# TYPE api_requests_total counter',
+            ]
+            for (route, method, status), count in sorted(self._responses.items()):
+                lines.append(f'api_requests_total{_labels(route=route, method=method, status=status)} {count}')
+
+            for index, (name, help_text, _) in enumerate(HISTOGRAMS):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (route, method), histograms in sorted(self._histograms.items()):
+                    histogram = histograms[index]
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{_labels(route=route, method=method, le=bound)} {count}')
+                    labels = _labels(route=route, method=method)
+                    lines.append(f'{name}_sum{labels} {_number(histogram.sum)}')
+                    lines.append(f'{name}_count{labels} {histogram.count}')
+
+        cache = token_cache.stats()
+        lines += [
+            '# HELP api_token_cache_entries Tokens currently cached.',
+            '# TYPE api_token_cache_entries gauge',
+            f'api_token_cache_entries {cache["size"]}',
+        ]
+        for key in ('hits', 'misses', 'evictions'):
+            lines += [
+                f'# HELP api_token_cache_{key}_total Token cache {key}.',
+                f'# TYPE api_token_cache_{key}_total counter',
+                f'api_token_cache_{key}_total {cache[key]}',
+            ]
+
+        replicas = replica_health.status()
+        if replicas:
+            lines += [
+                '# HELP api_replica_healthy Whether reads are sent to the replica (last health check).',
+                '# TYPE api_replica_healthy gauge',
+            ]
+            lines += [f'api_replica_healthy{_labels(alias=alias)} {int(status["healthy"])}'
+                      for alias, status in sorted(replicas.items())]
+            lines += [
+                '# HELP api_replica_lag_seconds Replication lag measured by the heartbeat.',
+                '# TYPE api_replica_lag_seconds gauge',
+            ]
+            lines += [f'api_replica_lag_seconds{_labels(alias=alias)} {_number(status["lag"])}'
+                      for alias, status in sorted(replicas.items()) if status['lag'] is not None]
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(**labels):
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,317 @@
+import re
+import time
+import uuid
+import zlib
+from contextlib import ExitStack
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+from .log import request_id_var
+from .metrics import registry
+from .routers import RoutingState, is_pinned, pin, replication_settings, routing_state
+
+# brotli es opcional: sin él las respuestas se comprimen con gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Solo se acepta un X-Request-ID entrante si tiene un formato razonable
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+# Base de los middleware que funcionan igual con WSGI y con ASGI: con ASGI
+# Django los llama como corrutinas (__acall__) y las vistas async no se
+# pasan a un hilo. Un solo middleware síncrono en la cadena haría que todas
+# las peticiones volvieran a esperar su turno en un hilo
+class HybridMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+# Asigna un id a cada petición (o reutiliza el X-Request-ID del proxy),
+# lo deja disponible para los logs y lo devuelve en la respuesta
+class RequestIdMiddleware(HybridMiddleware):
+    def start(self, request):
+        incoming = request.headers.get('X-Request-ID', '')
+        request.request_id = incoming if _REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+        return request_id_var.set(request.request_id)
+
+    def handle(self, request):
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id_var.reset(token)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_id_var.reset(token)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+
+# Contador de la petición en curso. Con ASGI las consultas se ejecutan en el
+# hilo del ORM, no en el de la petición, así que track() no las vería; el
+# contexto sí viaja con ellas, y count_query (instalado en cada conexión
+# desde api/signals.py) las suma al contador activo
+active_counter = ContextVar('active_query_counter', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    counter = active_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+# Cuenta las consultas SQL y su duración mientras está activo en todas las conexiones
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+    def track(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+# Registra por ruta y método la duración, las consultas SQL, el tamaño y el
+# estado de cada respuesta (exportado en /api/metrics).
+# Las respuestas en streaming se miden al terminar de enviarse
+class MetricsMiddleware(HybridMiddleware):
+    def handle(self, request):
+        start = time.perf_counter()
+        counter = QueryCounter()
+        with counter.track():
+            response = self.get_response(request)
+        return self._finish(request, response, start, counter)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        counter = QueryCounter()
+        token = active_counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            active_counter.reset(token)
+        return self._finish(request, response, start, counter)
+
+    def _finish(self, request, response, start, counter):
+        if response.streaming:
+            measure = self._ameasure_stream if response.is_async else self._measure_stream
+            response.streaming_content = measure(request, response, response.streaming_content, start, counter)
+        else:
+            self._record(request, response, start, counter, len(response.content))
+        return response
+
+    def _measure_stream(self, request, response, content, start, counter):
+        size = 0
+        try:
+            with counter.track():
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self._record(request, response, start, counter, size)
+
+    async def _ameasure_stream(self, request, response, content, start, counter):
+        size = 0
+        token = active_counter.set(counter)
+        try:
+            async for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            active_counter.reset(token)
+            self._record(request, response, start, counter, size)
+
+    def _record(self, request, response, start, counter, size):
+        match = getattr(request, 'resolver_match', None)
+        registry.observe(
+            route=match.view_name if match else 'unmatched',
+            method=request.method,
+            status=response.status_code,
+            duration=time.perf_counter() - start,
+            queries=counter.count,
+            sql_duration=counter.duration,
+            size=size,
+        )
+
+
+def compression_settings():
+    return {
+        'MIN_SIZE': 1024,       # Bytes a partir de los que se comprime una respuesta
+        'GZIP_LEVEL': 6,
+        'BROTLI_QUALITY': 4,    # De 0 a 11; las más altas son demasiado lentas para respuestas dinámicas
+        **getattr(settings, 'COMPRESSION', {}),
+    }
+
+
+def choose_encoding(accept_encoding):
+    """brotli (si está instalado) o gzip según el Accept-Encoding; None si no acepta ninguna."""
+    accepted = set()
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.partition(';')
+        match = re.search(r'q=([0-9.]+)', params)
+        try:
+            if match and float(match.group(1)) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def _compressor(encoding, config):
+    """(compress, finish) de un compresor incremental de la codificación."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=config['BROTLI_QUALITY'])
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(config['GZIP_LEVEL'], zlib.DEFLATED, 31)  # 31: cabecera gzip
+    return compressor.compress, compressor.flush
+
+
+# Comprime las respuestas de más de MIN_SIZE bytes con brotli o gzip según
+# el Accept-Encoding. Las respuestas en streaming se comprimen a medida que
+# se envían, sin vaciar el compresor en cada fragmento (perdería casi toda la
+# compresión con fragmentos de una fila). Como GZipMiddleware, marca el ETag
+# como débil: el contenido es el mismo pero los bytes no
+class CompressionMiddleware(HybridMiddleware):
+    def handle(self, request):
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        config = compression_settings()
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.streaming and len(response.content) < config['MIN_SIZE']:
+            return response
+
+        patch_vary_headers(response, ['Accept-Encoding'])
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        compress, finish = _compressor(encoding, config)
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._compress_async(response.streaming_content, compress, finish)
+            else:
+                response.streaming_content = self._compress_stream(response.streaming_content, compress, finish)
+            del response['Content-Length']
+        else:
+            content = compress(response.content) + finish()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def _compress_stream(self, content, compress, finish):
+        for chunk in content:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+
+    async def _compress_async(self, content, compress, finish):
+        async for chunk in content:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+
+
+# Decide por petición dónde se leen las consultas (ver api/routers.py): las
+# lecturas GET de un cliente que no ha escrito hace poco van a las réplicas;
+# las escrituras fijan al cliente al primario durante PIN_SECONDS. Las
+# respuestas en streaming conservan la decisión mientras se envían
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    def start(self, request):
+        pinned = request.method not in SAFE_METHODS or is_pinned(request)
+        state = RoutingState(pinned=pinned)
+        return state, routing_state.set(state)
+
+    def handle(self, request):
+        if not replication_settings()['REPLICAS']:
+            return self.get_response(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        return self._finish(request, response, state)
+
+    async def __acall__(self, request):
+        if not replication_settings()['REPLICAS']:
+            return await self.get_response(request)
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        return self._finish(request, response, state)
+
+    def _finish(self, request, response, state):
+        if state.wrote:
+            pin(request)
+        if response.streaming:
+            route = self._aroute_stream if response.is_async else self._route_stream
+            response.streaming_content = route(response.streaming_content, state)
+        return response
+
+    def _route_stream(self, content, state):
+        token = routing_state.set(state)
+        try:
+            yield from content
+        finally:
+            routing_state.reset(token)
+
+    async def _aroute_stream(self, content, state):
+        token = routing_state.set(state)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            routing_state.reset(token)
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_stats(apps, schema_editor):
+    Rating = apps.get_model('api', 'Rating')
+    MovieRatingStats = apps.get_model('api', 'MovieRatingStats')
+
+    rows = (
+        Rating.objects.order_by()
+        .values('movie_id')
+        .annotate(
+            count=Count('id'),
+            total=Sum('score'),
+            **{f'score{i}': Count('id', filter=Q(score=i)) for i in range(1, 6)}
+        )
+    )
+    MovieRatingStats.objects.bulk_create(
+        [MovieRatingStats(mean=row['total'] / row['count'], **row) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieRatingStats',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_stats', serialize=False, to='api.movie')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('score1', models.PositiveIntegerField(default=0)),
+                ('score2', models.PositiveIntegerField(default=0)),
+                ('score3', models.PositiveIntegerField(default=0)),
+                ('score4', models.PositiveIntegerField(default=0)),
+                ('score5', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'movie_rating_stats',
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
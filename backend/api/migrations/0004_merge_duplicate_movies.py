@@ -0,0 +1,75 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:12
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+
+
+def merge_duplicate_movies(apps, schema_editor):
+    Movie = apps.get_model('api', 'Movie')
+    Rating = apps.get_model('api', 'Rating')
+    Comment = apps.get_model('api', 'Comment')
+    WatchlistMovie = apps.get_model('api', 'WatchlistMovie')
+    MovieRatingStats = apps.get_model('api', 'MovieRatingStats')
+
+    duplicated = (
+        Movie.objects.order_by().values('externalId')
+        .annotate(copies=Count('id')).filter(copies__gt=1)
+        .values_list('externalId', flat=True)
+    )
+    for external_id in list(duplicated):
+        # Se conserva la copia con más filas asociadas
+        movies = list(
+            Movie.objects.filter(externalId=external_id)
+            .annotate(
+                refs=Count('ratings', distinct=True)
+                + Count('comments', distinct=True)
+                + Count('movie_watchlists', distinct=True)
+            )
+            .order_by('-refs', 'id')
+        )
+        keeper = movies[0]
+        duplicate_ids = [movie.id for movie in movies[1:]]
+
+        Comment.objects.filter(movie_id__in=duplicate_ids).update(movie_id=keeper.id)
+
+        # Un rating por usuario: gana el del keeper y si no el más reciente
+        rated_by = set(Rating.objects.filter(movie_id=keeper.id).values_list('user_id', flat=True))
+        for rating in Rating.objects.filter(movie_id__in=duplicate_ids).order_by('-createdAt'):
+            if rating.user_id in rated_by:
+                rating.delete()
+            else:
+                rated_by.add(rating.user_id)
+                Rating.objects.filter(pk=rating.pk).update(movie_id=keeper.id)
+
+        # Una relación por watchlist
+        listed_in = set(WatchlistMovie.objects.filter(movie_id=keeper.id).values_list('watchlist_id', flat=True))
+        for relation in WatchlistMovie.objects.filter(movie_id__in=duplicate_ids):
+            if relation.watchlist_id in listed_in:
+                relation.delete()
+            else:
+                listed_in.add(relation.watchlist_id)
+                WatchlistMovie.objects.filter(pk=relation.pk).update(movie_id=keeper.id)
+
+        Movie.objects.filter(id__in=duplicate_ids).delete()
+
+        # Recalcular las estadísticas del keeper con los ratings que ha recibido
+        MovieRatingStats.objects.filter(movie_id=keeper.id).delete()
+        row = Rating.objects.filter(movie_id=keeper.id).aggregate(
+            count=Count('id'),
+            total=Sum('score'),
+            **{f'score{i}': Count('id', filter=Q(score=i)) for i in range(1, 6)}
+        )
+        if row['count']:
+            row['mean'] = row['total'] / row['count']
+            MovieRatingStats.objects.create(movie_id=keeper.id, **row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_movies, migrations.RunPython.noop),
+    ]
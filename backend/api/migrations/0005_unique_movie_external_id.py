@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_merge_duplicate_movies'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movie',
+            name='externalId',
+            field=models.IntegerField(unique=True),
+        ),
+    ]
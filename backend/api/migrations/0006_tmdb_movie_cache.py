@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_unique_movie_external_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TmdbMovieCache',
+            fields=[
+                ('externalId', models.IntegerField(primary_key=True, serialize=False)),
+                ('payload', models.JSONField()),
+                ('fetchedAt', models.DateTimeField()),
+                ('lastAccessedAt', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'db_table': 'tmdb_movie_cache',
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:23
+
+from django.db import migrations, models
+
+# Copia congelada de api.ranking.spread() tal como estaba al escribir esta
+# migración: si el módulo cambia, las bases de datos nuevas y las ya migradas
+# tienen que seguir recibiendo las mismas posiciones
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+KEY_WIDTH = 6
+APPEND_STEP = BASE ** 2
+
+
+def _from_int(value, width):
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        chars.append(DIGITS[digit])
+    return ''.join(reversed(chars)).rstrip('0')
+
+
+def spread(n):
+    width = KEY_WIDTH
+    while (BASE ** width // 2) // (n + 1) < 2:
+        width += 1
+    offset = BASE ** width // 4
+    step = min((BASE ** width // 2) // (n + 1), APPEND_STEP * BASE)
+    return [_from_int(offset + step * (i + 1), width) for i in range(n)]
+
+
+def assign_positions(apps, schema_editor):
+    Watchlist = apps.get_model('api', 'Watchlist')
+    WatchlistMovie = apps.get_model('api', 'WatchlistMovie')
+
+    # No había orden guardado: se conserva el de los ids
+    for watchlist_id in Watchlist.objects.values_list('id', flat=True).iterator():
+        rows = list(WatchlistMovie.objects.filter(watchlist_id=watchlist_id).order_by('id').only('id'))
+        for row, position in zip(rows, spread(len(rows))):
+            row.position = position
+        WatchlistMovie.objects.bulk_update(rows, ['position'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_tmdb_movie_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watchlistmovie',
+            name='position',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.RunPython(assign_positions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='watchlistmovie',
+            index=models.Index(fields=['watchlist', 'position', 'id'], name='watchlist_movies_rank_idx'),
+        ),
+    ]
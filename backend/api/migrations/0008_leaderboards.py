@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_watchlist_movie_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watchlistmovie',
+            name='addedAt',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('top-rated', 'Top rated'), ('most-listed', 'Most listed'), ('most-discussed', 'Most discussed')], max_length=20)),
+                ('window', models.CharField(choices=[('all', 'All time'), ('7d', 'Last 7 days'), ('30d', 'Last 30 days')], max_length=3)),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('count', models.PositiveIntegerField()),
+                ('computedAt', models.DateTimeField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.movie')),
+            ],
+            options={
+                'db_table': 'leaderboard_entries',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'window', 'rank'), name='leaderboard_rank_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovieActivity',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField(null=True)),
+                ('ratings', models.IntegerField(default=0)),
+                ('ratingTotal', models.IntegerField(default=0)),
+                ('listings', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='api.movie')),
+            ],
+            options={
+                'db_table': 'movie_activity',
+                'indexes': [models.Index(fields=['day'], name='movie_activity_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('movie', 'day'), name='movie_activity_day_unique'), models.UniqueConstraint(condition=models.Q(('day__isnull', True)), fields=('movie',), name='movie_activity_history_unique')],
+            },
+        ),
+    ]
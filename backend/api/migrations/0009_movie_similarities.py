@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_leaderboards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movieratingstats',
+            name='changedAt',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movieratingstats',
+            name='similarAt',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='MovieSimilarity',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('score', models.FloatField()),
+                ('support', models.PositiveIntegerField()),
+                ('computedAt', models.DateTimeField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='api.movie')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.movie')),
+            ],
+            options={
+                'db_table': 'movie_similarities',
+                'indexes': [models.Index(fields=['movie', '-score'], name='movie_similarity_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('movie', 'neighbor'), name='movie_similarity_unique')],
+            },
+        ),
+    ]
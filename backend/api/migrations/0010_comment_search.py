@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from api.search import install_comment_search, uninstall_comment_search
+
+
+def install(apps, schema_editor):
+    install_comment_search(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_comment_search(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_movie_similarities'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplicationHeartbeat',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ('beatAt', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'replication_heartbeat',
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:13
+
+import api.ids
+from django.db import migrations, models
+
+
+# El valor por defecto de los ids solo existe en Python: la columna no cambia
+# y los ids UUID4 existentes siguen siendo válidos. Se actualiza solo el
+# estado para que SQLite no rehaga las cinco tablas (y sus triggers)
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_replication_heartbeat'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='comment',
+                    name='id',
+                    field=models.UUIDField(default=api.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='movie',
+                    name='id',
+                    field=models.UUIDField(default=api.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='rating',
+                    name='id',
+                    field=models.UUIDField(default=api.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='watchlist',
+                    name='id',
+                    field=models.UUIDField(default=api.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='watchlistmovie',
+                    name='id',
+                    field=models.UUIDField(default=api.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
@@ -1,11 +1,48 @@
-from django.db import models
+from django.db import connections, models
+from django.db.models import Q, Value
 from django.contrib.auth.models import User  # Importar el User de Django
-import uuid
+from django.utils import timezone
+from .ids import uuid7
+from .ranking import key_after
+
+# Manager de Película
+class MovieManager(models.Manager):
+    def ensure(self, external_id):
+        """
+        Devuelve (movie, created) para un id de TMDB con una única sentencia
+        INSERT ... ON CONFLICT (externalId) DO UPDATE ... RETURNING id.
+        """
+        connection = connections[self.db]
+        features = connection.features
+        if not (features.supports_update_conflicts_with_target and features.can_return_columns_from_insert):
+            return self.get_or_create(externalId=external_id)
+        
+        pk = self.model._meta.pk
+        new_id = pk.get_default()
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        column = connection.ops.quote_name('externalId')
+        
+        # El UPDATE no cambia nada: solo sirve para que RETURNING devuelva la fila existente
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({connection.ops.quote_name(pk.column)}, {column}) VALUES (%s, %s) '
+                f'ON CONFLICT ({column}) DO UPDATE SET {column} = EXCLUDED.{column} '
+                f'RETURNING {connection.ops.quote_name(pk.column)}',
+                [pk.get_db_prep_value(new_id, connection), external_id]
+            )
+            movie_id = pk.to_python(cursor.fetchone()[0])
+        
+        movie = self.model(id=movie_id, externalId=external_id)
+        movie._state.adding = False
+        movie._state.db = self.db
+        return movie, movie_id == new_id
 
 # Modelo de Película
 class Movie(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    externalId = models.IntegerField()
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    externalId = models.IntegerField(unique=True)  # Id de TMDB
+    
+    objects = MovieManager()
     
     class Meta:
         db_table = 'movies'
@@ -13,35 +50,125 @@ class Movie(models.Model):
     def __str__(self):
         return f"Movie {self.externalId}"
 
-# Modelo de Watchlist
-class Watchlist(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+# Modelo de estadísticas de puntuación por película (desnormalizado)
+# Se actualiza de forma incremental en cada escritura de Rating
+class MovieRatingStats(models.Model):
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='rating_stats')
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    score1 = models.PositiveIntegerField(default=0)
+    score2 = models.PositiveIntegerField(default=0)
+    score3 = models.PositiveIntegerField(default=0)
+    score4 = models.PositiveIntegerField(default=0)
+    score5 = models.PositiveIntegerField(default=0)
+    # Para el refresco incremental de las películas similares (ver api/similarity.py)
+    changedAt = models.DateTimeField(null=True, blank=True)
+    similarAt = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'movie_rating_stats'
+    
+    def __str__(self):
+        return f"Movie {self.movie_id}: {self.mean:.2f} ({self.count})"
+    
+    @property
+    def histogram(self):
+        return {str(i): getattr(self, f'score{i}') for i in range(1, 6)}
+
+# Base de los modelos con contador de versión y fecha de modificación, de los
+# que salen los ETag y las escrituras condicionales (If-Match) de la API
+class VersionedModel(models.Model):
+    version = models.PositiveIntegerField(default=1)
+    updatedAt = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        abstract = True
+    
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        # El incremento se hace en la base de datos: dos escrituras concurrentes
+        # sin If-Match no pueden acabar con la misma versión y distinto contenido
+        self.version = models.F('version') + 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version', 'updatedAt'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+    
+    @classmethod
+    def touch(cls, pk):
+        """Nueva versión sin pasar por save (p. ej. al cambiar filas relacionadas)."""
+        cls.touch_many([pk])
+    
+    @classmethod
+    def touch_many(cls, pks):
+        """touch() de varias filas con una sentencia; pks puede ser una subconsulta."""
+        cls.objects.filter(pk__in=pks).update(version=models.F('version') + 1, updatedAt=timezone.now())
+
+# QuerySet de Watchlist. Con isPublic=True Django escribe "isPublic" a secas en
+# el WHERE y SQLite no usa índices para eso; con Value(True) queda
+# "isPublic" = True y se usa watchlists_public_idx
+class WatchlistQuerySet(models.QuerySet):
+    def public(self):
+        return self.filter(isPublic=Value(True))
+    
+    def visible_to(self, user):
+        """Las del usuario y las públicas (un MULTI-INDEX OR sobre user y watchlists_public_idx)."""
+        return self.filter(Q(user=user) | Q(isPublic=Value(True)))
+
+# Modelo de Watchlist (su versión también cambia con su contenido)
+class Watchlist(VersionedModel):
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     name = models.CharField(max_length=255)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='watchlists')
     isPublic = models.BooleanField(default=True)
     
+    objects = WatchlistQuerySet.as_manager()
+    
     class Meta:
         db_table = 'watchlists'
+        indexes = [
+            # Watchlists públicas (ver WatchlistQuerySet)
+            models.Index(fields=['isPublic', 'user'], name='watchlists_public_idx'),
+        ]
     
     def __str__(self):
         return self.name
 
 # Modelo intermedio para relación muchos a muchos entre Watchlist y Movie
 class WatchlistMovie(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     watchlist = models.ForeignKey(Watchlist, on_delete=models.CASCADE, related_name='watchlist_movies')
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='movie_watchlists')
+    position = models.CharField(max_length=255, default='')  # Orden dentro de la watchlist (ver api/ranking.py)
+    addedAt = models.DateTimeField(default=timezone.now)
     
     class Meta:
         db_table = 'watchlist_movies'
         unique_together = ['watchlist', 'movie']
+        indexes = [
+            # Contenido de la watchlist en orden
+            models.Index(fields=['watchlist', 'position', 'id'], name='watchlist_movies_rank_idx'),
+        ]
     
     def __str__(self):
         return f"{self.watchlist.name} - Movie {self.movie.externalId}"
+    
+    def save(self, *args, **kwargs):
+        # Las nuevas se añaden al final de la watchlist
+        if not self.position:
+            last = (
+                WatchlistMovie.objects.filter(watchlist_id=self.watchlist_id)
+                .order_by('-position', '-id').values_list('position', flat=True).first()
+            )
+            self.position = key_after(last)
+        super().save(*args, **kwargs)
 
 # Modelo de Rating
-class Rating(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+class Rating(VersionedModel):
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ratings')
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='ratings')
     score = models.IntegerField(choices=[(i, i) for i in range(1, 6)])  # Puntuación de 1 a 5
@@ -50,13 +177,19 @@ class Rating(models.Model):
     class Meta:
         db_table = 'ratings'
         unique_together = ['user', 'movie']  # Un usuario solo puede calificar una película una vez
+        indexes = [
+            # Orden de la paginación por cursor
+            models.Index(fields=['-createdAt', '-id'], name='ratings_created_idx'),
+            # Ratings de una película y recuento por puntuación (cubre rebuild_rating_stats)
+            models.Index(fields=['movie', 'score'], name='ratings_movie_score_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.movie.externalId}: {self.score}"
 
 # Modelo de Comentario
-class Comment(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+class Comment(VersionedModel):
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='comments')
     text = models.TextField()
@@ -65,6 +198,201 @@ class Comment(models.Model):
     class Meta:
         db_table = 'comments'
         ordering = ['-createdAt']
+        indexes = [
+            # Orden de la paginación por cursor
+            models.Index(fields=['-createdAt', '-id'], name='comments_created_idx'),
+            # Comentarios de una película en el orden de la paginación, sin ordenar aparte
+            models.Index(fields=['movie', '-createdAt', '-id'], name='comments_movie_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username}: {self.text[:50]}"
+
+# Caché local de los detalles de TMDB, indexada por el id de TMDB (Movie.externalId)
+class TmdbMovieCache(models.Model):
+    externalId = models.IntegerField(primary_key=True)
+    payload = models.JSONField()
+    fetchedAt = models.DateTimeField()
+    lastAccessedAt = models.DateTimeField(db_index=True)  # Para el desalojo LRU
+    
+    class Meta:
+        db_table = 'tmdb_movie_cache'
+    
+    def __str__(self):
+        return f"TMDB {self.externalId}"
+
+# Actividad diaria por película para los leaderboards, con contadores que se
+# actualizan en cada escritura. day = NULL es el histórico: la compactación
+# pliega ahí los días que ya no entran en ninguna ventana (ver api/leaderboards.py)
+class MovieActivity(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='activity')
+    day = models.DateField(null=True)
+    ratings = models.IntegerField(default=0)
+    ratingTotal = models.IntegerField(default=0)
+    listings = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'movie_activity'
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'day'], name='movie_activity_day_unique'),
+            models.UniqueConstraint(
+                fields=['movie'], condition=models.Q(day__isnull=True), name='movie_activity_history_unique'
+            ),
+        ]
+        indexes = [
+            # Suma de las ventanas y compactación
+            models.Index(fields=['day'], name='movie_activity_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Movie {self.movie_id} @ {self.day or 'history'}"
+
+# Leaderboards precalculados: una fila por puesto, reescritos por la compactación
+class LeaderboardEntry(models.Model):
+    KIND_CHOICES = [
+        ('top-rated', 'Top rated'),
+        ('most-listed', 'Most listed'),
+        ('most-discussed', 'Most discussed'),
+    ]
+    WINDOW_CHOICES = [
+        ('all', 'All time'),
+        ('7d', 'Last 7 days'),
+        ('30d', 'Last 30 days'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    window = models.CharField(max_length=3, choices=WINDOW_CHOICES)
+    rank = models.PositiveIntegerField()
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    count = models.PositiveIntegerField()
+    computedAt = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'leaderboard_entries'
+        constraints = [
+            # También es el índice con el que se sirve cada página
+            models.UniqueConstraint(fields=['kind', 'window', 'rank'], name='leaderboard_rank_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} {self.window} #{self.rank}: Movie {self.movie_id}"
+
+# Vecinos más parecidos de cada película según los ratings (coseno con los
+# ratings centrados en la media de cada usuario), precalculados por
+# `manage.py compute_similarities` (ver api/similarity.py)
+class MovieSimilarity(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    support = models.PositiveIntegerField()  # Usuarios que han puntuado las dos
+    computedAt = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'movie_similarities'
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'neighbor'], name='movie_similarity_unique'),
+        ]
+        indexes = [
+            # Vecinos de una película en orden de similitud
+            models.Index(fields=['movie', '-score'], name='movie_similarity_rank_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Movie {self.movie_id} ~ {self.neighbor_id}: {self.score:.3f}"
+
+
+# Relación de seguimiento entre usuarios (follower sigue a followee)
+class Follow(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following')
+    followee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers')
+    createdAt = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'follows'
+        constraints = [
+            models.UniqueConstraint(fields=['follower', 'followee'], name='follow_unique'),
+            models.CheckConstraint(condition=~models.Q(follower=models.F('followee')), name='follow_not_self'),
+        ]
+        indexes = [
+            # Seguidores de un usuario, para repartir su actividad
+            models.Index(fields=['followee', 'follower'], name='follows_followee_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.follower_id} -> {self.followee_id}"
+
+# Contadores de seguidores por usuario (desnormalizados), para decidir el reparto del feed
+class UserFollowStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='follow_stats')
+    followers = models.PositiveIntegerField(default=0)
+    following = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'user_follow_stats'
+    
+    def __str__(self):
+        return f"User {self.user_id}: {self.followers} followers"
+
+# Registro de actividad de los usuarios: ratings, comentarios y películas
+# añadidas a watchlists públicas. Se borra con el objeto al que apunta
+class Activity(models.Model):
+    VERB_CHOICES = [
+        ('rated', 'Rated'),
+        ('commented', 'Commented'),
+        ('listed', 'Added to a watchlist'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)  # Creciente: es el orden del feed
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
+    verb = models.CharField(max_length=10, choices=VERB_CHOICES)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    rating = models.ForeignKey(Rating, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    watchlistMovie = models.ForeignKey(
+        WatchlistMovie, on_delete=models.CASCADE, null=True, blank=True, related_name='+'
+    )
+    createdAt = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'activities'
+        indexes = [
+            # Actividad reciente de un usuario (lectura de las cuentas con muchos seguidores)
+            models.Index(fields=['actor', '-id'], name='activities_actor_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.actor_id} {self.verb} Movie {self.movie_id}"
+
+# Bandeja de entrada del feed: una fila por actividad repartida a cada seguidor
+class FeedEntry(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='+')
+    
+    class Meta:
+        db_table = 'feed_entries'
+        constraints = [
+            # También es el índice con el que se lee el feed en orden
+            models.UniqueConstraint(fields=['user', 'activity'], name='feed_entry_unique'),
+        ]
+    
+    def __str__(self):
+        return f"User {self.user_id} <- Activity {self.activity_id}"
+
+# Latido de la replicación: una sola fila que se actualiza en el primario
+# (manage.py replicate). Lo que lleva de retraso en una réplica es su lag
+class ReplicationHeartbeat(models.Model):
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1)
+    beatAt = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'replication_heartbeat'
     
     def __str__(self):
-        return f"{self.user.username}: {self.text[:50]}"
\ No newline at end of file
+        return f"Heartbeat {self.beatAt}"
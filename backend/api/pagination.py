@@ -0,0 +1,21 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+# Paginación por cursor (keyset): cada página es un "WHERE orden > cursor LIMIT n"
+# sobre un índice, sin COUNT(*) y con el mismo coste en la página 1 que en la 1000
+class DefaultCursorPagination(CursorPagination):
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 200)
+
+
+# Para los modelos con fecha de creación: los más recientes primero,
+# desempatando por id para que el orden sea estable
+class CreatedAtCursorPagination(DefaultCursorPagination):
+    ordering = ('-createdAt', '-id')
+
+
+# Leaderboards: en orden de puesto sobre el índice único (kind, window, rank)
+class RankCursorPagination(DefaultCursorPagination):
+    ordering = ('rank',)
\ No newline at end of file
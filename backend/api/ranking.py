@@ -0,0 +1,160 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Posiciones dentro de una watchlist como cadenas que se ordenan
+# lexicográficamente: mover una película solo reescribe su fila, con una
+# posición entre las de sus nuevos vecinos. Solo dígitos y minúsculas, que se
+# ordenan igual en la intercalación binaria de SQLite, en "C" y en las
+# habituales de Postgres y MySQL
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+
+KEY_WIDTH = 6               # Ancho de las posiciones al añadir al final o repartir
+APPEND_STEP = BASE ** 2     # Hueco entre dos posiciones añadidas al final
+FIRST = 'i'                 # Primera posición de una watchlist vacía
+REBALANCE_LENGTH = 24       # A partir de esta longitud se reparte la watchlist en segundo plano
+MAX_LENGTH = 255            # max_length de WatchlistMovie.position
+
+
+def _to_int(key, width=KEY_WIDTH):
+    value = 0
+    for char in key.ljust(width, '0'):
+        value = value * BASE + DIGITS.index(char)
+    return value
+
+
+def _from_int(value, width=KEY_WIDTH):
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        chars.append(DIGITS[digit])
+    # Sin ceros finales: así siempre cabe otra posición entre dos dadas
+    return ''.join(reversed(chars)).rstrip('0')
+
+
+def midpoint(before, after):
+    """Cadena estrictamente entre before y after ('' y None son los extremos abiertos)."""
+    if after is not None and before >= after:
+        raise ValueError(f'{before!r} is not lower than {after!r}')
+
+    if after is not None:
+        n = 0
+        while n < len(after) and (before[n] if n < len(before) else '0') == after[n]:
+            n += 1
+        if n > 0:
+            return after[:n] + midpoint(before[n:], after[n:] or None)
+
+    digit_before = DIGITS.index(before[0]) if before else 0
+    digit_after = DIGITS.index(after[0]) if after is not None else BASE
+    if digit_after - digit_before > 1:
+        return DIGITS[(digit_before + digit_after + 1) // 2]
+    if after is not None and len(after) > 1:
+        return after[0]
+    return DIGITS[digit_before] + midpoint(before[1:], None)
+
+
+def key_after(key):
+    """Posición corta para añadir detrás de key (None si la watchlist está vacía)."""
+    if not key:
+        return FIRST
+    # Sumar el hueco a los primeros KEY_WIDTH caracteres deja la posición corta
+    value = _to_int(key[:KEY_WIDTH]) + APPEND_STEP
+    if value < BASE ** KEY_WIDTH:
+        return _from_int(value)
+    return midpoint(key, None)
+
+
+def key_before(key):
+    """Posición corta para añadir delante de key."""
+    value = _to_int(key[:KEY_WIDTH]) - APPEND_STEP
+    if value > 0:
+        return _from_int(value)
+    return midpoint('', key)
+
+
+def between(lower, upper):
+    """Posición entre dos vecinos; None indica que no hay vecino por ese lado."""
+    if lower is None and upper is None:
+        return FIRST
+    if upper is None:
+        return key_after(lower)
+    if lower is None:
+        return key_before(upper)
+    return midpoint(lower, upper)
+
+
+def keys_after(key, n):
+    """n posiciones consecutivas detrás de key."""
+    keys = []
+    for _ in range(n):
+        key = key_after(key)
+        keys.append(key)
+    return keys
+
+
+def spread(n):
+    """n posiciones cortas repartidas desde el primer cuarto del espacio (deja sitio delante y detrás)."""
+    width = KEY_WIDTH
+    while (BASE ** width // 2) // (n + 1) < 2:
+        width += 1
+    offset = BASE ** width // 4
+    step = min((BASE ** width // 2) // (n + 1), APPEND_STEP * BASE)
+    return [_from_int(offset + step * (i + 1), width) for i in range(n)]
+
+
+def rebalance_watchlist(watchlist_id):
+    """Reparte de nuevo todas las posiciones de una watchlist conservando su orden."""
+    Watchlist = apps.get_model('api', 'Watchlist')
+    WatchlistMovie = apps.get_model('api', 'WatchlistMovie')
+    with transaction.atomic():
+        # Bloquear la watchlist para no pisar movimientos concurrentes
+        if not Watchlist.objects.select_for_update().filter(pk=watchlist_id).exists():
+            return 0
+        rows = list(
+            WatchlistMovie.objects.filter(watchlist_id=watchlist_id)
+            .order_by('position', 'id').only('id', 'position')
+        )
+        for row, position in zip(rows, spread(len(rows))):
+            row.position = position
+        WatchlistMovie.objects.bulk_update(rows, ['position'], batch_size=500)
+        Watchlist.touch(watchlist_id)
+    logger.info('watchlist.rebalanced', extra={'watchlist_id': watchlist_id, 'rows': len(rows)})
+    return len(rows)
+
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='watchlist-rebalance')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _run_rebalance(watchlist_id):
+    try:
+        rebalance_watchlist(watchlist_id)
+    except Exception:
+        logger.exception('watchlist.rebalance_failed', extra={'watchlist_id': watchlist_id})
+    finally:
+        with _pending_lock:
+            _pending.discard(watchlist_id)
+        connections.close_all()
+
+
+def schedule_rebalance(watchlist_id):
+    """
+    Reparte la watchlist cuando se confirme la transacción actual: en un hilo
+    aparte o, con WATCHLIST_REBALANCE = 'inline', en la propia petición.
+    """
+    if getattr(settings, 'WATCHLIST_REBALANCE', 'background') == 'inline':
+        transaction.on_commit(lambda: rebalance_watchlist(watchlist_id))
+        return
+    with _pending_lock:
+        if watchlist_id in _pending:
+            return
+        _pending.add(watchlist_id)
+    transaction.on_commit(lambda: _executor.submit(_run_rebalance, watchlist_id))
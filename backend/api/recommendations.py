@@ -0,0 +1,75 @@
+from collections import defaultdict
+
+from .models import Movie, MovieSimilarity, Rating
+
+MAX_SEEDS = 200     # Ratings más recientes del usuario que se usan como semilla
+
+
+def similar_movies(movie_id, limit):
+    """Vecinos precalculados de una película, de más a menos parecida."""
+    rows = (
+        MovieSimilarity.objects.filter(movie_id=movie_id)
+        .order_by('-score', 'neighbor_id')
+        .values_list('neighbor_id', 'neighbor__externalId', 'score', 'support')[:limit]
+    )
+    return [
+        {'movieId': neighbor_id, 'externalId': external_id, 'score': score, 'support': support}
+        for neighbor_id, external_id, score, support in rows
+    ]
+
+
+def recommend_for_user(user_id, limit):
+    """
+    Películas que el usuario no ha puntuado, ordenadas por la suma de las
+    similitudes con sus ratings recientes, ponderadas por cuánto se separa
+    cada rating de su media. Cada una indica la película puntuada que más
+    aporta ("because you rated X"). Son tres consultas, sin cálculo offline
+    por usuario.
+    """
+    seeds = dict(
+        Rating.objects.filter(user_id=user_id).order_by('-createdAt', '-id')
+        .values_list('movie_id', 'score')[:MAX_SEEDS]
+    )
+    if not seeds:
+        return []
+    mean = sum(seeds.values()) / len(seeds)
+    # Si todos sus ratings son iguales no hay nada que centrar: se toma el punto medio de la escala
+    if all(score == mean for score in seeds.values()):
+        mean = 3
+    weights = {movie_id: score - mean for movie_id, score in seeds.items() if score != mean}
+    if not weights:
+        return []
+
+    totals = defaultdict(float)
+    because = {}
+    rows = (
+        MovieSimilarity.objects.filter(movie_id__in=weights)
+        .exclude(neighbor_id__in=Rating.objects.filter(user_id=user_id).values('movie_id'))
+        .values_list('movie_id', 'neighbor_id', 'score')
+    )
+    for movie_id, neighbor_id, score in rows:
+        contribution = weights[movie_id] * score
+        totals[neighbor_id] += contribution
+        if contribution > 0 and contribution > because.get(neighbor_id, (None, 0))[1]:
+            because[neighbor_id] = (movie_id, contribution)
+
+    ranked = sorted(
+        (neighbor_id for neighbor_id, total in totals.items() if total > 0),
+        key=lambda neighbor_id: (-totals[neighbor_id], str(neighbor_id))
+    )[:limit]
+    external_ids = dict(
+        Movie.objects.filter(id__in=ranked + [because[neighbor_id][0] for neighbor_id in ranked])
+        .values_list('id', 'externalId')
+    )
+    return [
+        {
+            'movieId': neighbor_id,
+            'externalId': external_ids[neighbor_id],
+            'score': totals[neighbor_id],
+            'because': {
+                'movieId': because[neighbor_id][0],
+                'externalId': external_ids[because[neighbor_id][0]],
+            },
+        }
+        for neighbor_id in ranked
+    ]
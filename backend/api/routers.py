@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Lecturas en réplicas (REPLICATION['REPLICAS'], alias de DATABASES) y
+# escrituras en el primario. Solo se leen de una réplica las consultas de las
+# peticiones GET/HEAD/OPTIONS que no han escrito nada; el resto de peticiones,
+# las transacciones y lo que corre fuera de una petición (comandos, tests)
+# usan el primario. Tras una escritura, el mismo cliente lee del primario
+# durante PIN_SECONDS para ver enseguida su nuevo Rating o Comment. La
+# fijación se guarda en la caché PIN_CACHE, que tienen que compartir todos los
+# procesos (lo comprueba api/checks.py)
+
+
+def replication_settings():
+    return {
+        'REPLICAS': [],
+        'MAX_LAG': 5,           # Segundos de retraso a partir de los que no se lee de una réplica
+        'CHECK_INTERVAL': 5,    # Segundos que vale cada comprobación de salud
+        'PIN_SECONDS': 10,      # Segundos que un cliente lee del primario tras escribir
+        'PIN_CACHE': 'default', # Alias de CACHES donde se guardan las fijaciones
+        # Modelos que se leen siempre del primario: un token recién creado
+        # tiene que valer en la petición siguiente
+        'PRIMARY_MODELS': ['authtoken.token', 'sessions.session'],
+        **getattr(settings, 'REPLICATION', {}),
+    }
+
+
+# Estado de la petición en curso (lo fija ReplicaRoutingMiddleware)
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+routing_state = ContextVar('replica_routing_state', default=None)
+
+
+def client_key(request):
+    """Identifica al cliente sin consultar la base de datos: su token o su cookie de sesión."""
+    credential = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    return 'replica-pin:' + hashlib.sha256(credential.encode()).hexdigest()
+
+
+def is_pinned(request):
+    key = client_key(request)
+    return key is not None and caches[replication_settings()['PIN_CACHE']].get(key) is not None
+
+
+def pin(request):
+    key = client_key(request)
+    if key is not None:
+        config = replication_settings()
+        caches[config['PIN_CACHE']].set(key, 1, config['PIN_SECONDS'])
+
+
+# Salud de las réplicas: si responden y cuánto retraso llevan, medido como la
+# antigüedad del latido que les ha llegado del primario (manage.py replicate
+# lo actualiza; tiene que hacerlo más a menudo que MAX_LAG). Una réplica sin
+# latido, o con uno viejo porque la replicación se ha parado, no se usa. El
+# resultado se guarda CHECK_INTERVAL segundos para no comprobarlo en cada consulta
+class ReplicaHealth:
+    def __init__(self):
+        self._status = {}   # alias -> (comprobado, sana, lag)
+        self._lock = threading.Lock()
+
+    def is_healthy(self, alias, config):
+        now = time.monotonic()
+        status = self._status.get(alias)
+        if status is None or now - status[0] >= config['CHECK_INTERVAL']:
+            healthy, lag = self.check(alias, config)
+            with self._lock:
+                previous = self._status.get(alias)
+                self._status[alias] = (now, healthy, lag)
+            if previous is None or previous[1] != healthy:
+                log = logger.info if healthy else logger.warning
+                log('replica.healthy' if healthy else 'replica.unhealthy', extra={'alias': alias, 'lag': lag})
+            return healthy
+        return status[1]
+
+    def check(self, alias, config):
+        """(sana, lag en segundos o None si no se puede medir)."""
+        from .models import ReplicationHeartbeat
+        try:
+            beat_at = ReplicationHeartbeat.objects.using(alias).filter(pk=1).values_list('beatAt', flat=True).first()
+        except DatabaseError:
+            return False, None
+        if beat_at is None:
+            return False, None
+        lag = max(0.0, (timezone.now() - beat_at).total_seconds())
+        return lag <= config['MAX_LAG'], lag
+
+    def status(self):
+        with self._lock:
+            return {alias: {'healthy': healthy, 'lag': lag} for alias, (_, healthy, lag) in self._status.items()}
+
+    def reset(self):
+        with self._lock:
+            self._status.clear()
+
+
+replica_health = ReplicaHealth()
+
+
+def beat():
+    """Actualiza el latido en el primario (lo replica el servidor o manage.py replicate)."""
+    from .models import ReplicationHeartbeat
+    ReplicationHeartbeat.objects.using(DEFAULT_DB_ALIAS).update_or_create(pk=1, defaults={'beatAt': timezone.now()})
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if state is None or state.pinned:
+            return DEFAULT_DB_ALIAS
+        config = replication_settings()
+        if model._meta.label_lower in config['PRIMARY_MODELS']:
+            return DEFAULT_DB_ALIAS
+        # Dentro de una transacción se lee lo que se acaba de escribir
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in config['REPLICAS'] if replica_health.is_healthy(alias, config)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            # El resto de la petición lee del primario
+            state.wrote = True
+            state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Todas las bases de datos tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas reciben el esquema por la replicación
+        return db not in replication_settings()['REPLICAS']
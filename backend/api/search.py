@@ -0,0 +1,161 @@
+import html
+import re
+from functools import lru_cache
+
+from django.db import connections
+
+from .models import Comment
+
+# Índice FTS5 de Comment.text con el contenido en la propia tabla comments
+# (external content): solo guarda el índice invertido, enlazado por rowid.
+# Lo mantienen los triggers, así que también cubre bulk_create, los UPDATE
+# en bloque y los borrados en cascada
+FTS_TABLE = 'comments_fts'
+TRIGGERS = {
+    'comments_fts_insert': (
+        'AFTER INSERT ON comments BEGIN '
+        'INSERT INTO comments_fts(rowid, text) VALUES (new.rowid, new.text); END'
+    ),
+    'comments_fts_delete': (
+        'AFTER DELETE ON comments BEGIN '
+        "INSERT INTO comments_fts(comments_fts, rowid, text) VALUES ('delete', old.rowid, old.text); END"
+    ),
+    'comments_fts_update': (
+        'AFTER UPDATE OF text ON comments BEGIN '
+        "INSERT INTO comments_fts(comments_fts, rowid, text) VALUES ('delete', old.rowid, old.text); "
+        'INSERT INTO comments_fts(rowid, text) VALUES (new.rowid, new.text); END'
+    ),
+}
+MAX_TERMS = 10
+SNIPPET_TOKENS = 16
+# Marcas del snippet que no pueden aparecer en el texto escapado; se cambian por <mark> después
+HIGHLIGHT_START, HIGHLIGHT_END = '\x02', '\x03'
+
+
+@lru_cache(maxsize=None)
+def _sqlite_has_fts5(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def uses_fts(connection):
+    return connection.vendor == 'sqlite' and _sqlite_has_fts5(connection.alias)
+
+
+def _existing(cursor):
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND tbl_name = 'comments')",
+        [FTS_TABLE]
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def install_comment_search(connection, create=True):
+    """
+    Crea el índice y los triggers que falten y, si faltaba alguno, reconstruye
+    el índice desde la tabla. Con create=False solo repara un índice que ya
+    existe (las migraciones que rehacen la tabla comments en SQLite se llevan
+    sus triggers). Devuelve False si la base de datos no tiene FTS5.
+    """
+    if not uses_fts(connection):
+        return False
+    with connection.cursor() as cursor:
+        existing = _existing(cursor)
+        if FTS_TABLE not in existing:
+            if not create:
+                return False
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+                "text, content='comments', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')"
+            )
+        missing = [name for name in TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(f'CREATE TRIGGER {name} {TRIGGERS[name]}')
+        if missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def uninstall_comment_search(connection):
+    if not uses_fts(connection):
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def rebuild_comment_search(connection):
+    """Reconstruye el índice desde la tabla (p. ej. tras un VACUUM, que puede renumerar los rowid)."""
+    if uses_fts(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def search_terms(query):
+    """Palabras de la búsqueda del usuario (sin la sintaxis de FTS5, que podría dar errores)."""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def match_expression(terms):
+    """Todas las palabras, la última como prefijo para buscar mientras se escribe."""
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def highlight(snippet):
+    return (
+        html.escape(snippet)
+        .replace(HIGHLIGHT_START, '<mark>')
+        .replace(HIGHLIGHT_END, '</mark>')
+    )
+
+
+def search_comments(terms, movie_id=None, after=None, limit=20, using='default'):
+    """
+    Comentarios que contienen todas las palabras, del más al menos relevante
+    (bm25), como [(comment_id, rank, snippet HTML), ...]. after es el
+    (rank, id) del último de la página anterior. Sin FTS5 se recurre a
+    LIKE, sin relevancia (rank 0) y en orden de id.
+    """
+    connection = connections[using]
+    if not uses_fts(connection):
+        return _search_like(terms, movie_id, after, limit, using)
+
+    id_field = Comment._meta.pk
+    sql = [
+        f'SELECT c.id, {FTS_TABLE}.rank, snippet({FTS_TABLE}, 0, %s, %s, %s, %s) '
+        f'FROM {FTS_TABLE} JOIN comments c ON c.rowid = {FTS_TABLE}.rowid '
+        f'WHERE {FTS_TABLE} MATCH %s'
+    ]
+    params = [HIGHLIGHT_START, HIGHLIGHT_END, '…', SNIPPET_TOKENS, match_expression(terms)]
+    if movie_id is not None:
+        sql.append('AND c.movie_id = %s')
+        params.append(Comment._meta.get_field('movie').get_db_prep_value(movie_id, connection))
+    if after is not None:
+        rank, last_id = after
+        sql.append(f'AND ({FTS_TABLE}.rank > %s OR ({FTS_TABLE}.rank = %s AND c.id > %s))')
+        params += [rank, rank, id_field.get_db_prep_value(last_id, connection)]
+    sql.append(f'ORDER BY {FTS_TABLE}.rank, c.id LIMIT %s')
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(' '.join(sql), params)
+        return [
+            (id_field.to_python(comment_id), rank, highlight(snippet))
+            for comment_id, rank, snippet in cursor.fetchall()
+        ]
+
+
+def _search_like(terms, movie_id, after, limit, using):
+    rows = Comment.objects.using(using).order_by('id')
+    for term in terms:
+        rows = rows.filter(text__icontains=term)
+    if movie_id is not None:
+        rows = rows.filter(movie_id=movie_id)
+    if after is not None:
+        rows = rows.filter(id__gt=after[1])
+    return [
+        (comment_id, 0.0, html.escape(text[:200]))
+        for comment_id, text in rows.values_list('id', 'text')[:limit]
+    ]
@@ -0,0 +1,133 @@
+import random
+from datetime import timedelta
+from bisect import bisect_left
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .models import Comment, Movie, Rating, Watchlist, WatchlistMovie
+from .ranking import spread
+from .leaderboards import compact_leaderboards, rebuild_activity
+from .stats import rebuild_rating_stats
+
+SEED_PASSWORD = 'seedpass123'
+
+COMMENT_WORDS = (
+    'great', 'boring', 'classic', 'overrated', 'beautiful', 'slow', 'funny', 'dark',
+    'soundtrack', 'ending', 'acting', 'script', 'rewatch', 'masterpiece', 'meh', 'twist',
+)
+
+
+# Muestreo Zipf sobre n elementos: el de rango k sale con probabilidad ∝ 1 / k^s
+class ZipfSampler:
+    def __init__(self, n, s, rng):
+        self.rng = rng
+        self.cumulative = list(accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+    def index(self):
+        return bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+    def distinct(self, k):
+        """k índices distintos (o todos si k >= n), sesgados hacia los primeros rangos."""
+        n = len(self.cumulative)
+        if k >= n:
+            return list(range(n))
+        chosen = set()
+        for _ in range(10 * k):
+            chosen.add(self.index())
+            if len(chosen) == k:
+                return list(chosen)
+        # La cola de Zipf tarda mucho en salir: se completa de forma uniforme
+        rest = [index for index in range(n) if index not in chosen]
+        return list(chosen) + self.rng.sample(rest, k - len(chosen))
+
+
+def heavy_tailed(rng, minimum, alpha, maximum):
+    """Tamaño con cola pesada (Pareto) acotado a [minimum, maximum]."""
+    return min(maximum, int(minimum * rng.paretovariate(alpha)))
+
+
+def seed_dataset(users, movies, ratings_per_user=20, comments_per_user=5, watchlists_per_user=2,
+                 max_watchlist_size=500, zipf_s=1.1, seed=0, prefix='seed', first_external_id=1,
+                 batch_size=1000, log=None):
+    """
+    Crea un conjunto de datos sintético con bulk_create por lotes y devuelve
+    un resumen con cuántas filas se han creado de cada tipo.
+
+    La popularidad de las películas sigue una ley de Zipf (la de rango 1 es la
+    más puntuada, comentada y guardada) y el número de ratings, comentarios y
+    tamaño de las watchlists por usuario tienen cola pesada. Todos los usuarios
+    comparten la contraseña SEED_PASSWORD.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+
+    # Películas: se reutilizan las que ya existen con esos ids de TMDB
+    external_ids = range(first_external_id, first_external_id + movies)
+    Movie.objects.bulk_create([Movie(externalId=external_id) for external_id in external_ids],
+                              batch_size=batch_size, ignore_conflicts=True)
+    movie_ids = dict(Movie.objects.filter(externalId__in=external_ids).values_list('externalId', 'id'))
+    movie_ids = [movie_ids[external_id] for external_id in external_ids]
+    log(f'{len(movie_ids)} movies')
+
+    # Usuarios con la contraseña ya calculada una vez (el hash es lento a propósito)
+    password = make_password(SEED_PASSWORD)
+    created_users = User.objects.bulk_create(
+        [User(username=f'{prefix}_user_{i}', password=password) for i in range(users)],
+        batch_size=batch_size,
+    )
+    if not created_users or created_users[0].pk is None:
+        created_users = list(User.objects.filter(username__startswith=f'{prefix}_user_').order_by('id'))
+    user_ids = [user.pk for user in created_users]
+    Token.objects.bulk_create([Token(user_id=user_id, key=Token.generate_key()) for user_id in user_ids],
+                              batch_size=batch_size)
+    log(f'{len(user_ids)} users')
+
+    popularity = ZipfSampler(len(movie_ids), zipf_s, rng)
+    now = timezone.now()
+    counts = {'movies': len(movie_ids), 'users': len(user_ids)}
+
+    pending = {Rating: [], Comment: [], Watchlist: [], WatchlistMovie: []}
+
+    def flush(*models):
+        for model in models:
+            rows = pending[model]
+            model.objects.bulk_create(rows, batch_size=batch_size)
+            counts[model._meta.db_table] = counts.get(model._meta.db_table, 0) + len(rows)
+            pending[model] = []
+
+    for user_id in user_ids:
+        for index in popularity.distinct(heavy_tailed(rng, max(1, ratings_per_user // 2), 1.5, len(movie_ids))):
+            score = rng.choices((1, 2, 3, 4, 5), weights=(1, 2, 4, 5, 3))[0]
+            pending[Rating].append(Rating(user_id=user_id, movie_id=movie_ids[index], score=score))
+        for _ in range(heavy_tailed(rng, max(1, comments_per_user // 2), 1.5, 10 * comments_per_user)):
+            text = ' '.join(rng.choices(COMMENT_WORDS, k=rng.randint(3, 20)))
+            pending[Comment].append(Comment(user_id=user_id, movie_id=movie_ids[popularity.index()], text=text))
+        for number in range(rng.randint(0, 2 * watchlists_per_user)):
+            watchlist = Watchlist(name=f'Lista {number + 1}', user_id=user_id, isPublic=rng.random() < 0.8)
+            pending[Watchlist].append(watchlist)
+            indexes = popularity.distinct(heavy_tailed(rng, 5, 1.2, max_watchlist_size))
+            for index, position in zip(indexes, spread(len(indexes))):
+                # Fechas repartidas en los últimos 60 días para que las ventanas de los leaderboards varíen
+                added_at = now - timedelta(days=60 * rng.random())
+                pending[WatchlistMovie].append(
+                    WatchlistMovie(watchlist=watchlist, movie_id=movie_ids[index], position=position, addedAt=added_at)
+                )
+
+        # Insertar por lotes para no acumular todo en memoria
+        for model in (Rating, Comment):
+            if len(pending[model]) >= batch_size:
+                flush(model)
+        if len(pending[WatchlistMovie]) >= batch_size:
+            flush(Watchlist, WatchlistMovie)
+
+    flush(Rating, Comment, Watchlist, WatchlistMovie)
+    log(', '.join(f'{count} {table}' for table, count in counts.items() if table not in ('movies', 'users')))
+
+    rebuild_rating_stats(batch_size=batch_size)
+    rebuild_activity(batch_size=batch_size)
+    compact_leaderboards()
+    return counts
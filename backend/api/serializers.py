@@ -1,10 +1,19 @@
+import logging
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
-from .models import Movie, Watchlist, WatchlistMovie, Rating, Comment
+from django.db import IntegrityError, transaction
+from .models import Movie, MovieRatingStats, Watchlist, WatchlistMovie, Rating, Comment, LeaderboardEntry, Activity
+from .fieldsets import SparseFieldsetsMixin
+from .leaderboards import record_activity
+from .stats import apply_rating_change
+
+logger = logging.getLogger(__name__)
+# Eventos por fila: desactivados por defecto y muestreados si se activan
+row_logger = logging.getLogger('api.rows')
 
 # Serializador para Usuario
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'password']
@@ -28,54 +37,118 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
 
 # Serializador para Película
-class MovieSerializer(serializers.ModelSerializer):
+class MovieSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Movie
         fields = ['id', 'externalId']
 
+# Serializador de entrada para la resolución en bloque de películas
+class MovieResolveSerializer(serializers.Serializer):
+    externalIds = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+    create = serializers.BooleanField(default=False)
+
+# Serializador para las estadísticas de puntuación de una película
+class MovieRatingStatsSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    movieId = serializers.UUIDField(source='movie_id', read_only=True)
+    sum = serializers.IntegerField(source='total', read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    
+    class Meta:
+        model = MovieRatingStats
+        fields = ['movieId', 'count', 'sum', 'mean', 'histogram']
+        field_sources = {'histogram': ['score1', 'score2', 'score3', 'score4', 'score5']}
+
+# Serializador de entrada para los cambios en bloque de una watchlist:
+# add/remove o replace, con ids locales (idType="id") o de TMDB (idType="externalId")
+class WatchlistBulkSerializer(serializers.Serializer):
+    MAX_ITEMS = 5000
+    
+    idType = serializers.ChoiceField(choices=['id', 'externalId'], default='id')
+    add = serializers.ListField(child=serializers.CharField(), required=False, max_length=MAX_ITEMS)
+    remove = serializers.ListField(child=serializers.CharField(), required=False, max_length=MAX_ITEMS)
+    replace = serializers.ListField(child=serializers.CharField(), required=False, max_length=MAX_ITEMS)
+    
+    def validate(self, data):
+        if 'replace' in data and ('add' in data or 'remove' in data):
+            raise serializers.ValidationError('Use either replace or add/remove, not both')
+        if not any(key in data for key in ('add', 'remove', 'replace')):
+            raise serializers.ValidationError('One of add, remove or replace is required')
+        
+        field = serializers.UUIDField() if data['idType'] == 'id' else serializers.IntegerField(min_value=1)
+        for key in ('add', 'remove', 'replace'):
+            if key in data:
+                try:
+                    data[key] = list(dict.fromkeys(field.to_internal_value(value) for value in data[key]))
+                except serializers.ValidationError as e:
+                    raise serializers.ValidationError({key: e.detail})
+        if set(data.get('add', [])) & set(data.get('remove', [])):
+            raise serializers.ValidationError('The same movie cannot be in add and remove')
+        return data
+
+# Serializador de entrada para mover una película dentro de una watchlist:
+# justo detrás de "after" o justo delante de "before" (null = al principio / al final)
+class WatchlistMoveSerializer(serializers.Serializer):
+    movieId = serializers.UUIDField()
+    after = serializers.UUIDField(required=False, allow_null=True)
+    before = serializers.UUIDField(required=False, allow_null=True)
+    
+    def validate(self, data):
+        if ('after' in data) == ('before' in data):
+            raise serializers.ValidationError('Exactly one of after or before is required')
+        if data['movieId'] in (data.get('after'), data.get('before')):
+            raise serializers.ValidationError('A movie cannot be moved relative to itself')
+        return data
+
 # Serializador para Watchlist
-class WatchlistSerializer(serializers.ModelSerializer):
-    userId = serializers.IntegerField(source='user.id', read_only=True)
+class WatchlistSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    userId = serializers.IntegerField(source='user_id', read_only=True)
     
     class Meta:
         model = Watchlist
         fields = ['id', 'name', 'userId', 'isPublic']
-# REEMPLAZA el WatchlistMovieSerializer con esta versión corregida:
-class WatchlistMovieSerializer(serializers.ModelSerializer):
-    watchlistId = serializers.UUIDField(write_only=True)
-    movieId = serializers.UUIDField(write_only=True)
+
+# Serializador para las películas de una watchlist. La watchlist y la
+# película completas solo se incluyen con ?expand=watchlist,movie
+class WatchlistMovieSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    watchlistId = serializers.UUIDField(source='watchlist_id')
+    movieId = serializers.UUIDField(source='movie_id')
     
     class Meta:
         model = WatchlistMovie
-        fields = ['id', 'watchlistId', 'movieId']
+        fields = ['id', 'watchlistId', 'movieId', 'position']
+        read_only_fields = ['position']
+        expandable_fields = {
+            'watchlist': (WatchlistSerializer, 'watchlist'),
+            'movie': (MovieSerializer, 'movie'),
+        }
     
     def create(self, validated_data):
-        print(f"🎬 [Serializer] Creating WatchlistMovie")
-        
         # Extraer los IDs
-        watchlist_id = validated_data.pop('watchlistId')
-        movie_id = validated_data.pop('movieId')
+        watchlist_id = validated_data.pop('watchlist_id')
+        movie_id = validated_data.pop('movie_id')
         
-        print(f"📋 Data received: watchlist={watchlist_id}, movie={movie_id}")
+        logger.debug('watchlist_movie.create', extra={'watchlist_id': watchlist_id, 'movie_id': movie_id})
         
         # Obtener los objetos
         try:
             watchlist = Watchlist.objects.get(id=watchlist_id)
-            print(f"✅ Watchlist found: {watchlist.name} (ID: {watchlist.id})")
         except Watchlist.DoesNotExist:
-            print(f"❌ Watchlist {watchlist_id} not found")
+            logger.info('watchlist_movie.watchlist_not_found', extra={'watchlist_id': watchlist_id})
             raise serializers.ValidationError({"error": "Watchlist not found"})
         
         try:
             movie = Movie.objects.get(id=movie_id)
-            print(f"✅ Movie found: ID: {movie.id}, externalId: {movie.externalId}")
         except Movie.DoesNotExist:
-            print(f"❌ Movie {movie_id} not found")
+            logger.info('watchlist_movie.movie_not_found', extra={'movie_id': movie_id})
             raise serializers.ValidationError({"error": "Movie not found"})
         
         # Verificar que no existe ya la relación
         if WatchlistMovie.objects.filter(watchlist=watchlist, movie=movie).exists():
-            print(f"⚠️ Movie {movie.id} already in watchlist {watchlist.id}")
+            logger.info('watchlist_movie.duplicate', extra={'watchlist_id': watchlist.id, 'movie_id': movie.id})
             raise serializers.ValidationError({"error": "This movie is already in the watchlist"})
         
         # IMPORTANTE: Obtener el usuario del contexto del serializer
@@ -83,17 +156,15 @@ class WatchlistMovieSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request:
             user = request.user
-            print(f"👤 User from request: {user.id if user else 'None'}")
         
         # Si no hay usuario del request, intentar obtenerlo de otra manera
         if not user:
             # Intentar obtener el usuario de la watchlist
             user = watchlist.user
-            print(f"👤 User from watchlist: {user.id if user else 'None'}")
         
         # Verificar que el usuario es propietario de la watchlist
         if user and watchlist.user != user:
-            print(f"🚫 User {user.id} is not owner of watchlist {watchlist.id}")
+            logger.warning('watchlist_movie.forbidden', extra={'user_id': user.id, 'watchlist_id': watchlist.id})
             raise serializers.ValidationError({"error": "You don't have permission to add movies to this watchlist"})
         
         # Crear la relación
@@ -102,112 +173,111 @@ class WatchlistMovieSerializer(serializers.ModelSerializer):
             movie=movie
         )
         
-        print(f"✅ Created WatchlistMovie {watchlist_movie.id}")
+        logger.info('watchlist_movie.created', extra={'watchlist_movie_id': watchlist_movie.id})
         return watchlist_movie
     
     def to_representation(self, instance):
-        # Asegurar que siempre devolvemos movieId y watchlistId
-        representation = {
-            'id': str(instance.id),
-            'watchlistId': str(instance.watchlist.id),
-            'movieId': str(instance.movie.id),
-            'watchlist': {
-                'id': str(instance.watchlist.id),
-                'name': instance.watchlist.name,
-                'userId': instance.watchlist.user.id if instance.watchlist.user else None
-            },
-            'movie': {
-                'id': str(instance.movie.id),
-                'externalId': instance.movie.externalId
-            }
-        }
-        print(f"📤 Serializer representation: {representation}")
+        representation = super().to_representation(instance)
+        if row_logger.isEnabledFor(logging.DEBUG):
+            row_logger.debug('watchlist_movie.serialized', extra={'watchlist_movie_id': instance.id})
         return representation
         
 # Serializador para Rating
-class RatingSerializer(serializers.ModelSerializer):
-    userId = serializers.IntegerField(source='user.id', read_only=True)
+class RatingSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    userId = serializers.IntegerField(source='user_id', read_only=True)
     movie_uuid = serializers.UUIDField(write_only=True, required=False)
-    movieId = serializers.UUIDField(source='movie.id', read_only=True)
+    movieId = serializers.UUIDField(source='movie_id', read_only=True)
     
     class Meta:
         model = Rating
         fields = ['id', 'userId', 'movieId', 'movie_uuid', 'score', 'createdAt']
         read_only_fields = ['createdAt', 'userId', 'movieId']
+        expandable_fields = {'user': (UserSerializer, 'user'), 'movie': (MovieSerializer, 'movie')}
     
     def create(self, validated_data):
-        print(f"⭐ [Serializer] Creating Rating")
-        
         # Extraer movie_uuid (solo para creación)
         movie_uuid = validated_data.pop('movie_uuid')
         
         try:
             movie = Movie.objects.get(id=movie_uuid)
-            print(f"✅ Movie found for rating: {movie.id}")
         except Movie.DoesNotExist:
-            print(f"❌ Movie {movie_uuid} not found for rating")
+            logger.info('rating.movie_not_found', extra={'movie_id': movie_uuid})
             raise serializers.ValidationError({"movie_uuid": "Movie not found"})
         
         user = self.context['request'].user
         score = validated_data.get('score', 0)
         
-        print(f"📊 Creating rating: user={user.id}, movie={movie.id}, score={score}")
+        logger.debug('rating.create', extra={'user_id': user.id, 'movie_id': movie.id, 'score': score})
         
-        # Verificar si ya existe una calificación
-        rating, created = Rating.objects.update_or_create(
-            user=user,
-            movie=movie,
-            defaults={'score': score}
-        )
+        # Verificar si ya existe una calificación y actualizar las estadísticas
+        # en la misma transacción
+        with transaction.atomic():
+            rating = Rating.objects.select_for_update().filter(user=user, movie=movie).first()
+            created = rating is None
+            if created:
+                # Si no hay fila no hay nada que bloquear: otra petición puede crear el
+                # mismo rating a la vez. La que pierde actualiza el de la otra
+                try:
+                    with transaction.atomic():
+                        rating = Rating.objects.create(user=user, movie=movie, score=score)
+                except IntegrityError:
+                    rating = Rating.objects.select_for_update().get(user=user, movie=movie)
+                    created = False
+            old_score = None if created else rating.score
+            
+            if not created:
+                rating.score = score
+                rating.save(update_fields=['score'])
+            
+            apply_rating_change(movie.id, old_score, score)
+            record_activity(movie.id, rating.createdAt, ratings=int(created), ratingTotal=score - (old_score or 0))
         
-        print(f"✅ Rating {'created' if created else 'updated'}: {rating.id}")
+        logger.info('rating.saved', extra={'rating_id': rating.id, 'new': created})
         return rating
     
     def update(self, instance, validated_data):
-        print(f"🔄 [Serializer] Updating Rating {instance.id}")
-        
         # En update, NO permitir cambiar la película
         if 'movie_uuid' in validated_data:
             validated_data.pop('movie_uuid')
         
-        # Solo actualizar el score
-        instance.score = validated_data.get('score', instance.score)
-        instance.save()
+        # Solo actualizar el score (leyendo el valor guardado para no descuadrar las estadísticas)
+        with transaction.atomic():
+            old_score = Rating.objects.select_for_update().values_list('score', flat=True).get(pk=instance.pk)
+            instance.score = validated_data.get('score', instance.score)
+            instance.save(update_fields=['score'])
+            apply_rating_change(instance.movie_id, old_score, instance.score)
+            record_activity(instance.movie_id, instance.createdAt, ratingTotal=instance.score - old_score)
         
-        print(f"✅ Rating updated: score={instance.score}")
+        logger.info('rating.updated', extra={'rating_id': instance.id, 'score': instance.score})
         return instance
 
 # Serializador para Comentarios
-class CommentSerializer(serializers.ModelSerializer):
-    userId = serializers.IntegerField(source='user.id', read_only=True)
+class CommentSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    userId = serializers.IntegerField(source='user_id', read_only=True)
     username = serializers.CharField(source='user.username', read_only=True)
-    movieId = serializers.UUIDField(source='movie.id', read_only=True)
+    movieId = serializers.UUIDField(source='movie_id', read_only=True)
     movie_uuid = serializers.UUIDField(write_only=True)
     
     class Meta:
         model = Comment
         fields = ['id', 'userId', 'username', 'movieId', 'movie_uuid', 'text', 'createdAt']
         read_only_fields = ['createdAt', 'username', 'userId', 'movieId']
+        expandable_fields = {'user': (UserSerializer, 'user'), 'movie': (MovieSerializer, 'movie')}
     
     def create(self, validated_data):
-        print(f"💬 [Serializer] Creating Comment")
-        
         # Extraer movie_uuid
         movie_uuid = validated_data.pop('movie_uuid')
         
         # Obtener el objeto Movie
         try:
             movie = Movie.objects.get(id=movie_uuid)
-            print(f"✅ Movie found for comment: {movie.id}")
         except Movie.DoesNotExist:
-            print(f"❌ Movie {movie_uuid} not found for comment")
+            logger.info('comment.movie_not_found', extra={'movie_id': movie_uuid})
             raise serializers.ValidationError({"movie_uuid": "Movie not found"})
         
         # Obtener el usuario
         user = self.context['request'].user
         
-        print(f"📝 Creating comment: user={user.id}, movie={movie.id}")
-        
         # Crear el comentario
         comment = Comment.objects.create(
             user=user,
@@ -215,5 +285,60 @@ class CommentSerializer(serializers.ModelSerializer):
             text=validated_data.get('text', '')
         )
         
-        print(f"✅ Comment created: {comment.id}")
-        return comment
\ No newline at end of file
+        logger.info('comment.created', extra={'comment_id': comment.id, 'user_id': user.id, 'movie_id': movie.id})
+        return comment
+
+# Serializador para los puestos de un leaderboard
+class LeaderboardEntrySerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    movieId = serializers.UUIDField(source='movie_id', read_only=True)
+    externalId = serializers.IntegerField(source='movie.externalId', read_only=True)
+    
+    class Meta:
+        model = LeaderboardEntry
+        fields = ['rank', 'movieId', 'externalId', 'score', 'count', 'computedAt']
+        expandable_fields = {'movie': (MovieSerializer, 'movie')}
+
+# Serializador para las actividades del feed. score, comment y watchlist solo
+# aparecen en las actividades que los tienen
+class ActivitySerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    actor = serializers.SerializerMethodField()
+    movie = serializers.SerializerMethodField()
+    score = serializers.SerializerMethodField()
+    comment = serializers.SerializerMethodField()
+    watchlist = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Activity
+        fields = ['id', 'verb', 'createdAt', 'actor', 'movie', 'score', 'comment', 'watchlist']
+        field_sources = {
+            'actor': ['actor__username'],
+            'movie': ['movie__externalId'],
+            'score': ['rating__score'],
+            'comment': ['comment__text'],
+            'watchlist': ['watchlistMovie__watchlist__name'],
+        }
+    
+    def get_actor(self, instance):
+        return {'id': instance.actor_id, 'username': instance.actor.username}
+    
+    def get_movie(self, instance):
+        return {'id': str(instance.movie_id), 'externalId': instance.movie.externalId}
+    
+    def get_score(self, instance):
+        return instance.rating.score if instance.rating_id else None
+    
+    def get_comment(self, instance):
+        return {'id': str(instance.comment_id), 'text': instance.comment.text} if instance.comment_id else None
+    
+    def get_watchlist(self, instance):
+        if not instance.watchlistMovie_id:
+            return None
+        watchlist = instance.watchlistMovie.watchlist
+        return {'id': str(watchlist.id), 'name': watchlist.name}
+    
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        for name in ('score', 'comment', 'watchlist'):
+            if name in representation and representation[name] is None:
+                del representation[name]
+        return representation
@@ -0,0 +1,159 @@
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import token_cache
+from .caching import invalidate_public_watchlists
+from .feed import publish
+from .leaderboards import record_activity, remove_listings
+from .middleware import count_query
+from .models import Comment, Movie, Rating, Watchlist, WatchlistMovie
+from .search import install_comment_search
+from .sqlite import apply_pragmas, maintenance
+from .stats import apply_rating_change
+
+
+# Los borrados llegan por varios caminos (API, admin, cascada de User/Movie),
+# así que las estadísticas se descuentan desde la señal
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    apply_rating_change(instance.movie_id, old_score=instance.score)
+    record_activity(instance.movie_id, instance.createdAt, ratings=-1, ratingTotal=-instance.score)
+
+
+# Registro de actividad y feed de los seguidores (api/feed.py). Los cambios de
+# puntuación no generan actividad: el feed muestra la puntuación actual
+@receiver(post_save, sender=Rating)
+def rating_published(sender, instance, created, **kwargs):
+    if created:
+        publish(instance.user_id, 'rated', instance.movie_id, rating=instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_published(sender, instance, created, **kwargs):
+    if created:
+        publish(instance.user_id, 'commented', instance.movie_id, comment=instance)
+
+
+# Solo las watchlists públicas; las altas en bloque publican desde WatchlistViewSet.bulk
+@receiver(post_save, sender=WatchlistMovie)
+def watchlist_movie_published(sender, instance, created, **kwargs):
+    if created and instance.watchlist.isPublic:
+        publish(instance.watchlist.user_id, 'listed', instance.movie_id, watchlistMovie=instance)
+
+
+# Contadores de los leaderboards (api/leaderboards.py). Las altas en bloque
+# de WatchlistViewSet.bulk los actualizan de forma explícita
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        record_activity(instance.movie_id, instance.createdAt, comments=1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    record_activity(instance.movie_id, instance.createdAt, comments=-1)
+
+
+@receiver(post_save, sender=WatchlistMovie)
+def watchlist_movie_saved(sender, instance, created, **kwargs):
+    if created:
+        record_activity(instance.movie_id, instance.addedAt, listings=1)
+
+
+# Solo los borrados de una relación (origin es la propia fila): los borrados en
+# bloque (WatchlistViewSet.bulk, admin) y en cascada descuentan todas las
+# relaciones de una vez con remove_listings
+@receiver(post_delete, sender=WatchlistMovie)
+def watchlist_movie_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, WatchlistMovie):
+        record_activity(instance.movie_id, instance.addedAt, listings=-1)
+
+
+# pre_delete llega antes de borrar las relaciones en cascada. Al borrar una
+# película no hay nada que descontar: sus contadores se borran con ella
+@receiver(pre_delete, sender=Watchlist)
+def watchlist_deleting(sender, instance, **kwargs):
+    remove_listings(instance.watchlist_movies.values_list('movie_id', 'addedAt'))
+
+
+# Caché de autenticación: se invalida al momento y otra vez tras el commit,
+# para que una petición concurrente no vuelva a cachear los datos antiguos
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+    transaction.on_commit(lambda: token_cache.invalidate(instance.key))
+
+
+# Cualquier cambio del usuario (contraseña en UserSerializer.update, desactivación,
+# cambios desde el admin...) descarta sus tokens cacheados
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    token_cache.invalidate_user(instance.pk)
+    transaction.on_commit(lambda: token_cache.invalidate_user(instance.pk))
+
+
+
+# Listado público de watchlists (api/caching.py): cualquier cambio en una
+# watchlist o en su contenido pasa a una versión nueva del listado cacheado.
+# Las escrituras en bloque (bulk_create) lo invalidan de forma explícita
+@receiver(post_save, sender=Watchlist)
+@receiver(post_delete, sender=Watchlist)
+@receiver(post_save, sender=WatchlistMovie)
+@receiver(post_delete, sender=WatchlistMovie)
+def watchlist_changed(sender, **kwargs):
+    invalidate_public_watchlists()
+
+
+# Nueva versión de la watchlist (y de su ETag) cuando cambia su contenido.
+# Igual que con los contadores, solo los borrados de una relación: quien borra
+# en bloque (WatchlistViewSet.bulk, admin) hace un solo touch
+@receiver(post_save, sender=WatchlistMovie)
+def watchlist_contents_changed(sender, instance, **kwargs):
+    Watchlist.touch(instance.watchlist_id)
+
+
+@receiver(post_delete, sender=WatchlistMovie)
+def watchlist_contents_removed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, WatchlistMovie):
+        Watchlist.touch(instance.watchlist_id)
+
+
+# Al borrar una película cambian todas las watchlists que la tenían
+@receiver(pre_delete, sender=Movie)
+def movie_deleting(sender, instance, **kwargs):
+    Watchlist.touch_many(WatchlistMovie.objects.filter(movie=instance).values('watchlist_id'))
+
+
+# Las migraciones que rehacen la tabla comments en SQLite (cambios de columnas)
+# borran sus triggers: se vuelven a crear y se reconstruye el índice de búsqueda
+@receiver(post_migrate)
+def comment_search_repaired(sender, using, **kwargs):
+    if sender.name == 'api':
+        install_comment_search(connections[using], create=False)
+
+
+# Las consultas de las peticiones async se cuentan en las métricas desde la
+# propia conexión (ver api/middleware.py)
+@receiver(connection_created)
+def query_counter_installed(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+# Perfil de PRAGMAs de SQLite en cada conexión nueva y checkpoint/optimize
+# periódicos al terminar las peticiones (ver api/sqlite.py)
+@receiver(connection_created)
+def sqlite_tuned(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection.connection)
+
+
+@receiver(request_finished)
+def sqlite_maintained(sender, **kwargs):
+    maintenance.run()
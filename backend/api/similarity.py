@@ -0,0 +1,168 @@
+import logging
+from array import array
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import MovieRatingStats, MovieSimilarity, Rating
+
+logger = logging.getLogger(__name__)
+
+SAVE_BATCH = 500    # Películas por transacción al guardar los vecinos
+
+
+def similarity_settings():
+    return {
+        'TOP_K': 50,            # Vecinos guardados por película
+        'MIN_SUPPORT': 2,       # Usuarios en común necesarios para considerar un vecino
+        'SHRINKAGE': 10,        # Penaliza las similitudes con pocos usuarios en común: s·n/(n+λ)
+        'MEMORY_MB': 256,       # Memoria de las matrices densas de cada bloque de películas
+        # Ratings que se cargan como mucho (None sin límite). La matriz ocupa
+        # unos 100 bytes por rating en el pico de la carga y del cálculo,
+        # además de MEMORY_MB: con 10 millones, alrededor de 1,2 GB
+        'MAX_RATINGS': 10_000_000,
+        **getattr(settings, 'SIMILARITY', {}),
+    }
+
+
+class TooManyRatings(Exception):
+    """La tabla de ratings supera SIMILARITY['MAX_RATINGS']."""
+
+
+def load_ratings(batch_size=10000, max_ratings=None):
+    """
+    Lee la tabla de ratings por lotes en arrays compactos (16 bytes por rating)
+    y devuelve (matriz usuarios × películas en CSC, lista de ids de película
+    en el orden de las columnas). Los ratings van centrados en la media de cada
+    usuario, así que los de usuarios con un solo rating quedan a cero.
+    Lanza TooManyRatings en cuanto se pasa de max_ratings, antes de montar la matriz.
+    """
+    movie_index = {}
+    users = array('q')
+    movies = array('i')
+    scores = array('f')
+    rows = Rating.objects.order_by().values_list('user_id', 'movie_id', 'score')
+    for user_id, movie_id, score in rows.iterator(chunk_size=batch_size):
+        users.append(user_id)
+        movies.append(movie_index.setdefault(movie_id, len(movie_index)))
+        scores.append(score)
+        if max_ratings is not None and len(scores) > max_ratings:
+            raise TooManyRatings(f'Hay más de {max_ratings} ratings (SIMILARITY["MAX_RATINGS"])')
+
+    user_ids, user_rows = np.unique(np.frombuffer(users, dtype=np.int64), return_inverse=True)
+    del users
+    scores = np.frombuffer(scores, dtype=np.float32)
+    means = np.bincount(user_rows, weights=scores) / np.maximum(np.bincount(user_rows), 1)
+    centered = (scores - means[user_rows]).astype(np.float32)
+
+    matrix = sparse.csc_matrix(
+        (centered, (user_rows, np.frombuffer(movies, dtype=np.int32))),
+        shape=(len(user_ids), len(movie_index)),
+    )
+    matrix.eliminate_zeros()
+    return matrix, list(movie_index)
+
+
+def _neighbors(matrix, columns, top_k, min_support, shrinkage, block_size):
+    """
+    Genera (columna, [(vecino, similitud, apoyo), ...]) para las columnas
+    pedidas, calculando bloques de block_size filas densas de la matriz de
+    similitud para acotar la memoria.
+    """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    normalized = matrix @ sparse.diags(np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0))
+    normalized = normalized.tocsc()
+    rated = (matrix != 0).astype(np.float32).tocsc()
+    k = min(top_k, matrix.shape[1] - 1)
+
+    for start in range(0, len(columns), block_size):
+        block = np.asarray(columns[start:start + block_size])
+        scores = (normalized[:, block].T @ normalized).toarray()
+        support = (rated[:, block].T @ rated).toarray()
+        if shrinkage:
+            # Sin temporales del tamaño del bloque además del factor
+            factor = support + shrinkage
+            np.divide(support, factor, out=factor)
+            scores *= factor
+            del factor
+        scores[support < min_support] = 0
+        scores[np.arange(len(block)), block] = 0
+
+        for row, column in enumerate(block):
+            if k <= 0:
+                yield column, []
+                continue
+            top = np.argpartition(scores[row], -k)[-k:]
+            top = top[np.argsort(-scores[row, top], kind='stable')]
+            yield column, [
+                (neighbor, float(scores[row, neighbor]), int(support[row, neighbor]))
+                for neighbor in top if scores[row, neighbor] > 0
+            ]
+        del scores, support
+
+
+def compute_similarities(full=False, batch_size=10000, log=None):
+    """
+    Recalcula los vecinos de las películas cuyos ratings han cambiado desde el
+    último cálculo (o de todas con full=True). Los vecinos de una película se
+    sustituyen en una transacción junto con su MovieRatingStats.similarAt.
+    El refresco incremental no toca las listas de las demás películas aunque
+    alguno de sus vecinos haya cambiado: para eso está el cálculo completo
+    periódico. Devuelve el número de películas recalculadas.
+    """
+    config = similarity_settings()
+    log = log or (lambda message: None)
+    started = timezone.now()
+
+    stats = MovieRatingStats.objects.all()
+    if not full:
+        stats = stats.filter(Q(similarAt__isnull=True) | Q(changedAt__gt=F('similarAt')))
+    targets = set(stats.values_list('movie_id', flat=True))
+    if not full and not targets:
+        log('No hay películas con ratings nuevos')
+        return 0
+
+    matrix, movie_ids = load_ratings(batch_size=batch_size, max_ratings=config['MAX_RATINGS'])
+    log(f'{matrix.nnz} ratings, {matrix.shape[0]} usuarios, {matrix.shape[1]} películas')
+    if full:
+        targets.update(movie_ids)
+    columns = [column for column, movie_id in enumerate(movie_ids) if movie_id in targets]
+
+    # Por celda del bloque: similitud, usuarios en común y el factor de
+    # penalización en float32, más los productos dispersos de los que salen
+    block_size = max(1, int(config['MEMORY_MB'] * 2 ** 20 // (16 * max(len(movie_ids), 1))))
+
+    def save(rows, done):
+        with transaction.atomic():
+            MovieSimilarity.objects.filter(movie_id__in=done).delete()
+            MovieSimilarity.objects.bulk_create(rows, batch_size=1000)
+            MovieRatingStats.objects.filter(movie_id__in=done).update(similarAt=started)
+
+    rows, done = [], []
+    for column, neighbors in _neighbors(matrix, columns, config['TOP_K'], config['MIN_SUPPORT'],
+                                        config['SHRINKAGE'], block_size):
+        done.append(movie_ids[column])
+        rows.extend(
+            MovieSimilarity(movie_id=movie_ids[column], neighbor_id=movie_ids[neighbor],
+                            score=score, support=support, computedAt=started)
+            for neighbor, score, support in neighbors
+        )
+        if len(done) >= SAVE_BATCH:
+            save(rows, done)
+            rows, done = [], []
+
+    save(rows, done)
+    # Las que se han quedado sin ratings pierden sus vecinos
+    in_matrix = set(movie_ids)
+    gone = [movie_id for movie_id in targets if movie_id not in in_matrix]
+    for start in range(0, len(gone), SAVE_BATCH):
+        save([], gone[start:start + SAVE_BATCH])
+    if full:
+        MovieSimilarity.objects.exclude(movie_id__in=MovieRatingStats.objects.values('movie_id')).delete()
+
+    logger.info('similarities.computed', extra={'movies': len(targets), 'full': full})
+    return len(targets)
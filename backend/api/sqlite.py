@@ -0,0 +1,124 @@
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from .search import rebuild_comment_search
+
+logger = logging.getLogger(__name__)
+
+# Perfil de PRAGMAs para SQLite en producción, aplicado a cada conexión nueva
+# (api/signals.py). Con WAL los lectores no esperan a los escritores ni al
+# revés; synchronous=NORMAL solo sincroniza el disco en los checkpoints (una
+# caída del sistema puede perder las últimas transacciones, no corromper la
+# base de datos). Las escrituras empiezan con BEGIN IMMEDIATE (OPTIONS
+# 'transaction_mode' en DATABASES): una transacción que lee y luego escribe
+# espera su turno al empezar en lugar de fallar con "database is locked"
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,           # ms que se espera al bloqueo antes de fallar
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,       # Negativo: en KiB (64 MiB por conexión)
+    'temp_store': 'MEMORY',
+}
+
+
+def sqlite_settings():
+    """settings.SQLITE sobre los valores por defecto; SQLITE['PRAGMAS'] solo cambia los PRAGMAs que nombra."""
+    configured = getattr(settings, 'SQLITE', {})
+    return {
+        'CHECKPOINT_INTERVAL': 300,     # Segundos entre wal_checkpoint desde las peticiones (0 para no hacerlo)
+        'OPTIMIZE_INTERVAL': 3600,      # Segundos entre PRAGMA optimize desde las peticiones (0 para no hacerlo)
+        **configured,
+        'PRAGMAS': {**DEFAULT_PRAGMAS, **configured.get('PRAGMAS', {})},
+    }
+
+
+_NAME_RE = re.compile(r'^[a-z_]+$')
+_VALUE_RE = re.compile(r'^(-?\d+|[A-Za-z_]+)$')
+
+
+def apply_pragmas(connection, pragmas=None):
+    """Aplica el perfil de PRAGMAs (por defecto, el de settings.SQLITE) a una conexión DB-API de sqlite3."""
+    if pragmas is None:
+        pragmas = sqlite_settings()['PRAGMAS']
+    for name, value in pragmas.items():
+        if value is None:
+            continue    # None desactiva un PRAGMA del perfil por defecto
+        # Los PRAGMA no admiten parámetros: solo nombres y valores simples
+        if not _NAME_RE.match(name) or not _VALUE_RE.match(str(value)):
+            raise ValueError(f'Invalid SQLite pragma {name}={value!r}')
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+def checkpoint(connection, mode='PASSIVE'):
+    """
+    Pasa el WAL al fichero principal. PASSIVE no espera a nadie; TRUNCATE
+    espera a los lectores y deja el WAL vacío. Devuelve (ocupado, páginas
+    del WAL, páginas copiadas) o None si la base de datos no usa WAL.
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        if cursor.fetchone()[0].lower() != 'wal':
+            return None
+        cursor.execute(f'PRAGMA wal_checkpoint({mode})')
+        return tuple(cursor.fetchone())
+
+
+def optimize(connection):
+    """PRAGMA optimize: actualiza las estadísticas del planificador que lo necesiten."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA optimize')
+
+
+def vacuum(connection):
+    """VACUUM y reconstrucción del índice de búsqueda (VACUUM puede renumerar los rowid)."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM')
+        rebuild_comment_search(connection)
+
+
+# Mantenimiento periódico desde las propias peticiones: como mucho un
+# checkpoint cada CHECKPOINT_INTERVAL y un optimize cada OPTIMIZE_INTERVAL
+# segundos por proceso, sin esperar si otro hilo ya lo está haciendo
+class Maintenance:
+    def __init__(self):
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def due(self, task, interval):
+        now = time.monotonic()
+        if not interval or now - self._last.setdefault(task, now) < interval:
+            return False
+        self._last[task] = now
+        return True
+
+    def run(self, alias='default'):
+        connection = connections[alias]
+        if connection.vendor != 'sqlite' or not self._lock.acquire(blocking=False):
+            return
+        try:
+            config = sqlite_settings()
+            if self.due('checkpoint', config['CHECKPOINT_INTERVAL']):
+                result = checkpoint(connection)
+                if result is not None:
+                    logger.info('sqlite.checkpoint', extra={'busy': result[0], 'wal_pages': result[1],
+                                                            'checkpointed_pages': result[2]})
+            if self.due('optimize', config['OPTIMIZE_INTERVAL']):
+                optimize(connection)
+                logger.info('sqlite.optimize')
+        except Exception:
+            logger.exception('sqlite.maintenance_failed')
+        finally:
+            self._lock.release()
+
+
+maintenance = Maintenance()
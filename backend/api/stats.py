@@ -0,0 +1,95 @@
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.db.models.lookups import GreaterThan
+from .models import MovieRatingStats, Rating
+
+SCORES = range(1, 6)
+
+
+def apply_rating_change(movie_id, old_score=None, new_score=None):
+    """
+    Aplica sobre MovieRatingStats el paso de old_score a new_score.
+
+    old_score=None indica un rating nuevo y new_score=None un rating borrado.
+    Debe llamarse dentro de la misma transacción que la escritura del Rating.
+    """
+    if old_score == new_score:
+        return
+
+    delta_count = 0
+    delta_total = 0
+    changes = {}
+    if old_score is not None:
+        delta_count -= 1
+        delta_total -= old_score
+        changes[f'score{old_score}'] = F(f'score{old_score}') - 1
+    if new_score is not None:
+        delta_count += 1
+        delta_total += new_score
+        changes[f'score{new_score}'] = F(f'score{new_score}') + 1
+
+    # En un UPDATE las columnas de la derecha tienen el valor anterior,
+    # así que la media se calcula con los nuevos totales en la misma sentencia
+    new_count = F('count') + delta_count
+    new_total = F('total') + delta_total
+    changes.update(
+        changedAt=timezone.now(),
+        count=new_count,
+        total=new_total,
+        mean=Case(
+            When(GreaterThan(new_count, 0), then=ExpressionWrapper(
+                Cast(new_total, FloatField()) / new_count, output_field=FloatField()
+            )),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+    )
+
+    stats = MovieRatingStats.objects.filter(movie_id=movie_id)
+    if stats.update(**changes) or old_score is not None:
+        return
+
+    # Primer rating de la película: crear la fila (ignorando carreras) y reaplicar
+    MovieRatingStats.objects.bulk_create([MovieRatingStats(movie_id=movie_id)], ignore_conflicts=True)
+    stats.update(**changes)
+
+
+def get_rating_stats(movie_ids):
+    """Devuelve {movie_id: MovieRatingStats} con filas vacías para las películas sin ratings."""
+    found = MovieRatingStats.objects.in_bulk(movie_ids)
+    return {movie_id: found.get(movie_id) or MovieRatingStats(movie_id=movie_id) for movie_id in movie_ids}
+
+
+async def aget_rating_stats(movie_ids):
+    """get_rating_stats() para las vistas async."""
+    found = await MovieRatingStats.objects.ain_bulk(movie_ids)
+    return {movie_id: found.get(movie_id) or MovieRatingStats(movie_id=movie_id) for movie_id in movie_ids}
+
+
+def rebuild_rating_stats(batch_size=1000):
+    """Recalcula todas las estadísticas desde la tabla de ratings. Devuelve el número de filas."""
+    rows = (
+        Rating.objects.order_by()
+        .values('movie_id')
+        .annotate(
+            count=Count('id'),
+            total=Sum('score'),
+            **{f'score{i}': Count('id', filter=Q(score=i)) for i in SCORES}
+        )
+    )
+
+    MovieRatingStats.objects.all().delete()
+    created = 0
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        row['mean'] = row['total'] / row['count']
+        batch.append(MovieRatingStats(**row))
+        if len(batch) >= batch_size:
+            MovieRatingStats.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        MovieRatingStats.objects.bulk_create(batch)
+        created += len(batch)
+    return created
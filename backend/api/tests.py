@@ -1,3 +1,1676 @@
-from django.test import TestCase
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .authentication import CachedTokenAuthentication, token_cache
+from .caching import PUBLIC_WATCHLISTS_VERSION_KEY, public_watchlists_version
+from .checks import public_watchlists_version_cache_check, replica_pin_cache_check
+from .fieldsets import shape_queryset
+from .ids import uuid7
+from .leaderboards import compact_leaderboards
+from .metrics import QUERY_BUCKETS, Histogram, registry
+from .models import (
+    Activity, Comment, FeedEntry, Movie, MovieActivity, MovieRatingStats, MovieSimilarity, Rating, ReplicationHeartbeat,
+    TmdbMovieCache, Watchlist, WatchlistMovie
+)
+from .middleware import brotli
+from .ranking import FIRST, KEY_WIDTH, MAX_LENGTH, REBALANCE_LENGTH, between, midpoint, spread
+from .renderers import FastJSONRenderer, dumps, msgpack
+from .routers import replica_health
+from .search import TRIGGERS, install_comment_search, search_comments, uninstall_comment_search, uses_fts
+from .seeding import seed_dataset
+from .serializers import CommentSerializer
+from .similarity import compute_similarities
+from .sqlite import DEFAULT_PRAGMAS, apply_pragmas, sqlite_settings
+from .stats import apply_rating_change
+from .tmdb import get_gateway, reset_gateway
+from .views import WatchlistViewSet
+
+# Un "SCAN tabla" sin índice recorre la tabla entera. No se admite en ninguna
+# consulta de las peticiones salvo que el test lo permita para esa tabla
+FULL_SCAN_RE = re.compile(r'^SCAN (?!CONSTANT ROW)(\S+)$')
+
+
+def query_plan(sql, params=None):
+    """Líneas de EXPLAIN QUERY PLAN (sin params, de una consulta ya interpolada como en captured_queries)."""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def queryset_plan(queryset):
+    return query_plan(*queryset.query.sql_with_params())
+
+
+def api_client(username):
+    """(APIClient autenticado con token, usuario) para un usuario nuevo."""
+    user = User.objects.create_user(username)
+    token, _ = Token.objects.get_or_create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client, user
+
+
+def streamed_content(response):
+    """Cuerpo de una StreamingHttpResponse, síncrona o async."""
+    if response.is_async:
+        async def collect():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        return async_to_sync(collect)()
+    return b''.join(response.streaming_content)
+
+
+def streamed_json(response):
+    return json.loads(streamed_content(response))
+
+
+def full_scans(sql, allowed=()):
+    """Recorridos completos del plan de sql, salvo los de las tablas de allowed."""
+    return [detail for detail in query_plan(sql)
+            if FULL_SCAN_RE.match(detail) and FULL_SCAN_RE.match(detail).group(1) not in allowed]
+
+
+# Planes de todas las consultas de api/views.py: se recorren los endpoints con
+# datos sembrados y se comprueba que ninguna SELECT acaba en un recorrido completo
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN de SQLite')
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=6, movies=30, ratings_per_user=8, comments_per_user=4, watchlists_per_user=2,
+                     max_watchlist_size=10)
+        compact_leaderboards()
+        cls.user = User.objects.filter(watchlists__watchlist_movies__isnull=False).distinct().first()
+        cls.other = User.objects.exclude(pk=cls.user.pk).first()
+        cls.token, _ = Token.objects.get_or_create(user=cls.user)
+        cls.watchlist = Watchlist.objects.filter(user=cls.user, watchlist_movies__isnull=False).first()
+        cls.movie = Movie.objects.filter(comments__isnull=False, ratings__isnull=False).first()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def assertNoFullScans(self, method, url, data=None, allowed=()):
+        """allowed: tablas que el endpoint recorre enteras a propósito (p. ej. un total global)."""
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 500, url)
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        for sql in selects:
+            self.assertEqual(full_scans(sql, allowed), [], f'{method.upper()} {url}: {sql}')
+        return response
+
+    def test_users(self):
+        self.assertNoFullScans('get', '/api/users/me/')
+        self.assertNoFullScans('post', f'/api/users/{self.other.pk}/follow/')
+        self.assertNoFullScans('delete', f'/api/users/{self.other.pk}/follow/')
+        self.assertNoFullScans('get', '/api/users/me/recommendations/')
+
+    def test_movies(self):
+        movie = self.movie
+        self.assertNoFullScans('get', '/api/movies/')
+        self.assertNoFullScans('get', f'/api/movies/?externalId={movie.externalId}')
+        self.assertNoFullScans('get', f'/api/movies/{movie.pk}/')
+        self.assertNoFullScans('get', f'/api/movies/{movie.pk}/stats/')
+        self.assertNoFullScans('get', f'/api/movies/{movie.pk}/similar/')
+        self.assertNoFullScans('get', f'/api/movies/stats/?ids={movie.pk}')
+        self.assertNoFullScans('post', '/api/movies/resolve/', {'externalIds': [movie.externalId, 999999],
+                                                                'create': True})
+        self.assertNoFullScans('put', '/api/movies/by-external/888888/')
+
+    def test_watchlists(self):
+        watchlist = self.watchlist
+        movies = list(watchlist.watchlist_movies.order_by('position').values_list('movie_id', flat=True))
+        new_movie = Movie.objects.exclude(movie_watchlists__watchlist=watchlist).first()
+        self.assertNoFullScans('get', '/api/watchlists/')
+        self.assertNoFullScans('get', f'/api/watchlists/{watchlist.pk}/')
+        self.assertNoFullScans('get', f'/api/watchlists/{watchlist.pk}/movies/')
+        self.assertNoFullScans('get', f'/api/watchlists/{watchlist.pk}/contents/?limit=2')
+        self.assertNoFullScans('post', f'/api/watchlists/{watchlist.pk}/add_movie/', {'movieId': str(new_movie.pk)})
+        self.assertNoFullScans('post', f'/api/watchlists/{watchlist.pk}/move/',
+                               {'movieId': str(movies[0]), 'after': str(movies[-1])})
+        self.assertNoFullScans('post', f'/api/watchlists/{watchlist.pk}/bulk/', {'remove': [str(new_movie.pk)]})
+        created = self.assertNoFullScans('post', '/api/watchlists/', {'name': 'Plan', 'isPublic': False})
+        self.assertNoFullScans('patch', f"/api/watchlists/{created.data['id']}/", {'name': 'Plan 2'})
+        self.assertNoFullScans('delete', f"/api/watchlists/{created.data['id']}/")
+
+    def test_watchlist_movies(self):
+        watchlist = self.watchlist
+        movie = Movie.objects.exclude(movie_watchlists__watchlist=watchlist).first()
+        self.assertNoFullScans('get', '/api/watchlist-movies/')
+        self.assertNoFullScans('get', f'/api/watchlist-movies/?watchlist={watchlist.pk}')
+        self.assertNoFullScans('get', f'/api/watchlist-movies/?movie={self.movie.pk}')
+        self.assertNoFullScans('get', f'/api/watchlist-movies/by_watchlist/?watchlist={watchlist.pk}')
+        self.assertNoFullScans('get', f'/api/watchlist-movies/by_movie/?movie={self.movie.pk}')
+        created = self.assertNoFullScans('post', '/api/watchlist-movies/',
+                                         {'watchlistId': str(watchlist.pk), 'movieId': str(movie.pk)})
+        self.assertNoFullScans('delete', f"/api/watchlist-movies/{created.data['id']}/")
+
+    def test_ratings(self):
+        movie = Movie.objects.create(externalId=777777)
+        self.assertNoFullScans('get', '/api/ratings/')
+        self.assertNoFullScans('get', f'/api/ratings/?movie={self.movie.pk}')
+        self.assertNoFullScans('get', f'/api/ratings/?userId={self.other.pk}')
+        self.assertNoFullScans('get', f'/api/ratings/?userId={self.user.pk}&movie={self.movie.pk}')
+        created = self.assertNoFullScans('post', '/api/ratings/', {'movie_uuid': str(movie.pk), 'score': 4})
+        self.assertNoFullScans('patch', f"/api/ratings/{created.data['id']}/", {'score': 2})
+        self.assertNoFullScans('delete', f"/api/ratings/{created.data['id']}/")
+
+    def test_comments(self):
+        self.assertNoFullScans('get', '/api/comments/')
+        self.assertNoFullScans('get', f'/api/comments/?movie={self.movie.pk}')
+        self.assertNoFullScans('get', f'/api/comments/?userId={self.other.pk}')
+        self.assertNoFullScans('get', f'/api/comments/search/?q=great&movie={self.movie.pk}')
+        created = self.assertNoFullScans('post', '/api/comments/', {'movie_uuid': str(self.movie.pk), 'text': 'Plan'})
+        self.assertNoFullScans('patch', f"/api/comments/{created.data['id']}/", {'text': 'Plan 2'})
+        self.assertNoFullScans('delete', f"/api/comments/{created.data['id']}/")
+
+    def test_leaderboards_and_feed(self):
+        self.assertNoFullScans('get', '/api/leaderboards/top-rated/')
+        self.assertNoFullScans('get', '/api/leaderboards/most-listed/?window=7d')
+        self.assertNoFullScans('get', '/api/feed/')
+
+    def test_global_aggregates_are_full_scans(self):
+        # Lo que hacían los ETag de los listados: sin WHERE, pero recorre la tabla
+        sql = 'SELECT COUNT("comments"."id"), MAX("comments"."updatedAt") FROM "comments"'
+        self.assertEqual(full_scans(sql), ['SCAN comments'])
+        self.assertEqual(full_scans(sql, allowed=['comments']), [])
+
+    def test_composite_indexes(self):
+        # Las consultas para las que existen los índices compuestos los usan (y sin ordenar aparte)
+        comments = Comment.objects.filter(movie=self.movie).order_by('-createdAt', '-id')[:20]
+        self.assertEqual(queryset_plan(comments),
+                         ['SEARCH comments USING INDEX comments_movie_created_idx (movie_id=?)'])
+
+        histogram = Rating.objects.filter(movie=self.movie).values('score').order_by('score')
+        self.assertIn('ratings_movie_score_idx', ' '.join(queryset_plan(histogram)))
+
+        visible = ' '.join(queryset_plan(Watchlist.objects.visible_to(self.user)))
+        self.assertIn('MULTI-INDEX OR', visible)
+        self.assertIn('watchlists_public_idx', visible)
+
+
+# Contadores de relaciones de los leaderboards: los borrados en bloque y en
+# cascada descuentan todas las relaciones de una vez (remove_listings)
+class ListingCounterTests(TestCase):
+    def setUp(self):
+        self.client, self.user = api_client('lister')
+        self.movies = [Movie.objects.create(externalId=external_id) for external_id in range(1, 31)]
+        self.watchlist = Watchlist.objects.create(name='Lista', user=self.user)
+        self.bulk({'add': [str(movie.pk) for movie in self.movies]})
+
+    def bulk(self, data):
+        response = self.client.post(f'/api/watchlists/{self.watchlist.pk}/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def listings(self, movies=None):
+        rows = MovieActivity.objects.all() if movies is None else MovieActivity.objects.filter(movie__in=movies)
+        return rows.aggregate(total=Sum('listings'))['total']
+
+    def test_bulk_remove(self):
+        self.bulk({'remove': [str(movie.pk) for movie in self.movies[:10]]})
+        self.assertEqual(self.listings(), 20)
+        self.assertEqual(self.listings(self.movies[:10]), 0)
+
+    def test_bulk_replace(self):
+        self.bulk({'replace': [str(movie.pk) for movie in self.movies[:5]]})
+        self.assertEqual(self.listings(), 5)
+        self.assertEqual(self.listings(self.movies[:5]), 5)
+
+    def test_single_delete(self):
+        relation = WatchlistMovie.objects.get(watchlist=self.watchlist, movie=self.movies[0])
+        self.assertEqual(self.client.delete(f'/api/watchlist-movies/{relation.pk}/').status_code, 204)
+        self.assertEqual(self.listings(), 29)
+        self.assertEqual(self.listings(self.movies[:1]), 0)
+
+    def test_cascades(self):
+        other = Watchlist.objects.create(name='Otra', user=self.user)
+        WatchlistMovie.objects.create(watchlist=other, movie=self.movies[0])
+        self.assertEqual(self.client.delete(f'/api/watchlists/{self.watchlist.pk}/').status_code, 204)
+        self.assertEqual(self.listings(), 1)
+        self.user.delete()
+        self.assertEqual(self.listings(), 0)
+
+    def test_bulk_delete_is_set_based(self):
+        # Mismo número de consultas y una sola versión nueva de la watchlist para 5 o 20 relaciones
+        counts = []
+        for movies in (self.movies[:5], self.movies[5:25]):
+            version = Watchlist.objects.get(pk=self.watchlist.pk).version
+            with CaptureQueriesContext(connection) as queries:
+                self.bulk({'remove': [str(movie.pk) for movie in movies]})
+            counts.append(len(queries))
+            self.assertEqual(Watchlist.objects.get(pk=self.watchlist.pk).version, version + 1)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_movie_delete_touches_watchlists(self):
+        version = Watchlist.objects.get(pk=self.watchlist.pk).version
+        self.movies[0].delete()
+        self.assertEqual(Watchlist.objects.get(pk=self.watchlist.pk).version, version + 1)
+
+
+# Versiones de los modelos con ETag (VersionedModel)
+class VersionTests(TestCase):
+    def test_concurrent_saves_get_distinct_versions(self):
+        user = User.objects.create_user('versions')
+        watchlist = Watchlist.objects.create(name='Lista', user=user)
+        first, second = Watchlist.objects.get(pk=watchlist.pk), Watchlist.objects.get(pk=watchlist.pk)
+        first.name = 'Primera'
+        first.save()
+        second.name = 'Segunda'
+        second.save(update_fields=['name'])
+        self.assertEqual((first.version, second.version), (2, 3))
+        self.assertEqual(Watchlist.objects.get(pk=watchlist.pk).version, 3)
+
+    def test_patch_etag_follows_database_version(self):
+        client, user = api_client('etags')
+        watchlist = Watchlist.objects.create(name='Lista', user=user)
+        url = f'/api/watchlists/{watchlist.pk}/'
+        etag = client.get(url)['ETag']
+        # Otra escritura entre la lectura y el PATCH
+        Watchlist.touch(watchlist.pk)
+        response = client.patch(url, {'name': 'Nueva'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"watchlist-{watchlist.pk}-3"')
+        self.assertEqual(client.patch(url, {'name': 'Otra'}, format='json', HTTP_IF_MATCH=etag).status_code, 412)
+
+    def assertNoAggregates(self, queries):
+        self.assertFalse([query['sql'] for query in queries if 'COUNT(' in query['sql'] or 'MAX(' in query['sql']])
+
+    def test_list_etag_comes_from_the_page(self):
+        client, user = api_client('lists')
+        movie = Movie.objects.create(externalId=1)
+        comments = [Comment.objects.create(user=user, movie=movie, text=f'Comentario {n}') for n in range(3)]
+        url = '/api/comments/?page_size=2'
+        with CaptureQueriesContext(connection) as queries:
+            etag = client.get(url)['ETag']
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNoAggregates(queries)
+
+        # Otra página, otro tamaño, otros campos u otro formato son otra respuesta
+        cursor = client.get(url).data['next']
+        variants = [cursor, '/api/comments/?page_size=3', url + '&fields=id,text']
+        self.assertNotIn(etag, [client.get(variant)['ETag'] for variant in variants])
+        self.assertNotEqual(client.get(url, HTTP_ACCEPT='application/msgpack')['ETag'], etag)
+        self.assertIn('Accept', client.get(url)['Vary'])
+        self.assertNotIn('ETag', client.get(url + '&expand=movie'))
+
+        # Fuera de la página no cambia; dentro, sí
+        Comment.objects.filter(pk=comments[0].pk).update(text='Cambiado')
+        self.assertEqual(client.get(url)['ETag'], etag)
+        comments[2].text = 'Cambiado'
+        comments[2].save()
+        self.assertNotEqual(client.get(url)['ETag'], etag)
+
+    def test_watchlist_list_etag_uses_the_cached_page(self):
+        client, user = api_client('lists')
+        owner = User.objects.create_user('owner')
+        Watchlist.objects.create(name='Pública', user=owner)
+        private = Watchlist.objects.create(name='Privada', user=user, isPublic=False)
+        with CaptureQueriesContext(connection) as queries:
+            etag = client.get('/api/watchlists/')['ETag']
+            self.assertEqual(client.get('/api/watchlists/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNoAggregates(queries)
+
+        private.name = 'Renombrada'
+        private.save()
+        second = client.get('/api/watchlists/')['ETag']
+        self.assertNotEqual(second, etag)
+        # Un cambio en las públicas pasa a otra versión del listado en caché
+        with self.captureOnCommitCallbacks(execute=True):
+            Watchlist.objects.create(name='Otra pública', user=owner)
+        self.assertNotEqual(client.get('/api/watchlists/')['ETag'], second)
+
+
+# Lecturas en réplicas (api/routers.py) con dos réplicas SQLite en ficheros que
+# se copian del primario con manage.py replicate. Es un TransactionTestCase
+# porque dentro de una transacción todo se lee del primario
+@override_settings(REPLICATION={'REPLICAS': ['replica1', 'replica2'], 'CHECK_INTERVAL': 0, 'PIN_CACHE': 'default'})
+class ReplicaRoutingTests(TransactionTestCase):
+    replicas = ('replica1', 'replica2')
+
+    @classmethod
+    def setUpClass(cls):
+        # Los alias de las réplicas solo existen en estos tests: se añaden antes
+        # de que TransactionTestCase valide databases (el runner no los conoce)
+        directory = tempfile.mkdtemp()
+        for alias in cls.replicas:
+            connections.settings[alias] = {
+                **connections.settings['default'], 'NAME': os.path.join(directory, f'{alias}.sqlite3')
+            }
+        cls.databases = {'default', *cls.replicas}
+        cls.addClassCleanup(shutil.rmtree, directory, ignore_errors=True)
+        cls.addClassCleanup(cls.remove_aliases)
+        super().setUpClass()
+
+    @classmethod
+    def remove_aliases(cls):
+        for alias in cls.replicas:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+    def setUp(self):
+        replica_health.reset()
+        self.addCleanup(replica_health.reset)
+        cache.clear()
+        self.movie = Movie.objects.create(externalId=1)
+        self.writer, _ = api_client('writer')
+        self.reader, _ = api_client('reader')
+        call_command('replicate', stdout=StringIO())
+        # Escritura posterior a la copia: las réplicas no la tienen
+        Rating.objects.create(user=User.objects.create_user('late'), movie=self.movie, score=3)
+
+    def ratings(self, client):
+        """(ratings de la película que ve el cliente, si se han leído de una réplica)."""
+        with CaptureQueriesContext(connections['replica1']) as first, \
+                CaptureQueriesContext(connections['replica2']) as second:
+            response = client.get(f'/api/ratings/?movie={self.movie.pk}')
+        self.assertEqual(response.status_code, 200)
+        queries = first.captured_queries + second.captured_queries
+        return len(response.data['results']), any('FROM "ratings"' in query['sql'] for query in queries)
+
+    def test_reads_go_to_a_replica(self):
+        self.assertEqual(self.ratings(self.reader), (0, True))
+
+    def test_writer_reads_from_primary_after_writing(self):
+        other = Movie.objects.create(externalId=2)
+        response = self.writer.post('/api/ratings/', {'movie_uuid': str(other.pk), 'score': 5}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.ratings(self.writer), (1, False))
+        self.assertEqual(self.ratings(self.reader), (0, True))
+
+    def test_replica_without_heartbeat_is_not_used(self):
+        for alias in ('default', *self.replicas):
+            ReplicationHeartbeat.objects.using(alias).all().delete()
+        self.assertEqual(self.ratings(self.reader), (1, False))
+
+    def test_stalled_replica_is_not_used(self):
+        # manage.py replicate ha dejado de ejecutarse: ni el primario ni las réplicas laten
+        stalled = timezone.now() - timedelta(minutes=1)
+        for alias in ('default', *self.replicas):
+            ReplicationHeartbeat.objects.using(alias).update(beatAt=stalled)
+        self.assertEqual(self.ratings(self.reader), (1, False))
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        for alias in self.replicas:
+            settings_dict = connections[alias].settings_dict
+            connections[alias].close()
+            self.addCleanup(settings_dict.__setitem__, 'NAME', settings_dict['NAME'])
+            settings_dict['NAME'] = os.path.join(tempfile.gettempdir(), 'missing', 'replica.sqlite3')
+        response = self.reader.get(f'/api/ratings/?movie={self.movie.pk}')
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_pin_cache_must_be_shared(self):
+        self.assertEqual([error.id for error in replica_pin_cache_check(None)], ['api.E001'])
+        with override_settings(REPLICATION={'REPLICAS': ['replica1'], 'PIN_CACHE': 'shared'}):
+            self.assertEqual(replica_pin_cache_check(None), [])
+
+
+# Estadísticas de puntuación desnormalizadas (api/stats.py)
+class RatingStatsTests(TestCase):
+    def setUp(self):
+        self.client, self.user = api_client('critic')
+        self.other, _ = api_client('other')
+        self.movie = Movie.objects.create(externalId=1)
+
+    def rate(self, client, score):
+        response = client.post('/api/ratings/', {'movie_uuid': str(self.movie.pk), 'score': score}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def stats(self):
+        response = self.client.get(f'/api/movies/{self.movie.pk}/stats/')
+        self.assertEqual(response.status_code, 200)
+        return {key: response.data[key] for key in ('count', 'sum', 'mean', 'histogram')}
+
+    def test_stats_follow_ratings(self):
+        self.assertEqual(self.stats(), {'count': 0, 'sum': 0, 'mean': 0.0,
+                                        'histogram': {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0}})
+        mine = self.rate(self.client, 4)
+        theirs = self.rate(self.other, 2)
+        self.assertEqual(self.client.patch(f'/api/ratings/{mine}/', {'score': 5}, format='json').status_code, 200)
+        self.assertEqual(self.stats(), {'count': 2, 'sum': 7, 'mean': 3.5,
+                                        'histogram': {'1': 0, '2': 1, '3': 0, '4': 0, '5': 1}})
+        # Volver a puntuar la misma película actualiza el rating existente
+        self.rate(self.client, 1)
+        self.assertEqual(self.other.delete(f'/api/ratings/{theirs}/').status_code, 204)
+        self.assertEqual(self.stats(), {'count': 1, 'sum': 1, 'mean': 1.0,
+                                        'histogram': {'1': 1, '2': 0, '3': 0, '4': 0, '5': 0}})
+
+    def test_concurrent_first_rating(self):
+        # Otra petición crea el rating entre la lectura (sin fila que bloquear) y el INSERT
+        self.rate(self.client, 2)
+        first = QuerySet.first
+        with mock.patch.object(QuerySet, 'first', autospec=True,
+                               side_effect=lambda queryset: None if queryset.model is Rating else first(queryset)):
+            self.rate(self.client, 5)
+        self.assertEqual(Rating.objects.get(user=self.user, movie=self.movie).score, 5)
+        self.assertEqual(self.stats()['histogram'], {'1': 0, '2': 0, '3': 0, '4': 0, '5': 1})
+
+    def test_bulk_stats(self):
+        self.rate(self.client, 3)
+        unrated = Movie.objects.create(externalId=2)
+        ids = f'{self.movie.pk},{unrated.pk},{uuid7()}'
+        response = self.client.get(f'/api/movies/stats/?ids={ids}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({str(row['movieId']): row['count'] for row in response.data},
+                         {str(self.movie.pk): 1, str(unrated.pk): 0})
+        self.assertEqual(self.client.get('/api/movies/stats/?ids=nope').status_code, 400)
+        self.assertEqual(self.client.get('/api/movies/stats/').status_code, 400)
+
+    def test_rebuild_command(self):
+        self.rate(self.client, 4)
+        self.rate(self.other, 5)
+        expected = self.stats()
+        MovieRatingStats.objects.update(count=99, total=0, score4=0)
+        call_command('rebuild_rating_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), expected)
+
+
+# Servidor falso de TMDB: /movie/{id} devuelve {"id": id, "title": ...} para
+# los ids de movies, 404 para el resto y 500 para todo si failing está activo
+class FakeTMDBHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        external_id = int(self.path.split('?')[0].rsplit('/', 1)[-1])
+        server.requests.append(external_id)
+        if server.failing:
+            self.send_response(500)
+            self.end_headers()
+            return
+        if external_id not in server.movies:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps({'id': external_id, 'title': server.movies[external_id]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# Pasarela de TMDB (api/tmdb.py) y ?embed=tmdb contra el servidor falso
+class TMDBGatewayTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTMDBHandler)
+        cls.server.movies, cls.server.requests, cls.server.failing = {}, [], False
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        self.server.movies = {external_id: f'Película {external_id}' for external_id in range(1, 11)}
+        self.server.requests = []
+        self.server.failing = False
+        self.enterContext(override_settings(TMDB={
+            'BASE_URL': f'http://127.0.0.1:{self.server.server_port}',
+            'TTL': 60,
+            'MAX_ENTRIES': 3,
+            'TOUCH_INTERVAL': 0,
+            'TIMEOUT': 2,
+        }))
+        reset_gateway()
+        self.addCleanup(reset_gateway)
+
+    def expire(self, *external_ids):
+        TmdbMovieCache.objects.filter(externalId__in=external_ids).update(
+            fetchedAt=timezone.now() - timedelta(seconds=61)
+        )
+
+    def test_cached_until_ttl(self):
+        self.assertEqual(get_gateway().get(1), {'id': 1, 'title': 'Película 1'})
+        self.assertEqual(get_gateway().get(1), {'id': 1, 'title': 'Película 1'})
+        self.assertEqual(self.server.requests, [1])
+
+        self.server.movies[1] = 'Título nuevo'
+        self.expire(1)
+        self.assertEqual(get_gateway().get(1)['title'], 'Título nuevo')
+        self.assertEqual(self.server.requests, [1, 1])
+
+    def test_unknown_movie(self):
+        self.assertIsNone(get_gateway().get(404))
+        self.assertFalse(TmdbMovieCache.objects.filter(externalId=404).exists())
+
+    def test_stale_entry_served_when_tmdb_fails(self):
+        get_gateway().get_many([1, 2])
+        self.expire(1)
+        self.server.failing = True
+        self.assertEqual(get_gateway().get_many([1, 2, 3]), {
+            1: {'id': 1, 'title': 'Película 1'},
+            2: {'id': 2, 'title': 'Película 2'},
+        })
+        # Las entradas caducadas se vuelven a pedir en cuanto TMDB responda
+        self.assertEqual(sorted(self.server.requests), [1, 1, 2, 3])
+
+    def test_evicts_least_recently_used(self):
+        get_gateway().get_many([1, 2, 3])
+        now = timezone.now()
+        for external_id, age in ((1, 10), (2, 30), (3, 20)):
+            TmdbMovieCache.objects.filter(externalId=external_id).update(lastAccessedAt=now - timedelta(seconds=age))
+        get_gateway().get(4)
+        self.assertEqual(set(TmdbMovieCache.objects.values_list('externalId', flat=True)), {1, 3, 4})
+
+    def test_embed_tmdb(self):
+        client, user = api_client('embedder')
+        movie = Movie.objects.create(externalId=1)
+        self.assertEqual(client.get(f'/api/movies/{movie.pk}/?embed=tmdb').data['tmdb']['title'], 'Película 1')
+
+        watchlist = Watchlist.objects.create(name='Lista', user=user)
+        for external_id in (1, 2, 404):
+            WatchlistMovie.objects.create(watchlist=watchlist, movie=Movie.objects.get_or_create(externalId=external_id)[0])
+        for url in (f'/api/watchlists/{watchlist.pk}/contents/', f'/api/async/watchlists/{watchlist.pk}/contents/'):
+            with self.subTest(url=url):
+                data = streamed_json(client.get(url + '?embed=tmdb'))
+                self.assertEqual([item['tmdb'] and item['tmdb']['title'] for item in data['results']],
+                                 ['Película 1', 'Película 2', None])
+                # Sin embed no hay clave tmdb
+                data = streamed_json(client.get(url))
+                self.assertNotIn('tmdb', data['results'][0])
+
+    def test_embed_tmdb_caps_page_size(self):
+        client, user = api_client('embedder')
+        watchlist = Watchlist.objects.create(name='Lista', user=user)
+        for external_id in range(1, 6):
+            WatchlistMovie.objects.create(watchlist=watchlist, movie=Movie.objects.create(externalId=external_id))
+        with mock.patch.object(WatchlistViewSet, 'contents_tmdb_max_page_size', 2):
+            for url in (f'/api/watchlists/{watchlist.pk}/contents/', f'/api/async/watchlists/{watchlist.pk}/contents/'):
+                with self.subTest(url=url):
+                    data = streamed_json(client.get(url + '?limit=5000&embed=tmdb'))
+                    self.assertEqual(len(data['results']), 2)
+                    self.assertIsNotNone(data['next'])
+                    data = streamed_json(client.get(url + '?limit=5000'))
+                    self.assertEqual(len(data['results']), 5)
+
+
+# Películas similares (api/similarity.py) y recomendaciones (api/recommendations.py).
+# Las similitudes se comparan con un coseno calculado a mano sobre ratings centrados
+@override_settings(SIMILARITY={'MIN_SUPPORT': 1, 'SHRINKAGE': 0})
+class SimilarityTests(TestCase):
+    ratings = {
+        'ana': {1: 5, 2: 4, 3: 1, 5: 4},
+        'bea': {1: 4, 2: 5, 3: 2},
+        'carlos': {1: 1, 3: 5, 5: 2},
+        'dani': {2: 2, 3: 4, 5: 5},
+        'eva': {4: 3},
+    }
+
+    def setUp(self):
+        self.ratings = {username: dict(scores) for username, scores in self.ratings.items()}
+        self.movies = {external_id: Movie.objects.create(externalId=external_id) for external_id in range(1, 6)}
+        self.users = {username: User.objects.create_user(username) for username in self.ratings}
+        for username, scores in self.ratings.items():
+            for external_id, score in scores.items():
+                self.rate(self.users[username], external_id, score)
+
+    def rate(self, user, external_id, score):
+        movie = self.movies[external_id]
+        Rating.objects.create(user=user, movie=movie, score=score)
+        apply_rating_change(movie.id, None, score)
+
+    def expected(self, shrinkage=0):
+        """{(película, vecina): (similitud, usuarios en común)} con coseno sobre ratings centrados."""
+        centered = {}
+        for username, scores in self.ratings.items():
+            mean = sum(scores.values()) / len(scores)
+            for external_id, score in scores.items():
+                centered.setdefault(external_id, {})[username] = score - mean
+        pairs = {}
+        for movie, vector in centered.items():
+            for neighbor, other in centered.items():
+                common = vector.keys() & other.keys()
+                norms = sum(v * v for v in vector.values()) ** 0.5 * sum(v * v for v in other.values()) ** 0.5
+                if movie == neighbor or not common or not norms:
+                    continue
+                score = sum(vector[user] * other[user] for user in common) / norms
+                score *= len(common) / (len(common) + shrinkage)
+                if score > 0:
+                    pairs[(movie, neighbor)] = (score, len(common))
+        return pairs
+
+    def stored(self):
+        return {
+            (movie, neighbor): (score, support) for movie, neighbor, score, support
+            in MovieSimilarity.objects.values_list('movie__externalId', 'neighbor__externalId', 'score', 'support')
+        }
+
+    def assertSimilarities(self, expected, movie=None):
+        stored = {pair: value for pair, value in self.stored().items() if movie in (None, pair[0])}
+        self.assertEqual(stored.keys(), expected.keys())
+        for pair, (score, support) in expected.items():
+            self.assertAlmostEqual(stored[pair][0], score, places=5, msg=pair)
+            self.assertEqual(stored[pair][1], support, pair)
+
+    def test_cosine_on_centered_ratings(self):
+        for shrinkage in (0, 10):
+            with self.subTest(shrinkage=shrinkage), self.settings(SIMILARITY={'MIN_SUPPORT': 1, 'SHRINKAGE': shrinkage}):
+                compute_similarities(full=True)
+                expected = self.expected(shrinkage)
+                self.assertGreater(len(expected), 2)
+                self.assertSimilarities(expected)
+        # Un único rating queda a cero al centrarlo: la película no tiene vecinos
+        self.assertFalse(MovieSimilarity.objects.filter(movie=self.movies[4]).exists())
+
+    def test_incremental_recompute(self):
+        self.assertEqual(compute_similarities(), 5)
+        self.assertFalse(MovieRatingStats.objects.filter(similarAt__isnull=True).exists())
+        self.assertEqual(compute_similarities(), 0)
+        computed = dict(MovieSimilarity.objects.values_list('movie__externalId', 'computedAt'))
+
+        # Solo se recalcula la película con ratings posteriores a su similarAt
+        self.ratings['eva'][1] = 5
+        self.rate(self.users['eva'], 1, 5)
+        self.assertEqual(compute_similarities(), 1)
+        recomputed = dict(MovieSimilarity.objects.values_list('movie__externalId', 'computedAt'))
+        self.assertGreater(recomputed.pop(1), computed.pop(1))
+        self.assertEqual(recomputed, computed)
+        stats = MovieRatingStats.objects.get(movie=self.movies[1])
+        self.assertGreater(stats.similarAt, stats.changedAt)
+        # Sus vecinos ya tienen en cuenta el rating nuevo
+        self.assertSimilarities({pair: value for pair, value in self.expected().items() if pair[0] == 1}, movie=1)
+
+    def test_load_limit(self):
+        with self.settings(SIMILARITY={'MAX_RATINGS': 5}):
+            with self.assertRaisesMessage(CommandError, 'MAX_RATINGS'):
+                call_command('compute_similarities', '--full', stdout=StringIO())
+        self.assertFalse(MovieSimilarity.objects.exists())
+
+    def test_recommendations(self):
+        client, user = api_client('viewer')
+        rated, disliked, liked, mixed, unrelated = (Movie.objects.create(externalId=external_id) for external_id in range(10, 15))
+        Rating.objects.create(user=user, movie=rated, score=5)
+        Rating.objects.create(user=user, movie=disliked, score=1)
+        now = timezone.now()
+        for movie, neighbor, score in ((rated, liked, 0.8), (disliked, liked, 0.1), (rated, mixed, 0.2),
+                                       (disliked, mixed, 0.9), (rated, unrelated, 0.3), (rated, disliked, 0.5)):
+            MovieSimilarity.objects.create(movie=movie, neighbor=neighbor, score=score, support=2, computedAt=now)
+
+        # Las ya puntuadas no se recomiendan y las que se parecen más a las que no gustan quedan fuera
+        response = client.get('/api/users/me/recommendations/')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([row['externalId'] for row in results], [12, 14])
+        self.assertAlmostEqual(results[0]['score'], 2 * 0.8 - 2 * 0.1)
+        self.assertEqual(results[0]['because'], {'movieId': rated.pk, 'externalId': 10})
+        self.assertEqual(len(client.get('/api/users/me/recommendations/?limit=1').data['results']), 1)
+        self.assertEqual(client.get('/api/users/me/recommendations/?limit=0').status_code, 400)
+        self.assertEqual(APIClient().get('/api/users/me/recommendations/').status_code, 401)
+
+        # Sin ratings no hay recomendaciones
+        newcomer, _ = api_client('newcomer')
+        self.assertEqual(newcomer.get('/api/users/me/recommendations/').data['results'], [])
+
+# ?fields= y ?expand= (api/fieldsets.py): la forma de la respuesta y las
+# columnas y JOINs de la consulta que la genera
+class SparseFieldsetsTests(TestCase):
+    def setUp(self):
+        self.client, self.user = api_client('sparse')
+        self.movie = Movie.objects.create(externalId=1)
+        self.comment = Comment.objects.create(user=self.user, movie=self.movie, text='Comentario')
+
+    def comments(self, query, client=None):
+        return (client or self.client).get(f'/api/comments/?movie={self.movie.pk}&{query}')
+
+    def test_fields(self):
+        response = self.comments('fields=id, text')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [{'id': str(self.comment.pk), 'text': 'Comentario'}])
+        # Sin ?fields= la forma completa, sin los campos de solo escritura
+        self.assertEqual(set(self.comments('').data['results'][0]),
+                         {'id', 'userId', 'username', 'movieId', 'text', 'createdAt'})
+        # Las escrituras ignoran ?fields=
+        response = self.client.post('/api/comments/?fields=id', {'movie_uuid': str(self.movie.pk), 'text': 'Otro'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('text', response.data)
+
+    def test_expand(self):
+        row = self.comments('expand=user,movie').data['results'][0]
+        self.assertEqual(row['user'], {'id': self.user.pk, 'username': 'sparse'})
+        self.assertEqual(row['movie'], {'id': str(self.movie.pk), 'externalId': 1})
+        self.assertEqual(row['movieId'], str(self.movie.pk))
+        # ?fields= no quita los objetos expandidos
+        self.assertEqual(set(self.comments('fields=id&expand=movie').data['results'][0]), {'id', 'movie'})
+
+    def test_unknown_names(self):
+        for query, error in (('fields=id,nope', 'Unknown fields: nope'), ('fields=movie_uuid', 'Unknown fields: movie_uuid'),
+                             ('expand=user,watchlist', 'Unknown expand: watchlist')):
+            for url in (f'/api/comments/?movie={self.movie.pk}&{query}', f'/api/async/comments/?movie={self.movie.pk}&{query}'):
+                with self.subTest(url=url):
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(json.loads(response.content), {'error': error})
+
+    def test_shape_queryset(self):
+        def shaped(**options):
+            queryset = shape_queryset(Comment.objects.all(), CommentSerializer(**options), ('createdAt',))
+            return queryset.query.deferred_loading, queryset.query.select_related
+
+        self.assertEqual(shaped(fields=['id', 'text']), ((frozenset({'id', 'text', 'createdAt'}), False), False))
+        self.assertEqual(shaped(fields=['id', 'username']),
+                         ((frozenset({'id', 'user__username', 'createdAt'}), False), {'user': {}}))
+        only, related = shaped(fields=['id'], expand=['movie', 'user'])
+        self.assertEqual(only, (frozenset({'id', 'createdAt', 'movie__id', 'movie__externalId', 'user__id', 'user__username'}), False))
+        self.assertEqual(related, {'movie': {}, 'user': {}})
+
+    def test_queries(self):
+        def list_sql(query):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.comments(query).status_code, 200)
+            return [item['sql'] for item in queries if 'FROM "comments"' in item['sql']]
+
+        sql, = list_sql('fields=id')
+        self.assertNotIn('"comments"."text"', sql)
+        self.assertNotIn('JOIN', sql)
+        sql, = list_sql('fields=id,username')
+        self.assertIn('"auth_user"."username"', sql)
+        self.assertNotIn('"auth_user"."password"', sql)
+
+        # Los objetos expandidos llegan en la misma consulta, sea cual sea el número de filas
+        with CaptureQueriesContext(connection) as one:
+            self.comments('expand=user,movie')
+        for n in range(5):
+            Comment.objects.create(user=User.objects.create_user(f'other{n}'), movie=self.movie, text=f'Comentario {n}')
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(len(self.comments('expand=user,movie').data['results']), 6)
+        self.assertEqual(len(many), len(one))
+
+# Formatos de respuesta (api/renderers.py) y compresión (CompressionMiddleware)
+@override_settings(COMPRESSION={'MIN_SIZE': 200})
+class RenderingTests(TestCase):
+    def setUp(self):
+        self.client, self.user = api_client('renders')
+        self.movie = Movie.objects.create(externalId=1)
+        for n in range(10):
+            Comment.objects.create(user=self.user, movie=self.movie, text=f'Comentario número {n} \u2028')
+        self.url = f'/api/comments/?movie={self.movie.pk}'
+
+    def test_json_matches_drf(self):
+        data = {
+            'id': uuid.UUID('01890a5d-ac96-774b-bcce-b302099a8057'),
+            'utc': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            'madrid': datetime(2024, 5, 1, 14, 30, tzinfo=dt_timezone(timedelta(hours=2))),
+            'naive': datetime(2024, 5, 1, 12, 30),
+            'day': date(2024, 5, 1),
+            'decimal': Decimal('4.50'),
+            'text': 'Película \u2028 \u2029 "citas"',
+            'numbers': [0.1, 1, -3, None, True],
+            'nested': {'duration': timedelta(minutes=90), 'ids': (uuid.UUID(int=1),)},
+        }
+        expected = JSONRenderer().render(data)
+        self.assertEqual(dumps(data), expected)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        # Sin orjson se usa el json de la biblioteca estándar con el mismo resultado
+        with mock.patch('api.renderers.orjson', None):
+            self.assertEqual(dumps(data), expected)
+
+    @unittest.skipIf(msgpack is None, 'msgpack no está instalado')
+    def test_msgpack(self):
+        expected = json.loads(self.client.get(self.url).content)
+        for url, headers in ((self.url, {'HTTP_ACCEPT': 'application/msgpack'}), (self.url + '&format=msgpack', {})):
+            with self.subTest(url=url, headers=headers):
+                response = self.client.get(url, **headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'application/msgpack')
+                self.assertEqual(msgpack.unpackb(response.content), expected)
+
+        body = msgpack.packb({'movie_uuid': str(self.movie.pk), 'text': 'En msgpack'})
+        response = self.client.post('/api/comments/', body, content_type='application/msgpack',
+                                    HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content)['text'], 'En msgpack')
+
+    def decompress(self, response):
+        content = streamed_content(response) if response.streaming else response.content
+        if response.get('Content-Encoding') == 'br':
+            return brotli.decompress(content)
+        if response.get('Content-Encoding') == 'gzip':
+            return gzip.decompress(content)
+        return content
+
+    def test_compression(self):
+        plain = self.client.get(self.url).content
+        cases = [('gzip', 'gzip'), ('gzip, deflate, br', 'br' if brotli else 'gzip'), ('br;q=0, gzip', 'gzip'),
+                 ('*', 'gzip'), ('identity', None), ('gzip;q=0', None), ('', None)]
+        for accept_encoding, encoding in cases:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.client.get(self.url, HTTP_ACCEPT_ENCODING=accept_encoding)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertEqual(self.decompress(response), plain)
+                if encoding:
+                    self.assertTrue(response['ETag'].startswith('W/"'))
+                    self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+        # Las respuestas de menos de MIN_SIZE bytes se envían sin comprimir
+        with self.settings(COMPRESSION={'MIN_SIZE': len(plain) + 1}):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, plain)
+
+    def test_streaming_compression(self):
+        watchlist = Watchlist.objects.create(name='Lista', user=self.user)
+        for external_id in range(10, 30):
+            WatchlistMovie.objects.create(watchlist=watchlist, movie=Movie.objects.create(externalId=external_id))
+        for url in (f'/api/watchlists/{watchlist.pk}/contents/', f'/api/async/watchlists/{watchlist.pk}/contents/'):
+            with self.subTest(url=url):
+                plain = streamed_json(self.client.get(url))
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertFalse(response.has_header('Content-Length'))
+                self.assertEqual(json.loads(gzip.decompress(streamed_content(response))), plain)
+
+# Caché de tokens por proceso (api/authentication.py) y su invalidación por señales
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.client, self.user = api_client('cached')
+        self.token = Token.objects.get(user=self.user)
+
+    def status(self, client=None):
+        """(síncrona, async) del mismo endpoint con el cliente dado."""
+        client = client or self.client
+        return (client.get('/api/movies/stats/', {'ids': str(uuid7())}).status_code,
+                client.get('/api/async/movies/stats/', {'ids': str(uuid7())}).status_code)
+
+    def test_cached(self):
+        self.assertEqual(self.status(), (200, 200))
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedTokenAuthentication().authenticate_credentials(self.token.key)[0], self.user)
+        self.assertEqual(token_cache.stats()['size'], 1)
+
+    def test_deleted_token(self):
+        self.assertEqual(self.status(), (200, 200))
+        # Otra petición vuelve a cachear el token entre el borrado y el commit:
+        # la invalidación tras el commit lo descarta igualmente
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+            token_cache.set(self.token.key, self.user, self.token)
+        self.assertEqual(token_cache.stats()['size'], 0)
+        self.assertEqual(self.status(), (401, 401))
+
+    def test_regenerated_token(self):
+        self.assertEqual(self.status(), (200, 200))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+            new = Token.objects.create(user=self.user)
+        self.assertEqual(self.status(), (401, 401))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {new.key}')
+        self.assertEqual(self.status(client), (200, 200))
+
+    def test_deactivated_user(self):
+        self.assertEqual(self.status(), (200, 200))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.status(), (401, 401))
+
+    def test_revoked_in_another_process(self):
+        # Un borrado sin señales en este proceso (otro worker) se ve al caducar la entrada
+        self.assertEqual(self.status(), (200, 200))
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM authtoken_token WHERE key = %s', [self.token.key])
+        self.assertEqual(self.status(), (200, 200))
+        later = time.monotonic() + token_cache.ttl + 1
+        with mock.patch('api.authentication.time.monotonic', return_value=later):
+            self.assertEqual(self.status(), (401, 401))
+
+# Una película por id de TMDB: la migración 0004 fusiona los duplicados que
+# había antes de la restricción única de 0005 y ensure() no los vuelve a crear
+class MovieExternalIdTests(TransactionTestCase):
+    before, after = [('api', '0003_cursor_pagination_indexes')], [('api', '0005_unique_movie_external_id')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_merge_duplicates_migration(self):
+        self.addCleanup(call_command, 'migrate', verbosity=0, stdout=StringIO())
+        apps = self.migrate(self.before)
+        Movie, Rating, Comment = (apps.get_model('api', name) for name in ('Movie', 'Rating', 'Comment'))
+        Watchlist, WatchlistMovie = apps.get_model('api', 'Watchlist'), apps.get_model('api', 'WatchlistMovie')
+        ana, bea, carlos = (apps.get_model('auth', 'User').objects.create(username=name) for name in ('ana', 'bea', 'carlos'))
+        first, second = (Watchlist.objects.create(name=name, user=ana) for name in ('Primera', 'Segunda'))
+
+        # La copia con más filas asociadas (few) es la que se conserva
+        few, many, lists = (Movie.objects.create(externalId=7) for _ in range(3))
+        other = Movie.objects.create(externalId=8)
+        Rating.objects.create(user=ana, movie=few, score=1)
+        Comment.objects.create(user=ana, movie=few, text='En la primera copia')
+        Rating.objects.create(user=ana, movie=many, score=5)
+        Rating.objects.create(user=bea, movie=many, score=4)
+        Comment.objects.create(user=bea, movie=many, text='En la segunda copia')
+        WatchlistMovie.objects.create(watchlist=first, movie=many)
+        Rating.objects.create(user=carlos, movie=lists, score=3)
+        WatchlistMovie.objects.create(watchlist=first, movie=lists)
+        WatchlistMovie.objects.create(watchlist=second, movie=lists)
+        Rating.objects.create(user=bea, movie=other, score=2)
+
+        apps = self.migrate(self.after)
+        Movie, Rating, Comment = (apps.get_model('api', name) for name in ('Movie', 'Rating', 'Comment'))
+        WatchlistMovie, MovieRatingStats = apps.get_model('api', 'WatchlistMovie'), apps.get_model('api', 'MovieRatingStats')
+        self.assertEqual(sorted(Movie.objects.values_list('externalId', 'id')), [(7, many.id), (8, other.id)])
+        self.assertEqual(set(Comment.objects.values_list('movie_id', flat=True)), {many.id})
+        self.assertEqual(Comment.objects.count(), 2)
+        # Un rating por usuario: el de la copia conservada gana al de la duplicada
+        self.assertEqual(sorted(Rating.objects.filter(movie_id=many.id).values_list('user__username', 'score')),
+                         [('ana', 5), ('bea', 4), ('carlos', 3)])
+        self.assertEqual(Rating.objects.filter(movie_id=other.id).count(), 1)
+        # Una relación por watchlist
+        self.assertEqual(sorted(WatchlistMovie.objects.values_list('watchlist__name', 'movie_id')),
+                         [('Primera', many.id), ('Segunda', many.id)])
+        stats = MovieRatingStats.objects.get(movie_id=many.id)
+        self.assertEqual((stats.count, stats.total, stats.score1, stats.score3, stats.mean), (3, 12, 0, 1, 4.0))
+        # La restricción única ya está en su sitio
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Movie.objects.create(externalId=7)
+
+    def test_ensure_is_idempotent(self):
+        client, _ = api_client('ensurer')
+        response = client.put('/api/movies/by-external/42/')
+        self.assertEqual(response.status_code, 201)
+        movie = Movie.objects.get(externalId=42)
+        # Una sola sentencia, sin lectura previa que pueda quedarse vieja
+        with self.assertNumQueries(1):
+            self.assertEqual(Movie.objects.ensure(42), (movie, False))
+        repeated = client.put('/api/movies/by-external/42/')
+        self.assertEqual(repeated.status_code, 200)
+        self.assertEqual(repeated.data, response.data)
+        self.assertEqual(Movie.objects.filter(externalId=42).count(), 1)
+
+    def test_ensure_concurrently(self):
+        # Otra petición inserta la película justo antes que esta: el INSERT
+        # ... ON CONFLICT devuelve su fila en vez de fallar o duplicarla
+        other = Movie.objects.create(externalId=42)
+        self.assertEqual(Movie.objects.ensure(42), (other, False))
+
+        # Sin ON CONFLICT se usa get_or_create, que también resuelve la carrera
+        # entre su lectura y su INSERT volviendo a leer la fila de la otra petición
+        get = QuerySet.get
+
+        def get_after_concurrent_insert(queryset, *args, **kwargs):
+            if queryset.model is Movie and not Movie.objects.filter(externalId=43).exists():
+                Movie.objects.bulk_create([Movie(externalId=43)])
+                raise Movie.DoesNotExist
+            return get(queryset, *args, **kwargs)
+
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(QuerySet, 'get', autospec=True, side_effect=get_after_concurrent_insert):
+            movie, created = Movie.objects.ensure(43)
+        self.assertFalse(created)
+        self.assertEqual(movie, Movie.objects.get(externalId=43))
+        self.assertEqual(Movie.objects.filter(externalId__in=[42, 43]).count(), 2)
+
+# Métricas por ruta (api/metrics.py y MetricsMiddleware) y acceso a /api/metrics
+class MetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        self.client, self.user = api_client('measured')
+        self.movie = Movie.objects.create(externalId=1)
+
+    def samples(self):
+        """{(nombre, etiquetas): valor} de la exportación en texto de Prometheus."""
+        samples = {}
+        for line in registry.render().splitlines():
+            if line.startswith('#'):
+                continue
+            series, value = line.rsplit(' ', 1)
+            name, _, labels = series.partition('{')
+            samples[(name, tuple(re.findall(r'(\w+)="([^"]*)"', labels)))] = float(value)
+        return samples
+
+    def metric(self, name, route, method='GET', **labels):
+        return self.samples()[(name, (('route', route), ('method', method), *labels.items()))]
+
+    def buckets(self, name, route):
+        return [value for (sample, labels), value in self.samples().items()
+                if sample == f'{name}_bucket' and ('route', route) in labels]
+
+    def test_counts_requests_per_route(self):
+        url = f'/api/movies/{self.movie.pk}/stats/'
+        with CaptureQueriesContext(connection) as queries:
+            responses = [self.client.get(url), self.client.get(url), self.client.get(f'/api/movies/{uuid7()}/stats/')]
+
+        self.assertEqual(self.metric('api_requests_total', 'movie-stats', status='200'), 2)
+        self.assertEqual(self.metric('api_requests_total', 'movie-stats', status='404'), 1)
+        # Cada histograma tiene una observación por petición
+        for name in ('api_request_duration_seconds', 'api_request_sql_queries',
+                     'api_request_sql_duration_seconds', 'api_response_size_bytes'):
+            with self.subTest(name=name):
+                self.assertEqual(self.metric(f'{name}_count', 'movie-stats'), 3)
+                buckets = self.buckets(name, 'movie-stats')
+                self.assertEqual(buckets, sorted(buckets))
+                self.assertEqual(buckets[-1], 3)
+        self.assertEqual(self.metric('api_request_sql_queries_sum', 'movie-stats'), len(queries))
+        self.assertGreater(self.metric('api_request_sql_duration_seconds_sum', 'movie-stats'), 0)
+        self.assertGreaterEqual(self.metric('api_request_duration_seconds_sum', 'movie-stats'),
+                                self.metric('api_request_sql_duration_seconds_sum', 'movie-stats'))
+        self.assertEqual(self.metric('api_response_size_bytes_sum', 'movie-stats'),
+                         sum(len(response.content) for response in responses))
+        # Las que no resuelven ninguna ruta van juntas
+        self.client.get('/api/no-existe/')
+        self.assertEqual(self.metric('api_requests_total', 'unmatched', status='404'), 1)
+
+    def test_streaming_responses(self):
+        watchlist = Watchlist.objects.create(name='Lista', user=self.user)
+        for external_id in range(10, 15):
+            WatchlistMovie.objects.create(watchlist=watchlist, movie=Movie.objects.create(externalId=external_id))
+        for url, route in ((f'/api/watchlists/{watchlist.pk}/contents/', 'watchlist-contents'),
+                           (f'/api/async/watchlists/{watchlist.pk}/contents/', 'async-watchlist-contents')):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                # Se registran al terminar de enviarse, con las consultas hechas durante el envío
+                self.assertNotIn(('api_requests_total', (('route', route), ('method', 'GET'), ('status', '200'))),
+                                 self.samples())
+                with CaptureQueriesContext(connection) as queries:
+                    size = len(streamed_content(response))
+                self.assertEqual(self.metric('api_requests_total', route, status='200'), 1)
+                self.assertEqual(self.metric('api_response_size_bytes_sum', route), size)
+                self.assertGreaterEqual(self.metric('api_request_sql_queries_sum', route), max(len(queries), 1))
+
+    def test_histogram_bounds(self):
+        histogram = Histogram(QUERY_BUCKETS)
+        for value in (0, 1, 3, 1000):
+            histogram.observe(value)
+        cumulative = dict(histogram.cumulative())
+        # Los límites son inclusivos (le): 1 cuenta en el bucket 1
+        self.assertEqual((cumulative[0], cumulative[1], cumulative[2], cumulative[5], cumulative['+Inf']), (1, 2, 2, 3, 4))
+        self.assertEqual((histogram.count, histogram.sum), (4, 1004))
+
+    def test_access(self):
+        anonymous, staff = APIClient(), APIClient()
+        user = User.objects.create_user('admin', is_staff=True)
+        staff.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        remote = {'REMOTE_ADDR': '10.0.0.1'}
+        with self.settings(API_METRICS_ALLOWED_IPS=['127.0.0.1']):
+            # El cliente de pruebas llega desde 127.0.0.1
+            response = anonymous.get('/api/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+            self.assertEqual(anonymous.get('/api/metrics', **remote).status_code, 403)
+            self.assertEqual(self.client.get('/api/metrics', **remote).status_code, 403)
+            self.assertEqual(staff.get('/api/metrics', **remote).status_code, 200)
+        with self.settings(API_METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(anonymous.get('/api/metrics').status_code, 403)
+            self.assertEqual(staff.get('/api/metrics').status_code, 200)
+
+# Listado de watchlists públicas cacheado por versión (api/caching.py). Cada
+# proceso tiene su caché local de páginas; la versión va en la compartida
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pages'},
+        'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'versions'},
+    },
+    PUBLIC_WATCHLISTS_VERSION_CACHE='shared',
+)
+class PublicWatchlistsCacheTests(TestCase):
+    def setUp(self):
+        self.client, self.user = api_client('reader')
+        self.owner = User.objects.create_user('owner')
+
+    def listing(self, url='/api/watchlists/'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_bumped_once_per_transaction(self):
+        version = public_watchlists_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for index in range(3):
+                    Watchlist.objects.create(name=f'Lista {index}', user=self.owner, isPublic=True)
+        self.assertEqual(public_watchlists_version(), version + 1)
+
+    def test_rolled_back_transaction_does_not_hide_later_changes(self):
+        version = public_watchlists_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ZeroDivisionError), transaction.atomic():
+                Watchlist.objects.create(name='Deshecha', user=self.owner, isPublic=True)
+                1 / 0
+            self.assertEqual(public_watchlists_version(), version)
+            Watchlist.objects.create(name='Confirmada', user=self.owner, isPublic=True)
+        self.assertEqual(public_watchlists_version(), version + 1)
+
+    def test_version_is_shared_between_processes(self):
+        watchlist = Watchlist.objects.create(name='Antes', user=self.owner, isPublic=True)
+        self.assertEqual([row['name'] for row in self.listing()['results']], ['Antes'])
+        # Otro proceso cambia la watchlist: su caché local no es la nuestra, pero la versión sí
+        Watchlist.objects.filter(pk=watchlist.pk).update(name='Después')
+        caches['shared'].incr(PUBLIC_WATCHLISTS_VERSION_KEY)
+        self.assertEqual([row['name'] for row in self.listing()['results']], ['Después'])
+
+    def test_private_watchlists_do_not_overflow_the_page(self):
+        expected = []
+        for index in range(4):
+            expected.append(Watchlist.objects.create(name=f'Pública {index}', user=self.owner, isPublic=True).pk)
+            expected.extend(Watchlist.objects.create(name=f'Privada {index}.{n}', user=self.user, isPublic=False).pk for n in range(2))
+        Watchlist.objects.create(name='Ajena', user=self.owner, isPublic=False)
+
+        seen, url = [], '/api/watchlists/?page_size=3'
+        while url:
+            page = self.listing(url)
+            self.assertLessEqual(len(page['results']), 3)
+            seen.extend(uuid.UUID(row['id']) for row in page['results'])
+            url = page['next']
+        self.assertEqual(seen, expected)
+
+    def test_version_cache_check(self):
+        self.assertEqual([error.id for error in public_watchlists_version_cache_check(None)], ['api.W002'])
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/unused'}
+        with override_settings(CACHES={**settings.CACHES, 'shared': shared}):
+            self.assertEqual(public_watchlists_version_cache_check(None), [])
+
+
+# Posiciones ordenables de api/ranking.py
+class RankingTests(SimpleTestCase):
+    def test_between(self):
+        self.assertEqual(between(None, None), FIRST)
+        self.assertLess(between(None, FIRST), FIRST)
+        self.assertGreater(between(FIRST, None), FIRST)
+        for lower, upper in (('a', 'b'), ('a', 'a1'), ('az', 'b'), ('a0001', 'a0002'), ('', '01'), ('zz', 'zz1')):
+            with self.subTest(lower=lower, upper=upper):
+                self.assertTrue(lower < between(lower or None, upper) < upper)
+        with self.assertRaises(ValueError):
+            midpoint('b', 'a')
+        with self.assertRaises(ValueError):
+            midpoint('a', 'a')
+
+    def test_repeated_inserts_stay_ordered(self):
+        # Insertar siempre en el mismo hueco es el peor caso: la posición crece
+        # un carácter cada pocas inserciones, pero nunca se rompe el orden
+        keys = [between(None, None)]
+        keys.append(between(keys[0], None))
+        for _ in range(200):
+            keys.insert(1, between(keys[0], keys[1]))
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertLess(max(map(len, keys)), MAX_LENGTH)
+        self.assertFalse(any(key.endswith('0') for key in keys))
+
+    def test_spread(self):
+        for n in (0, 1, 2, 10, 1000, 100000):
+            with self.subTest(n=n):
+                keys = spread(n)
+                self.assertEqual(len(keys), n)
+                self.assertEqual(keys, sorted(set(keys)))
+                if keys:
+                    # Queda sitio delante, detrás y entre dos vecinas
+                    self.assertLess(between(None, keys[0]), keys[0])
+                    self.assertGreater(between(keys[-1], None), keys[-1])
+                    self.assertLessEqual(max(map(len, keys)), KEY_WIDTH + 2)
+
+
+# Reordenación de una watchlist: POST /watchlists/{id}/move/
+class WatchlistMoveTests(TestCase):
+    def setUp(self):
+        self.client, self.user = api_client('mover')
+        self.watchlist = Watchlist.objects.create(name='Lista', user=self.user)
+        self.movies = [Movie.objects.create(externalId=external_id) for external_id in range(1, 6)]
+        for movie in self.movies:
+            WatchlistMovie.objects.create(watchlist=self.watchlist, movie=movie)
+
+    def move(self, movie, expected_status=200, **anchor):
+        data = {'movieId': str(movie.pk)}
+        data.update({key: value and str(value.pk) for key, value in anchor.items()})
+        response = self.client.post(f'/api/watchlists/{self.watchlist.pk}/move/', data, format='json')
+        self.assertEqual(response.status_code, expected_status, response.data)
+        return response
+
+    def order(self):
+        """Índices en self.movies de las películas de la watchlist, en orden."""
+        indexes = {movie.pk: index for index, movie in enumerate(self.movies)}
+        rows = WatchlistMovie.objects.filter(watchlist=self.watchlist).order_by('position', 'id')
+        return [indexes[movie_id] for movie_id in rows.values_list('movie_id', flat=True)]
+
+    def test_move(self):
+        a, b, c, d, e = self.movies
+        self.move(e, after=a)
+        self.assertEqual(self.order(), [0, 4, 1, 2, 3])
+        self.move(a, before=d)
+        self.assertEqual(self.order(), [4, 1, 2, 0, 3])
+        self.move(d, after=None)
+        self.assertEqual(self.order(), [3, 4, 1, 2, 0])
+        self.move(d, before=None)
+        self.assertEqual(self.order(), [4, 1, 2, 0, 3])
+
+    def test_move_errors(self):
+        a, b = self.movies[:2]
+        outsider = Movie.objects.create(externalId=99)
+        self.move(outsider, 404, after=a)
+        self.move(a, 400, after=outsider)
+        self.move(a, 400, after=a)
+        self.move(a, 400)
+
+    def test_ties_are_rebalanced(self):
+        # Posiciones repetidas (p. ej. de un import): el orden es el de los ids
+        # y el movimiento reparte la watchlist antes de calcular la posición
+        WatchlistMovie.objects.filter(watchlist=self.watchlist).update(position=FIRST)
+        a, b, c, d, e = self.movies
+        self.move(e, after=b)
+        self.assertEqual(self.order(), [0, 1, 4, 2, 3])
+        positions = list(WatchlistMovie.objects.filter(watchlist=self.watchlist).values_list('position', flat=True))
+        self.assertEqual(len(set(positions)), len(positions))
+
+    @override_settings(WATCHLIST_REBALANCE='inline')
+    def test_long_positions_are_rebalanced(self):
+        a, b = self.movies[:2]
+        # Mover siempre al mismo hueco alarga la posición hasta que se reparte
+        for index in range(200):
+            with self.captureOnCommitCallbacks(execute=True):
+                position = self.move(self.movies[2 + index % 3], after=a).data['position']
+            if len(position) > REBALANCE_LENGTH:
+                break
+        else:
+            self.fail('The position never grew past REBALANCE_LENGTH')
+        positions = WatchlistMovie.objects.filter(watchlist=self.watchlist).values_list('position', flat=True)
+        self.assertLessEqual(max(map(len, positions)), KEY_WIDTH)
+        self.assertEqual(self.order()[0], 0)
+        self.assertEqual(self.order()[-1], 1)
+
+
+# Feed de actividad (api/feed.py): reparto a las bandejas (push), lectura de
+# las cuentas con muchos seguidores (pull) y cursor
+class FeedTests(TestCase):
+    def setUp(self):
+        self.client, self.user = api_client('reader')
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.movies = [Movie.objects.create(externalId=external_id) for external_id in range(1, 11)]
+        self.rated = 0
+
+    def follow(self, user, expected_status=201, method='post'):
+        response = getattr(self.client, method)(f'/api/users/{user.pk}/follow/')
+        self.assertEqual(response.status_code, expected_status)
+
+    def rate(self, user):
+        rating = Rating.objects.create(user=user, movie=self.movies[self.rated], score=3)
+        self.rated += 1
+        return Activity.objects.get(rating=rating).pk
+
+    def feed(self, page_size=20):
+        ids, url = [], f'/api/feed/?page_size={page_size}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), page_size)
+            ids.append([activity['id'] for activity in response.data['results']])
+            url = response.data['next']
+        return ids
+
+    def test_follow_and_unfollow(self):
+        old = self.rate(self.alice)
+        self.follow(self.alice)
+        self.follow(self.alice, 200)
+        self.follow(self.user, 400)
+        # Al seguir se copia la actividad reciente; la nueva se reparte al escribirse
+        new = self.rate(self.alice)
+        self.assertEqual(set(FeedEntry.objects.filter(user=self.user).values_list('activity_id', flat=True)), {old, new})
+        self.assertEqual(self.feed(), [[new, old]])
+
+        self.follow(self.alice, 204, 'delete')
+        self.follow(self.alice, 404, 'delete')
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(self.feed(), [[]])
+
+    @override_settings(FEED={'FANOUT_LIMIT': 1})
+    def test_push_and_pull(self):
+        self.follow(self.alice)
+        self.follow(self.bob)
+        fan, _ = api_client('fan')
+        fan.post(f'/api/users/{self.bob.pk}/follow/')
+        # bob pasa del límite: su actividad no se reparte y se lee al pedir el feed
+        activities = [self.rate(self.alice), self.rate(self.bob), self.rate(self.alice), self.rate(self.bob)]
+        self.assertEqual(FeedEntry.objects.filter(activity__actor=self.bob).count(), 0)
+        self.assertEqual(FeedEntry.objects.filter(activity__actor=self.alice).count(), 2)
+        self.assertEqual(self.feed(), [activities[::-1]])
+        self.assertEqual(self.feed(page_size=3), [activities[:0:-1], activities[:1]])
+
+    def test_cursor(self):
+        self.follow(self.alice)
+        activities = [self.rate(self.alice) for _ in range(5)][::-1]
+        self.assertEqual(self.feed(page_size=2), [activities[:2], activities[2:4], activities[4:]])
+        self.assertEqual(self.client.get('/api/feed/?cursor=nope').status_code, 400)
+
+    @override_settings(FEED={'FANOUT_LIMIT': 1})
+    def test_hidden_watchlist_activity_does_not_shorten_pages(self):
+        self.follow(self.alice)
+        self.follow(self.bob)
+        fan, _ = api_client('fan')
+        fan.post(f'/api/users/{self.bob.pk}/follow/')
+        visible = [self.rate(self.alice), self.rate(self.bob)][::-1]
+        # Las actividades más recientes son de watchlists que luego pasan a privadas
+        for user in (self.alice, self.bob):
+            watchlist = Watchlist.objects.create(name='Lista', user=user)
+            for movie in self.movies[5:9]:
+                WatchlistMovie.objects.create(watchlist=watchlist, movie=movie)
+            watchlist.isPublic = False
+            watchlist.save()
+        self.assertEqual(self.feed(page_size=2), [visible])
+
+
+# Perfil de SQLite (api/sqlite.py): settings.SQLITE solo lleva lo que cambia
+class SQLiteSettingsTests(SimpleTestCase):
+    @override_settings(SQLITE={'PRAGMAS': {'cache_size': -1024, 'temp_store': None}, 'OPTIMIZE_INTERVAL': 0})
+    def test_pragmas_override_the_defaults_one_by_one(self):
+        config = sqlite_settings()
+        self.assertEqual(config['PRAGMAS'], {**DEFAULT_PRAGMAS, 'cache_size': -1024, 'temp_store': None})
+        self.assertEqual((config['CHECKPOINT_INTERVAL'], config['OPTIMIZE_INTERVAL']), (300, 0))
+
+        raw = sqlite3.connect(':memory:')
+        self.addCleanup(raw.close)
+        apply_pragmas(raw)
+        self.assertEqual(raw.execute('PRAGMA cache_size').fetchone()[0], -1024)
+        self.assertEqual(raw.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+        self.assertEqual(raw.execute('PRAGMA temp_store').fetchone()[0], 0)  # Sin tocar: el de SQLite
+
+
+def search_index_in_sync():
+    """integrity-check de FTS5 contra la tabla comments: falla si el índice no coincide con el contenido."""
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute("INSERT INTO comments_fts(comments_fts, rank) VALUES ('integrity-check', 1)")
+        except Exception:
+            return False
+    return True
+
+
+def search_index_triggers():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'comments'")
+        return {row[0] for row in cursor.fetchall()} & set(TRIGGERS)
+
+
+# Índice FTS5 de los comentarios (api/search.py), mantenido por triggers
+@unittest.skipUnless(uses_fts(connection), 'SQLite con FTS5')
+class CommentSearchTests(TestCase):
+    def setUp(self):
+        self.client, self.user = api_client('searcher')
+        self.movie = Movie.objects.create(externalId=1)
+
+    def comment(self, text, movie=None):
+        return Comment.objects.create(user=self.user, movie=movie or self.movie, text=text)
+
+    def found(self, query):
+        response = self.client.get('/api/comments/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return {row['id'] for row in response.data['results']}
+
+    def test_triggers_follow_insert_update_delete(self):
+        first = self.comment('Una película preciosa')
+        self.assertEqual(self.found('preciosa'), {str(first.pk)})
+
+        # UPDATE en bloque, sin señales: lo sigue cubriendo el trigger
+        Comment.objects.filter(pk=first.pk).update(text='Bastante aburrida')
+        self.assertEqual(self.found('preciosa'), set())
+        self.assertEqual(self.found('aburrida'), {str(first.pk)})
+
+        others = Comment.objects.bulk_create([
+            Comment(user=self.user, movie=self.movie, text='Aburrida y larga'),
+            Comment(user=self.user, movie=Movie.objects.create(externalId=2), text='Aburrida pero bonita'),
+        ])
+        self.assertEqual(self.found('aburrida'), {str(first.pk), str(others[0].pk), str(others[1].pk)})
+        self.assertTrue(search_index_in_sync())
+
+        Comment.objects.filter(pk=first.pk).delete()
+        Movie.objects.filter(externalId=2).delete()  # Borrado en cascada
+        self.assertEqual(self.found('aburrida'), {str(others[0].pk)})
+        self.assertTrue(search_index_in_sync())
+
+    def test_search_cursor_and_snippet(self):
+        expected = {str(self.comment(f'{"zombi " * repeat}en una <b>película</b> número {repeat}').pk)
+                    for repeat in range(1, 6)}
+        self.comment('Sin muertos vivientes')
+        other = self.comment('Otro zombi', movie=Movie.objects.create(externalId=2))
+
+        seen, scores, url = [], [], '/api/comments/search/?q=zomb&page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen += [row['id'] for row in response.data['results']]
+            scores += [row['score'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(expected | {str(other.pk)}))
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        response = self.client.get('/api/comments/search/', {'q': 'película zombi', 'movie': str(self.movie.pk)})
+        self.assertEqual({row['id'] for row in response.data['results']}, expected)
+        snippet = response.data['results'][0]['snippet']
+        self.assertIn('<mark>zombi</mark>', snippet)
+        self.assertIn('&lt;b&gt;<mark>película</mark>&lt;/b&gt;', snippet)
+
+        self.assertEqual(self.client.get('/api/comments/search/').status_code, 400)
+        self.assertEqual(self.client.get('/api/comments/search/?q=zombi&cursor=nope').status_code, 400)
+
+
+# Instalación del índice y tablas rehechas. Con transacciones de verdad: el
+# DDL de FTS5 deshecho con un rollback deja el índice inservible en la conexión
+@unittest.skipUnless(uses_fts(connection), 'SQLite con FTS5')
+class CommentSearchInstallTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('searcher')
+        self.movie = Movie.objects.create(externalId=1)
+
+    def test_install_rebuilds_the_index(self):
+        # Lo que hace la migración 0010 sobre una tabla con comentarios
+        uninstall_comment_search(connection)
+        self.addCleanup(install_comment_search, connection)
+        comment = Comment.objects.create(user=self.user, movie=self.movie, text='Comentario anterior al índice')
+        self.assertTrue(install_comment_search(connection))
+        self.assertEqual(search_index_triggers(), set(TRIGGERS))
+        self.assertTrue(search_index_in_sync())
+        self.assertEqual([row[0] for row in search_comments(['anterior'])], [comment.pk])
+
+    # Las migraciones que rehacen la tabla comments en SQLite se llevan los
+    # triggers: el post_migrate los vuelve a crear y reconstruye el índice
+    def test_table_remake(self):
+        text = Comment._meta.get_field('text')
+        nullable = Comment._meta.get_field('text').clone()
+        nullable.set_attributes_from_name('text')
+        nullable.null = True
+        with connection.schema_editor() as editor:
+            editor.alter_field(Comment, text, nullable)
+        self.addCleanup(self.restore_text_field, nullable, text)
+        self.assertEqual(search_index_triggers(), set())
+
+        comment = Comment.objects.create(user=self.user, movie=self.movie, text='Escrito sin triggers')
+        call_command('migrate', verbosity=0, stdout=StringIO())
+        self.assertEqual(search_index_triggers(), set(TRIGGERS))
+        self.assertTrue(search_index_in_sync())
+        self.assertEqual([row[0] for row in search_comments(['triggers'])], [comment.pk])
+
+    def restore_text_field(self, current, original):
+        with connection.schema_editor() as editor:
+            editor.alter_field(Comment, current, original)
+        install_comment_search(connection, create=False)
+
+
+# Con manage.py test los registros de api/ por debajo de WARNING no se escriben
+@unittest.skipIf('API_LOG_LEVEL' in os.environ, 'nivel fijado con API_LOG_LEVEL')
+class LoggingTests(SimpleTestCase):
+    def test_quiet_under_tests(self):
+        self.assertEqual(settings.API_LOG_LEVELS['api'], 'WARNING')
+        self.assertFalse(logging.getLogger('api.views').isEnabledFor(logging.INFO))
+        self.assertTrue(logging.getLogger('api.views').isEnabledFor(logging.WARNING))
+
+# Ids UUID7 (api/ids.py)
+class UUID7Tests(SimpleTestCase):
+    MS = 1_700_000_000_000
+
+    def setUp(self):
+        # Estado del generador propio de cada test (el del proceso depende de los ids ya generados)
+        self.enterContext(mock.patch.multiple('api.ids', _last_ms=0, _counter=0))
+
+    def generate(self, n, ms):
+        with mock.patch('api.ids.time.time_ns', return_value=ms * 1_000_000):
+            return [uuid7() for _ in range(n)]
+
+    def test_increasing_within_a_millisecond(self):
+        ids = self.generate(1000, self.MS)
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual({value.int >> 80 for value in ids}, {self.MS})
+        self.assertTrue(all(value.version == 7 and value.variant == uuid.RFC_4122 for value in ids))
+
+    def test_increasing_across_counter_overflow(self):
+        # 4096 ids por milisegundo como mucho: el contador se agota y se pasa al siguiente
+        ids = self.generate(10000, self.MS)
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertGreater(ids[-1].int >> 80, self.MS)
+        # Con el reloj hacia atrás se sigue desde el último milisegundo usado
+        later = self.generate(10, self.MS - 5)
+        self.assertGreater(later[0], ids[-1])
+        self.assertEqual(later, sorted(later))
+
+
+# Las vistas de /api/async/ (api/async_views.py) responden lo mismo que sus
+# equivalentes síncronas: mismos datos, mismos errores y mismos permisos
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        self.client, self.user = api_client('async')
+        self.movie = Movie.objects.create(externalId=1)
+        self.other = Movie.objects.create(externalId=2)
+        Rating.objects.create(user=self.user, movie=self.movie, score=4)
+        for n in range(5):
+            Comment.objects.create(user=self.user, movie=self.movie, text=f'Comentario {n}')
+        self.watchlist = Watchlist.objects.create(name='Lista', user=self.user)
+        for external_id in range(10, 15):
+            WatchlistMovie.objects.create(watchlist=self.watchlist, movie=Movie.objects.create(externalId=external_id))
+
+    def routes(self):
+        """(ruta síncrona, ruta async) de cada lectura de /api/async/."""
+        contents = f'watchlists/{self.watchlist.pk}/contents/'
+        return [
+            (f'/api/comments/?movie={self.movie.pk}', f'/api/async/comments/?movie={self.movie.pk}'),
+            (f'/api/{contents}', f'/api/async/{contents}'),
+            (f'/api/movies/{self.movie.pk}/stats/', f'/api/async/movies/{self.movie.pk}/stats/'),
+            (f'/api/movies/stats/?ids={self.movie.pk},{self.other.pk}',
+             f'/api/async/movies/stats/?ids={self.movie.pk},{self.other.pk}'),
+        ]
+
+    def body(self, response):
+        return streamed_json(response) if response.streaming else json.loads(response.content)
+
+    def assertSameResponse(self, sync, asynchronous):
+        self.assertEqual(asynchronous.status_code, sync.status_code)
+        self.assertEqual(self.body(asynchronous), self.body(sync))
+
+    def resolve(self, client, path, data, **extra):
+        return client.post(path, json.dumps(data), content_type='application/json', **extra)
+
+    def test_same_responses(self):
+        for sync_url, async_url in self.routes():
+            with self.subTest(url=async_url):
+                self.assertSameResponse(self.client.get(sync_url), self.client.get(async_url))
+
+        data = {'externalIds': [2, 1, 99, 1], 'create': True}
+        sync = self.resolve(self.client, '/api/movies/resolve/', data)
+        self.assertSameResponse(sync, self.resolve(self.client, '/api/async/movies/resolve/', data))
+        self.assertEqual([row['externalId'] for row in self.body(sync)], [2, 1, 99])
+        self.assertEqual(self.body(sync)[1]['userScore'], 4)
+
+    def test_same_errors(self):
+        ids = ','.join(str(uuid.uuid4()) for _ in range(101))
+        for query in ('', '?ids=nope', f'?ids={ids}'):
+            with self.subTest(query=query):
+                self.assertSameResponse(self.client.get('/api/movies/stats/' + query),
+                                        self.client.get('/api/async/movies/stats/' + query))
+        self.assertSameResponse(self.client.get(f'/api/movies/{uuid.uuid4()}/stats/'),
+                                self.client.get(f'/api/async/movies/{uuid.uuid4()}/stats/'))
+        for data in ({}, {'externalIds': []}, {'externalIds': ['x']}):
+            with self.subTest(data=data):
+                self.assertSameResponse(self.resolve(self.client, '/api/movies/resolve/', data),
+                                        self.resolve(self.client, '/api/async/movies/resolve/', data))
+
+    def test_requires_authentication(self):
+        anonymous = APIClient()
+        requests = [(anonymous.get, sync_url, async_url) for sync_url, async_url in self.routes()]
+        requests.append((anonymous.post, '/api/movies/resolve/', '/api/async/movies/resolve/'))
+        for method, sync_url, async_url in requests:
+            with self.subTest(url=async_url):
+                sync, asynchronous = method(sync_url), method(async_url)
+                self.assertEqual(sync.status_code, 401)
+                self.assertSameResponse(sync, asynchronous)
+                self.assertEqual(asynchronous['WWW-Authenticate'], sync['WWW-Authenticate'])
+
+    def test_session_requires_csrf_on_writes(self):
+        session = APIClient(enforce_csrf_checks=True)
+        session.force_login(self.user)
+        data = {'externalIds': [1]}
+        for url in ('/api/movies/resolve/', '/api/async/movies/resolve/'):
+            with self.subTest(url=url):
+                self.assertEqual(session.get(url.replace('resolve', 'stats') + f'?ids={self.movie.pk}').status_code, 200)
+                response = self.resolve(session, url, data)
+                self.assertEqual(response.status_code, 403)
+                self.assertIn('CSRF', self.body(response)['detail'])
+
+                token = 'a' * 32
+                session.cookies['csrftoken'] = token
+                self.assertEqual(self.resolve(session, url, data, HTTP_X_CSRFTOKEN=token).status_code, 200)
+                del session.cookies['csrftoken']
+
+    def pages(self, url, key):
+        """Elementos de todas las páginas siguiendo los enlaces next."""
+        items = []
+        while url:
+            data = self.body(self.client.get(url))
+            items += [item[key] for item in data['results']]
+            url = data['next']
+        return items
+
+    def test_same_cursor_paging(self):
+        comments = f'comments/?movie={self.movie.pk}&page_size=2'
+        contents = f'watchlists/{self.watchlist.pk}/contents/?limit=2'
+        for path, key in ((comments, 'id'), (contents, 'movieId')):
+            with self.subTest(path=path):
+                items = self.pages('/api/' + path, key)
+                self.assertEqual(len(items), 5)
+                self.assertEqual(self.pages('/api/async/' + path, key), items)
+
+    def test_contents_not_modified(self):
+        path = f'watchlists/{self.watchlist.pk}/contents/'
+        etag = self.client.get('/api/' + path)['ETag']
+        self.assertEqual(self.client.get('/api/async/' + path)['ETag'], etag)
+        for url in ('/api/' + path, '/api/async/' + path):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
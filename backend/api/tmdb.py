@@ -0,0 +1,219 @@
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Subquery
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import TmdbMovieCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'API_KEY': '',
+    'BASE_URL': 'https://api.themoviedb.org/3',
+    'CLIENT': 'api.tmdb.TMDBClient',
+    'TIMEOUT': 5,
+    'MAX_WORKERS': 8,
+    'TTL': 24 * 60 * 60,
+    'MAX_ENTRIES': 10000,
+    'TOUCH_INTERVAL': 60,
+    'ASYNC_WORKERS': 32,    # Descargas simultáneas de las vistas async (aget_many)
+}
+
+
+# Las entradas descargadas sustituyen a las que hubiera
+UPSERT = {
+    'update_conflicts': True,
+    'unique_fields': ['externalId'],
+    'update_fields': ['payload', 'fetchedAt', 'lastAccessedAt'],
+}
+
+
+def tmdb_settings():
+    return {**DEFAULTS, **getattr(settings, 'TMDB', {})}
+
+
+class TMDBError(Exception):
+    pass
+
+
+# Cliente HTTP de TMDB. Se puede sustituir con el setting TMDB['CLIENT']
+# (o apuntar TMDB['BASE_URL'] a un servidor falso local en los tests)
+class TMDBClient:
+    def __init__(self, base_url, api_key, timeout=5, max_workers=8):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_workers = max_workers
+
+    def fetch_movie(self, external_id):
+        """Devuelve el JSON de /movie/{id} o None si TMDB no conoce la película."""
+        url = f'{self.base_url}/movie/{external_id}?{urlencode({"api_key": self.api_key})}'
+        try:
+            with urlopen(url, timeout=self.timeout) as response:
+                return json.load(response)
+        except HTTPError as e:
+            if e.code == 404:
+                return None
+            raise TMDBError(f'TMDB returned {e.code} for movie {external_id}') from e
+        except (URLError, TimeoutError, ValueError) as e:
+            raise TMDBError(f'TMDB request failed for movie {external_id}: {e}') from e
+
+    def fetch_movies(self, external_ids):
+        """Descarga varias películas en paralelo. Las que fallan no aparecen en el resultado."""
+        def fetch(external_id):
+            try:
+                return external_id, self.fetch_movie(external_id)
+            except TMDBError as e:
+                logger.warning('%s', e)
+                return external_id, None
+
+        if not external_ids:
+            return {}
+        workers = max(1, min(self.max_workers, len(external_ids)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return {
+                external_id: payload
+                for external_id, payload in executor.map(fetch, external_ids)
+                if payload is not None
+            }
+
+
+# Pasarela de metadatos: sirve desde la tabla tmdb_movie_cache, refresca las
+# entradas caducadas (TTL) y desaloja las menos usadas cuando se supera MAX_ENTRIES
+class TMDBGateway:
+    def __init__(self, client, ttl, max_entries, touch_interval=60, async_workers=32):
+        self.client = client
+        self.ttl = timedelta(seconds=ttl)
+        self.max_entries = max_entries
+        self.touch_interval = timedelta(seconds=touch_interval)
+        # Hilos propios para las descargas de aget_many: el executor por defecto
+        # del bucle de eventos tiene muy pocos y limitaría las peticiones a la vez
+        self.async_workers = async_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def get(self, external_id):
+        return self.get_many([external_id]).get(external_id)
+
+    def get_many(self, external_ids):
+        """Devuelve {externalId: payload} para los ids que TMDB conoce."""
+        external_ids = list(dict.fromkeys(external_ids))
+        if not external_ids:
+            return {}
+
+        now = timezone.now()
+        cached = TmdbMovieCache.objects.in_bulk(external_ids)
+        stale = self._stale(external_ids, cached, now)
+
+        fetched = self.client.fetch_movies(stale) if stale else {}
+        if fetched:
+            TmdbMovieCache.objects.bulk_create(self._entries(fetched, now), **UPSERT)
+            self.evict()
+
+        touched = self._touched(cached, fetched, now)
+        if touched:
+            TmdbMovieCache.objects.filter(externalId__in=touched).update(lastAccessedAt=now)
+        return self._payloads(external_ids, cached, fetched)
+
+    async def aget_many(self, external_ids):
+        """
+        get_many() para las vistas async. Las descargas de TMDB van a un hilo
+        aparte: mientras esperan, el proceso sigue atendiendo otras peticiones.
+        """
+        external_ids = list(dict.fromkeys(external_ids))
+        if not external_ids:
+            return {}
+
+        now = timezone.now()
+        cached = await TmdbMovieCache.objects.ain_bulk(external_ids)
+        stale = self._stale(external_ids, cached, now)
+
+        fetched = {}
+        if stale:
+            fetch = sync_to_async(self.client.fetch_movies, thread_sensitive=False, executor=self.executor())
+            fetched = await fetch(stale)
+        if fetched:
+            await TmdbMovieCache.objects.abulk_create(self._entries(fetched, now), **UPSERT)
+            await sync_to_async(self.evict)()
+
+        touched = self._touched(cached, fetched, now)
+        if touched:
+            await TmdbMovieCache.objects.filter(externalId__in=touched).aupdate(lastAccessedAt=now)
+        return self._payloads(external_ids, cached, fetched)
+
+    def executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.async_workers, thread_name_prefix='tmdb')
+        return self._executor
+
+    def _stale(self, external_ids, cached, now):
+        return [external_id for external_id in external_ids
+                if external_id not in cached or cached[external_id].fetchedAt < now - self.ttl]
+
+    def _entries(self, fetched, now):
+        return [TmdbMovieCache(externalId=external_id, payload=payload, fetchedAt=now, lastAccessedAt=now)
+                for external_id, payload in fetched.items()]
+
+    def _touched(self, cached, fetched, now):
+        # Marcar el acceso para el LRU sin escribir en cada lectura
+        return [external_id for external_id, entry in cached.items()
+                if external_id not in fetched and entry.lastAccessedAt < now - self.touch_interval]
+
+    def _payloads(self, external_ids, cached, fetched):
+        # Si TMDB falla se sirve la copia caducada antes que nada
+        payloads = {external_id: entry.payload for external_id, entry in cached.items()}
+        payloads.update(fetched)
+        return {external_id: payloads[external_id] for external_id in external_ids if external_id in payloads}
+
+    def evict(self):
+        excess = TmdbMovieCache.objects.count() - self.max_entries
+        if excess > 0:
+            oldest = TmdbMovieCache.objects.order_by('lastAccessedAt').values('externalId')[:excess]
+            TmdbMovieCache.objects.filter(externalId__in=Subquery(oldest)).delete()
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Pasarela compartida por el proceso, construida a partir de settings.TMDB."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                config = tmdb_settings()
+                client_class = import_string(config['CLIENT'])
+                client = client_class(
+                    base_url=config['BASE_URL'],
+                    api_key=config['API_KEY'],
+                    timeout=config['TIMEOUT'],
+                    max_workers=config['MAX_WORKERS'],
+                )
+                _gateway = TMDBGateway(
+                    client,
+                    ttl=config['TTL'],
+                    max_entries=config['MAX_ENTRIES'],
+                    touch_interval=config['TOUCH_INTERVAL'],
+                    async_workers=config['ASYNC_WORKERS'],
+                )
+    return _gateway
+
+
+def reset_gateway():
+    """Olvida la pasarela compartida (p. ej. tras cambiar settings.TMDB en un test)."""
+    global _gateway
+    with _gateway_lock:
+        _gateway = None
@@ -3,8 +3,10 @@ from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token
 from .views import (
     CustomAuthToken, RegisterView, UserViewSet, MovieViewSet,
-    WatchlistViewSet, WatchlistMovieViewSet, RatingViewSet, CommentViewSet
+    WatchlistViewSet, WatchlistMovieViewSet, RatingViewSet, CommentViewSet, MetricsView,
+    LeaderboardView, FeedView
 )
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -19,4 +21,13 @@ urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', CustomAuthToken.as_view(), name='login'),
     path('logout/', obtain_auth_token, name='logout'),  # Para invalidar token
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('leaderboards/<str:kind>/', LeaderboardView.as_view(), name='leaderboard'),
+    path('feed/', FeedView.as_view(), name='feed'),
+    # Lecturas async para servidores ASGI (api/async_views.py)
+    path('async/comments/', async_views.movie_comments, name='async-comments'),
+    path('async/watchlists/<uuid:pk>/contents/', async_views.watchlist_contents, name='async-watchlist-contents'),
+    path('async/movies/resolve/', async_views.resolve_movies, name='async-movies-resolve'),
+    path('async/movies/stats/', async_views.bulk_movie_stats, name='async-movies-bulk-stats'),
+    path('async/movies/<uuid:pk>/stats/', async_views.movie_stats, name='async-movies-stats'),
 ]
\ No newline at end of file
@@ -1,18 +1,139 @@
+import base64
+import json
+import logging
+import uuid
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from rest_framework import viewsets, status, generics, serializers
-from .models import Movie, Watchlist, WatchlistMovie, Rating, Comment
+from .models import Movie, Watchlist, WatchlistMovie, Rating, Comment, LeaderboardEntry, Activity
 from .serializers import (
-    UserSerializer, LoginSerializer, MovieSerializer,
-    WatchlistSerializer, WatchlistMovieSerializer,
-    RatingSerializer, CommentSerializer
+    UserSerializer, LoginSerializer, MovieSerializer, MovieRatingStatsSerializer,
+    MovieResolveSerializer,
+    WatchlistSerializer, WatchlistMovieSerializer, WatchlistBulkSerializer, WatchlistMoveSerializer,
+    RatingSerializer, CommentSerializer, LeaderboardEntrySerializer, ActivitySerializer
 )
+from .bulk import MAX_BULK_SIZE, bulk_rating_stats, parse_movie_ids, resolve_external_ids
+from .caching import invalidate_public_watchlists, public_watchlists_page
+from .conditional import ConditionalViewMixin, not_modified, object_etag, page_etag, with_etag
+from .feed import feed_page, feed_settings, follow, publish_many, unfollow
+from .fieldsets import SparseFieldsetsViewMixin
+from .leaderboards import WINDOWS, record_listings, remove_listings
+from .metrics import registry
+from .pagination import CreatedAtCursorPagination, DefaultCursorPagination, RankCursorPagination
+from .recommendations import recommend_for_user, similar_movies
+from .renderers import dumps
+from .search import search_comments, search_terms
+from .ranking import (
+    MAX_LENGTH, REBALANCE_LENGTH, between, keys_after, rebalance_watchlist, schedule_rebalance, spread
+)
+from .stats import get_rating_stats
+from .tmdb import get_gateway
+
+logger = logging.getLogger(__name__)
+
+# Cursor opaco para el listado de watchlists (id de la última pública enviada)
+def encode_id_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+def decode_id_cursor(cursor):
+    return uuid.UUID(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+# Cursor opaco para el contenido de una watchlist (posición e id de la última relación enviada)
+def encode_contents_cursor(position, watchlist_movie_id):
+    return base64.urlsafe_b64encode(json.dumps([position, str(watchlist_movie_id)]).encode()).decode()
+
+def decode_contents_cursor(cursor):
+    position, watchlist_movie_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(position, str):
+        raise ValueError('Invalid position')
+    return position, uuid.UUID(watchlist_movie_id)
+
+# Cursor opaco para la búsqueda de comentarios (rank e id del último enviado)
+def encode_search_cursor(rank, comment_id):
+    return base64.urlsafe_b64encode(json.dumps([rank, str(comment_id)]).encode()).decode()
+
+def decode_search_cursor(cursor):
+    rank, comment_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(rank, (int, float)):
+        raise ValueError('Invalid rank')
+    return rank, uuid.UUID(comment_id)
+
+# Cursor opaco para el feed (id de la actividad más antigua enviada)
+def encode_feed_cursor(activity_id):
+    return base64.urlsafe_b64encode(str(activity_id).encode()).decode()
+
+def decode_feed_cursor(cursor):
+    return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+# Tamaño de las listas de películas similares y recomendaciones
+DEFAULT_RECOMMENDATIONS = 20
+MAX_RECOMMENDATIONS = 100
+
+def parse_limit(request):
+    """?limit= de las recomendaciones; None si no es válido."""
+    try:
+        limit = int(request.query_params.get('limit', DEFAULT_RECOMMENDATIONS))
+    except ValueError:
+        return None
+    return limit if 1 <= limit <= MAX_RECOMMENDATIONS else None
+
+# ?embed=tmdb añade los metadatos de TMDB (servidos desde la caché local)
+def wants_tmdb(request):
+    return 'tmdb' in request.query_params.get('embed', '').split(',')
+
+# Elemento del contenido de una watchlist a partir de una fila de values()
+def contents_item(row, metadata=None):
+    item = {
+        'id': row['id'],
+        'movieId': row['movie_id'],
+        'externalId': row['movie__externalId'],
+        'position': row['position'],
+    }
+    if metadata is not None:
+        item['tmdb'] = metadata.get(row['movie__externalId'])
+    return item
+
+# Cierre del JSON del contenido; last es la última fila enviada si hay más
+def contents_end(last, next_url):
+    if last is None:
+        return b'],"next":null}'
+    next_link = replace_query_param(next_url, 'cursor', encode_contents_cursor(last['position'], last['id']))
+    return b'],"next":' + dumps(next_link) + b'}'
+
+# Genera el JSON del contenido fila a fila para no materializar listas grandes
+def stream_contents(rows, limit, next_url, metadata=None):
+    yield b'{"results":['
+    last = None
+    for index, row in enumerate(rows):
+        if index == limit:
+            # Hay más filas: el cursor apunta a la última enviada
+            yield contents_end(last, next_url)
+            return
+        last = row
+        yield (b',' if index else b'') + dumps(contents_item(row, metadata))
+    yield contents_end(None, next_url)
+
+# Vista para métricas (formato de texto de Prometheus)
+class MetricsView(generics.GenericAPIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.API_METRICS_ALLOWED_IPS):
+            return Response({'error': 'Not allowed'}, status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 
 # Vista para autenticación
 class CustomAuthToken(ObtainAuthToken):
@@ -59,7 +180,7 @@ class RegisterView(generics.CreateAPIView):
         }, status=status.HTTP_201_CREATED)
 
 # Vista para Usuarios
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
@@ -68,9 +189,44 @@ class UserViewSet(viewsets.ModelViewSet):
     def me(self, request):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
+    
+    # Seguir / dejar de seguir a un usuario: POST o DELETE /users/{id}/follow/
+    @action(detail=True, methods=['post', 'delete'])
+    def follow(self, request, pk=None):
+        followee = self.get_object()
+        if followee.id == request.user.id:
+            return Response(
+                {'error': 'You cannot follow yourself'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if request.method == 'DELETE':
+            if not unfollow(request.user.id, followee.id):
+                return Response(
+                    {'error': 'You are not following this user'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        
+        created = follow(request.user.id, followee.id)
+        return Response(
+            {'followeeId': followee.id, 'following': True},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+    
+    # Recomendaciones a partir de los ratings del usuario: /users/me/recommendations/?limit=<n>
+    @action(detail=False, methods=['get'], url_path='me/recommendations')
+    def recommendations(self, request):
+        limit = parse_limit(request)
+        if limit is None:
+            return Response(
+                {'error': f'limit must be an integer between 1 and {MAX_RECOMMENDATIONS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'results': recommend_for_user(request.user.id, limit)})
 
 # Vista para Películas - CORREGIDA CON FILTRO
-class MovieViewSet(viewsets.ModelViewSet):
+class MovieViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     serializer_class = MovieSerializer
     permission_classes = [IsAuthenticated]
     
@@ -92,12 +248,110 @@ class MovieViewSet(viewsets.ModelViewSet):
     
     # Mantener el queryset estático para compatibilidad
     queryset = Movie.objects.all()
+    
+    # Número máximo de películas por petición en las consultas en bloque
+    max_bulk_size = MAX_BULK_SIZE
+    
+    def retrieve(self, request, *args, **kwargs):
+        movie = self.get_object()
+        data = self.get_serializer(movie).data
+        if wants_tmdb(request):
+            data['tmdb'] = get_gateway().get(movie.externalId)
+        return Response(data)
+    
+    # Metadatos de TMDB en bloque desde la caché: /movies/tmdb/?externalIds=<id>,<id>
+    @action(detail=False, methods=['get'])
+    def tmdb(self, request):
+        try:
+            external_ids = [int(value) for value in request.query_params.get('externalIds', '').split(',') if value]
+        except ValueError:
+            return Response(
+                {'error': 'externalIds must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not external_ids:
+            return Response(
+                {'error': 'externalIds parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(external_ids) > self.max_bulk_size:
+            return Response(
+                {'error': f'A maximum of {self.max_bulk_size} ids is allowed'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        metadata = get_gateway().get_many(external_ids)
+        return Response([
+            {'externalId': external_id, 'tmdb': metadata.get(external_id)}
+            for external_id in dict.fromkeys(external_ids)
+        ])
+    
+    # Alta idempotente por id de TMDB: PUT /movies/by-external/{tmdbId}/
+    # Devuelve 201 si la película se ha creado y 200 si ya existía
+    @action(detail=False, methods=['put'], url_path=r'by-external/(?P<external_id>\d+)')
+    def by_external(self, request, external_id=None):
+        movie, created = Movie.objects.ensure(int(external_id))
+        serializer = self.get_serializer(movie)
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+    
+    # Estadísticas de puntuación precalculadas de una película
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        movie = self.get_object()
+        stats = get_rating_stats([movie.id])[movie.id]
+        return Response(MovieRatingStatsSerializer(stats).data)
+    
+    # Películas parecidas según los ratings (precalculadas): /movies/{id}/similar/?limit=<n>
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        movie = self.get_object()
+        limit = parse_limit(request)
+        if limit is None:
+            return Response(
+                {'error': f'limit must be an integer between 1 and {MAX_RECOMMENDATIONS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'results': similar_movies(movie.id, limit)})
+    
+    # Estadísticas de varias películas: /movies/stats/?ids=<uuid>,<uuid>
+    @action(detail=False, methods=['get'], url_path='stats')
+    def bulk_stats(self, request):
+        try:
+            movie_ids = parse_movie_ids(request.query_params.get('ids', ''))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        stats = bulk_rating_stats(movie_ids)
+        serializer = MovieRatingStatsSerializer(stats.values(), many=True)
+        return Response(serializer.data)
+    
+    # Resolución en bloque para las rejillas de pósters: POST /movies/resolve/
+    # con {"externalIds": [...], "create": false}. Para cada id de TMDB devuelve
+    # el id local, la media, el número de ratings y la puntuación del usuario
+    # con un número fijo de consultas, sea cual sea el tamaño de la lista
+    @action(detail=False, methods=['post'])
+    def resolve(self, request):
+        serializer = MovieResolveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(resolve_external_ids(
+            request.user, serializer.validated_data['externalIds'], serializer.validated_data['create']
+        ))
 
 # Vista para Watchlists - MEJORADA CON PERMISOS ADECUADOS
-class WatchlistViewSet(viewsets.ModelViewSet):
+class WatchlistViewSet(ConditionalViewMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     serializer_class = WatchlistSerializer
     permission_classes = [IsAuthenticated]
     
+    # Tamaño de página por defecto y máximo del endpoint de contenido
+    contents_page_size = 500
+    contents_max_page_size = 5000
+    # Con ?embed=tmdb cada fila puede acabar en una descarga: páginas más cortas
+    contents_tmdb_max_page_size = 100
+    
     def get_queryset(self):
         user = self.request.user
         if not user.is_authenticated:
@@ -108,15 +362,62 @@ class WatchlistViewSet(viewsets.ModelViewSet):
             return Watchlist.objects.filter(user=user)
         
         # Para GET, mostrar watchlists del usuario + públicas de otros
-        user_watchlists = Watchlist.objects.filter(user=user)
-        public_watchlists = Watchlist.objects.filter(isPublic=True)
-        
-        # Combinar y eliminar duplicados
-        all_watchlists = (user_watchlists | public_watchlists).distinct()
-        return all_watchlists
+        return Watchlist.objects.visible_to(user)
     
     queryset = Watchlist.objects.all()
     
+    # Listado: las públicas salen de la caché versionada (son iguales para todos)
+    # y en cada página se mezclan por id las privadas del usuario que caen en su rango
+    def list(self, request, *args, **kwargs):
+        page_size = self.paginator.get_page_size(request)
+        
+        after = None
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                after = decode_id_cursor(cursor)
+            except (ValueError, UnicodeDecodeError):
+                return Response(
+                    {'error': 'Invalid cursor'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        page = public_watchlists_page(after, page_size)
+        
+        private = Watchlist.objects.filter(user=request.user, isPublic=False).order_by('id')
+        if after:
+            private = private.filter(id__gt=after)
+        if page['last']:
+            private = private.filter(id__lte=page['last'])
+        
+        # Una privada de más para saber si la mezcla se sale de la página
+        private = list(private[:page_size + 1])
+        
+        # ETag de la versión de la página pública en caché y de las privadas,
+        # sin consultas aparte (ver api/conditional.py)
+        etag = page_etag(request, private, f'public-{page["version"]}')
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        
+        results = page['results'] + WatchlistSerializer(private, many=True).data
+        results.sort(key=lambda watchlist: uuid.UUID(watchlist['id']))
+        last = page['last']
+        if len(results) > page_size:
+            # La página acaba antes que la pública en caché: la siguiente sigue
+            # desde la última enviada (y vuelve a pedir las públicas que falten)
+            results = results[:page_size]
+            last = results[-1]['id']
+        # La página en caché tiene todos los campos: ?fields= se aplica al final
+        if self.sparse_fieldsets()[0] is not None:
+            names = list(self.get_serializer().fields)
+            results = [{name: watchlist[name] for name in names} for watchlist in results]
+        
+        next_url = None
+        if last:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_id_cursor(last))
+        return with_etag(Response({'next': next_url, 'previous': None, 'results': results}), etag)
+    
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
     
@@ -157,10 +458,239 @@ class WatchlistViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        watchlist_movies = WatchlistMovie.objects.filter(watchlist=watchlist)
-        movies = [wm.movie for wm in watchlist_movies]
-        serializer = MovieSerializer(movies, many=True)
-        return Response(serializer.data)
+        movies = Movie.objects.filter(movie_watchlists__watchlist=watchlist)
+        page = self.paginate_queryset(movies)
+        serializer = MovieSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    # Contenido de la watchlist en orden, en una sola consulta y en streaming:
+    # /watchlists/{id}/contents/?cursor=<cursor>&limit=<n>
+    @action(detail=True, methods=['get'])
+    def contents(self, request, pk=None):
+        watchlist = self.get_object()
+        
+        # Verificar que el usuario puede ver esta watchlist
+        if not watchlist.isPublic and watchlist.user_id != request.user.id:
+            return Response(
+                {'error': 'No tienes permiso para ver esta watchlist'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        # La versión de la watchlist cambia con su contenido (los metadatos de TMDB van aparte)
+        etag = None if wants_tmdb(request) else object_etag(watchlist)
+        if etag:
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+        
+        try:
+            limit = int(request.query_params.get('limit', self.contents_page_size))
+        except ValueError:
+            limit = self.contents_page_size
+        max_page_size = self.contents_tmdb_max_page_size if wants_tmdb(request) else self.contents_max_page_size
+        limit = max(1, min(limit, max_page_size))
+        
+        # Recorrido del índice (watchlist, position, id)
+        rows = WatchlistMovie.objects.filter(watchlist=watchlist).order_by('position', 'id')
+        
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                position, last_id = decode_contents_cursor(cursor)
+                rows = rows.filter(Q(position__gt=position) | Q(position=position, id__gt=last_id))
+            except (ValueError, TypeError, UnicodeDecodeError):
+                return Response(
+                    {'error': 'Invalid cursor'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        # Una fila de más para saber si hay página siguiente
+        rows = rows.values('id', 'movie_id', 'movie__externalId', 'position')[:limit + 1]
+        next_url = remove_query_param(request.build_absolute_uri(), 'cursor')
+        
+        if wants_tmdb(request):
+            # La página está acotada por limit: se materializa para pedir los metadatos de golpe
+            rows = list(rows)
+            metadata = get_gateway().get_many([row['movie__externalId'] for row in rows[:limit]])
+            return StreamingHttpResponse(
+                stream_contents(rows, limit, next_url, metadata),
+                content_type='application/json'
+            )
+        
+        return with_etag(StreamingHttpResponse(
+            stream_contents(rows.iterator(), limit, next_url),
+            content_type='application/json'
+        ), etag)
+    
+    # Cambios en bloque en una sola petición y transacción:
+    # POST /watchlists/{id}/bulk/ con {"add": [...], "remove": [...]} o {"replace": [...]}
+    # e idType "id" (por defecto) o "externalId". Con ids de TMDB se crean las
+    # películas que falten. Devuelve el contenido resultante de la watchlist
+    @action(detail=True, methods=['post'])
+    def bulk(self, request, pk=None):
+        serializer = WatchlistBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        key_field = data['idType']
+        requested = list(dict.fromkeys([*data.get('add', []), *data.get('remove', []), *data.get('replace', [])]))
+        
+        with transaction.atomic():
+            # Bloquear la watchlist (solo las del usuario) para serializar los cambios sobre ella
+            watchlist = generics.get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            
+            wanted = [*data.get('add', []), *data.get('replace', [])]
+            if key_field == 'externalId' and wanted:
+                Movie.objects.bulk_create(
+                    [Movie(externalId=external_id) for external_id in wanted],
+                    ignore_conflicts=True
+                )
+            
+            resolved = {}
+            external_ids = {}
+            for key, movie_id, external_id in (
+                Movie.objects.filter(**{f'{key_field}__in': requested}).values_list(key_field, 'id', 'externalId')
+            ):
+                resolved[key] = movie_id
+                external_ids[movie_id] = external_id
+            
+            # Contenido actual en orden: movie_id -> (id de la relación, posición)
+            relations = WatchlistMovie.objects.filter(watchlist=watchlist)
+            current = {}
+            added_at = {}
+            for relation_id, movie_id, external_id, position, added in relations.order_by('position', 'id').values_list(
+                'id', 'movie_id', 'movie__externalId', 'position', 'addedAt'
+            ):
+                current[movie_id] = (relation_id, position)
+                external_ids[movie_id] = external_id
+                added_at[movie_id] = added
+            
+            if 'replace' in data:
+                # El contenido queda en el orden de la lista recibida
+                target = list(dict.fromkeys(resolved[key] for key in data['replace'] if key in resolved))
+                keep = set(target)
+                to_add = [movie_id for movie_id in target if movie_id not in current]
+                to_remove = [movie_id for movie_id in current if movie_id not in keep]
+                if to_remove:
+                    relations.exclude(movie_id__in=target).delete()
+                positions = dict(zip(target, spread(len(target))))
+                moved = [
+                    WatchlistMovie(id=current[movie_id][0], position=positions[movie_id])
+                    for movie_id in target if movie_id in current and current[movie_id][1] != positions[movie_id]
+                ]
+                WatchlistMovie.objects.bulk_update(moved, ['position'], batch_size=500)
+                result = target
+            else:
+                to_add = list(dict.fromkeys(
+                    resolved[key] for key in data.get('add', []) if key in resolved and resolved[key] not in current
+                ))
+                to_remove = [resolved[key] for key in data.get('remove', []) if resolved.get(key) in current]
+                if to_remove:
+                    relations.filter(movie_id__in=to_remove).delete()
+                # Las nuevas se añaden al final
+                last = next(reversed(current.values()))[1] if current else None
+                positions = dict(zip(to_add, keys_after(last, len(to_add))))
+                removed = set(to_remove)
+                result = [movie_id for movie_id in current if movie_id not in removed] + to_add
+            
+            now = timezone.now()
+            WatchlistMovie.objects.bulk_create(
+                [WatchlistMovie(watchlist=watchlist, movie_id=movie_id, position=positions[movie_id], addedAt=now)
+                 for movie_id in to_add],
+                ignore_conflicts=True
+            )
+            # bulk_create/bulk_update no envían señales
+            invalidate_public_watchlists()
+            Watchlist.touch(watchlist.id)
+            record_listings(to_add, now)
+            # Los borrados en bloque no descuentan fila a fila (ver api/signals.py)
+            remove_listings((movie_id, added_at[movie_id]) for movie_id in to_remove)
+            if watchlist.isPublic:
+                # Solo las primeras, para que una importación no inunde los feeds
+                publish_many([
+                    Activity(actor_id=request.user.id, verb='listed', movie_id=movie_id, watchlistMovie_id=relation_id)
+                    for relation_id, movie_id in relations.filter(
+                        movie_id__in=to_add[:feed_settings()['MAX_BULK_ACTIVITIES']]
+                    ).order_by('position').values_list('id', 'movie_id')
+                ])
+        
+        return Response({
+            'added': len(to_add),
+            'removed': len(to_remove),
+            'notFound': [key for key in requested if key not in resolved],
+            'movies': [
+                {
+                    'movieId': movie_id,
+                    'externalId': external_ids[movie_id],
+                    'position': positions[movie_id] if movie_id in positions else current[movie_id][1],
+                }
+                for movie_id in result
+            ],
+        })
+    
+    # Reordenar: POST /watchlists/{id}/move/ con {"movieId": ..., "after": <movieId|null>}
+    # o {"movieId": ..., "before": <movieId|null>}. Solo se reescribe la fila movida
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        serializer = WatchlistMoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        with transaction.atomic():
+            watchlist = generics.get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            relations = WatchlistMovie.objects.filter(watchlist=watchlist)
+            
+            try:
+                moved = relations.get(movie_id=data['movieId'])
+            except WatchlistMovie.DoesNotExist:
+                return Response(
+                    {'error': 'La película no está en la watchlist'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            
+            try:
+                position = self._position_for_move(relations.exclude(pk=moved.pk), data)
+            except WatchlistMovie.DoesNotExist:
+                return Response(
+                    {'error': 'La película de referencia no está en la watchlist'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            except ValueError:
+                # Vecinos con la misma posición o posición demasiado larga: repartir y repetir
+                rebalance_watchlist(watchlist.id)
+                position = self._position_for_move(relations.exclude(pk=moved.pk), data)
+            
+            moved.position = position
+            moved.save(update_fields=['position'])
+            if len(position) > REBALANCE_LENGTH:
+                schedule_rebalance(watchlist.id)
+        
+        return Response({'movieId': moved.movie_id, 'position': moved.position})
+    
+    def _position_for_move(self, others, data):
+        ordered = others.order_by('position', 'id').values_list('position', flat=True)
+        if 'after' in data:
+            if data['after'] is None:
+                lower, upper = None, ordered.first()
+            else:
+                anchor = others.values('id', 'position').get(movie_id=data['after'])
+                lower = anchor['position']
+                upper = ordered.filter(
+                    Q(position__gt=lower) | Q(position=lower, id__gt=anchor['id'])
+                ).first()
+        else:
+            if data['before'] is None:
+                lower, upper = others.order_by('-position', '-id').values_list('position', flat=True).first(), None
+            else:
+                anchor = others.values('id', 'position').get(movie_id=data['before'])
+                upper = anchor['position']
+                lower = others.filter(
+                    Q(position__lt=upper) | Q(position=upper, id__lt=anchor['id'])
+                ).order_by('-position', '-id').values_list('position', flat=True).first()
+        
+        position = between(lower, upper)
+        if len(position) > MAX_LENGTH:
+            raise ValueError('Position too long')
+        return position
     
     @action(detail=True, methods=['post'])
     def add_movie(self, request, pk=None):
@@ -198,7 +728,7 @@ class WatchlistViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 # Vista para WatchlistMovies - VERSIÓN COMPLETA CORREGIDA
-class WatchlistMovieViewSet(viewsets.ModelViewSet):
+class WatchlistMovieViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     serializer_class = WatchlistMovieSerializer
     permission_classes = [IsAuthenticated]
     
@@ -211,6 +741,8 @@ class WatchlistMovieViewSet(viewsets.ModelViewSet):
         watchlist_id = self.request.query_params.get('watchlist')
         movie_id = self.request.query_params.get('movie')
         
+        # La watchlist y la película se traen en la misma consulta solo si se
+        # piden con ?expand= (ver shape_queryset)
         queryset = WatchlistMovie.objects.all()
         
         if watchlist_id:
@@ -235,14 +767,8 @@ class WatchlistMovieViewSet(viewsets.ModelViewSet):
         
         # Si no hay parámetros específicos, mostrar relaciones donde el usuario tenga permiso
         if not watchlist_id and not movie_id:
-            # Watchlists del usuario
-            user_watchlists = Watchlist.objects.filter(user=user)
-            # Watchlists públicas de otros usuarios
-            public_watchlists = Watchlist.objects.filter(isPublic=True)
-            # Combinar ambas
-            allowed_watchlists = (user_watchlists | public_watchlists).distinct()
-            
-            queryset = queryset.filter(watchlist__in=allowed_watchlists)
+            # Watchlists del usuario y públicas de otros usuarios
+            queryset = queryset.filter(watchlist__in=Watchlist.objects.visible_to(user))
         
         return queryset
     
@@ -256,14 +782,11 @@ class WatchlistMovieViewSet(viewsets.ModelViewSet):
         return context
     
     def perform_create(self, serializer):
-        # Log para debug
-        print(f"👤 [ViewSet] User creating WatchlistMovie: {self.request.user.id} - {self.request.user.username}")
-        
         # Validación adicional antes de guardar
         watchlist_id = self.request.data.get('watchlistId')
         movie_id = self.request.data.get('movieId')
         
-        print(f"📋 [ViewSet] Creating with watchlistId={watchlist_id}, movieId={movie_id}")
+        logger.debug('watchlist_movie.create', extra={'user_id': self.request.user.id, 'watchlist_id': watchlist_id, 'movie_id': movie_id})
         
         try:
             watchlist = Watchlist.objects.get(id=watchlist_id)
@@ -271,38 +794,37 @@ class WatchlistMovieViewSet(viewsets.ModelViewSet):
             
             # Verificar que el usuario es propietario de la watchlist
             if watchlist.user != self.request.user:
-                print(f"🚫 [ViewSet] User {self.request.user.id} is not owner of watchlist {watchlist.id}")
+                logger.warning('watchlist_movie.forbidden', extra={'user_id': self.request.user.id, 'watchlist_id': watchlist.id})
                 raise serializers.ValidationError(
                     {"error": "You don't have permission to add movies to this watchlist"}
                 )
             
             # Verificar que no existe ya la relación
             if WatchlistMovie.objects.filter(watchlist=watchlist, movie=movie).exists():
-                print(f"⚠️ [ViewSet] Movie {movie.id} already in watchlist {watchlist.id}")
+                logger.info('watchlist_movie.duplicate', extra={'watchlist_id': watchlist.id, 'movie_id': movie.id})
                 raise serializers.ValidationError(
                     {"error": "This movie is already in the watchlist"}
                 )
             
         except Watchlist.DoesNotExist:
-            print(f"❌ [ViewSet] Watchlist {watchlist_id} not found")
+            logger.info('watchlist_movie.watchlist_not_found', extra={'watchlist_id': watchlist_id})
             raise serializers.ValidationError({"error": "Watchlist not found"})
         except Movie.DoesNotExist:
-            print(f"❌ [ViewSet] Movie {movie_id} not found")
+            logger.info('watchlist_movie.movie_not_found', extra={'movie_id': movie_id})
             raise serializers.ValidationError({"error": "Movie not found"})
         
         # Llamar al save del serializer
         serializer.save()
-        print(f"✅ [ViewSet] WatchlistMovie created successfully")
     
     def create(self, request, *args, **kwargs):
         # Sobrescribir create para manejar mejor los errores
         try:
             return super().create(request, *args, **kwargs)
         except serializers.ValidationError as e:
-            print(f"❌ [ViewSet] Validation error: {e.detail}")
+            logger.info('watchlist_movie.invalid', extra={'errors': e.detail})
             return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            print(f"❌ [ViewSet] Unexpected error: {str(e)}")
+        except Exception:
+            logger.exception('watchlist_movie.create_failed')
             return Response(
                 {"error": "An unexpected error occurred"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -313,13 +835,13 @@ class WatchlistMovieViewSet(viewsets.ModelViewSet):
         
         # Verificar que el usuario es propietario de la watchlist
         if instance.watchlist.user != request.user:
-            print(f"🚫 [ViewSet] User {request.user.id} cannot delete from watchlist {instance.watchlist.id}")
+            logger.warning('watchlist_movie.forbidden', extra={'user_id': request.user.id, 'watchlist_id': instance.watchlist_id})
             return Response(
                 {'error': 'You don\'t have permission to remove movies from this watchlist'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        print(f"🗑️ [ViewSet] Deleting WatchlistMovie {instance.id}")
+        logger.info('watchlist_movie.deleted', extra={'watchlist_movie_id': instance.id})
         return super().destroy(request, *args, **kwargs)
     
     # Endpoint personalizado para obtener películas de una watchlist específica
@@ -343,9 +865,10 @@ class WatchlistMovieViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            watchlist_movies = WatchlistMovie.objects.filter(watchlist=watchlist)
-            serializer = self.get_serializer(watchlist_movies, many=True)
-            return Response(serializer.data)
+            watchlist_movies = self.shape_queryset(WatchlistMovie.objects.filter(watchlist=watchlist))
+            page = self.paginate_queryset(watchlist_movies)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
             
         except Watchlist.DoesNotExist:
             return Response(
@@ -367,17 +890,14 @@ class WatchlistMovieViewSet(viewsets.ModelViewSet):
         try:
             movie = Movie.objects.get(id=movie_id)
             
-            # Obtener todas las relaciones para esta película
-            watchlist_movies = WatchlistMovie.objects.filter(movie=movie)
-            
-            # Filtrar solo las que el usuario puede ver
-            filtered_watchlist_movies = []
-            for wm in watchlist_movies:
-                if wm.watchlist.isPublic or wm.watchlist.user == request.user:
-                    filtered_watchlist_movies.append(wm)
+            # Obtener las relaciones para esta película que el usuario puede ver
+            watchlist_movies = self.shape_queryset(WatchlistMovie.objects.filter(movie=movie).filter(
+                Q(watchlist__isPublic=True) | Q(watchlist__user=request.user)
+            ))
             
-            serializer = self.get_serializer(filtered_watchlist_movies, many=True)
-            return Response(serializer.data)
+            page = self.paginate_queryset(watchlist_movies)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
             
         except Movie.DoesNotExist:
             return Response(
@@ -385,9 +905,10 @@ class WatchlistMovieViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 # Vista para Ratings
-class RatingViewSet(viewsets.ModelViewSet):
+class RatingViewSet(ConditionalViewMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     serializer_class = RatingSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
     
     def get_queryset(self):
         user = self.request.user
@@ -423,9 +944,10 @@ class RatingViewSet(viewsets.ModelViewSet):
         return context
 
 # Vista para Comentarios
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(ConditionalViewMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
     
     def get_queryset(self):
         user = self.request.user
@@ -448,6 +970,52 @@ class CommentViewSet(viewsets.ModelViewSet):
     
     queryset = Comment.objects.all()
     
+    # Búsqueda de texto completo: /comments/search/?q=<texto>&movie=<uuid>&page_size=<n>&cursor=<cursor>
+    # Del más al menos relevante, con un fragmento del texto con las palabras marcadas
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        terms = search_terms(request.query_params.get('q', ''))
+        if not terms:
+            return Response(
+                {'error': 'q parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            movie_id = request.query_params.get('movie')
+            movie_id = uuid.UUID(movie_id) if movie_id else None
+            cursor = request.query_params.get('cursor')
+            after = decode_search_cursor(cursor) if cursor else None
+        except (ValueError, TypeError):
+            return Response(
+                {'error': 'Invalid movie or cursor'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        page_size = self.paginator.get_page_size(request)
+        # Una fila de más para saber si hay página siguiente
+        matches = search_comments(terms, movie_id=movie_id, after=after, limit=page_size + 1)
+        page = matches[:page_size]
+        comments = self.shape_queryset(Comment.objects.all()).in_bulk([comment_id for comment_id, _, _ in page])
+        
+        results = []
+        for comment_id, rank, snippet in page:
+            # Borrado entre la búsqueda y la carga
+            if comment_id not in comments:
+                continue
+            item = self.get_serializer(comments[comment_id]).data
+            item['snippet'] = snippet
+            item['score'] = -rank
+            results.append(item)
+        
+        next_link = None
+        if len(matches) > page_size:
+            rank, comment_id = page[-1][1], page[-1][0]
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'cursor', encode_search_cursor(rank, comment_id)
+            )
+        return Response({'next': next_link, 'previous': None, 'results': results})
+    
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
     
@@ -466,4 +1034,61 @@ class CommentViewSet(viewsets.ModelViewSet):
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
-        return context
\ No newline at end of file
+        return context
+
+# Vista para Leaderboards: /leaderboards/{kind}/?window=all|7d|30d
+# Sirve los puestos que precalcula compact_leaderboards, página a página por rank
+class LeaderboardView(SparseFieldsetsViewMixin, generics.ListAPIView):
+    serializer_class = LeaderboardEntrySerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = RankCursorPagination
+    
+    def list(self, request, *args, **kwargs):
+        if self.kwargs['kind'] not in dict(LeaderboardEntry.KIND_CHOICES):
+            return Response(
+                {'error': 'Leaderboard not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if self.get_window() not in WINDOWS:
+            return Response(
+                {'error': f"window must be one of: {', '.join(WINDOWS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return super().list(request, *args, **kwargs)
+    
+    def get_window(self):
+        return self.request.query_params.get('window', 'all')
+    
+    def get_queryset(self):
+        return LeaderboardEntry.objects.filter(kind=self.kwargs['kind'], window=self.get_window())
+
+# Vista para el feed: /feed/?page_size=<n>&cursor=<cursor>
+# Actividad de los usuarios seguidos, de la más reciente a la más antigua,
+# leída de la bandeja del usuario (ver api/feed.py)
+class FeedView(SparseFieldsetsViewMixin, generics.GenericAPIView):
+    serializer_class = ActivitySerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = DefaultCursorPagination
+    
+    def get(self, request):
+        cursor = request.query_params.get('cursor')
+        try:
+            before = decode_feed_cursor(cursor) if cursor else None
+        except ValueError:
+            return Response(
+                {'error': 'Invalid cursor'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        activities, next_before = feed_page(
+            request.user.id, before, self.paginator.get_page_size(request),
+            queryset=self.shape_queryset(Activity.objects.all())
+        )
+        next_link = None
+        if next_before is not None:
+            next_link = replace_query_param(request.build_absolute_uri(), 'cursor', encode_feed_cursor(next_before))
+        return Response({
+            'next': next_link,
+            'previous': None,
+            'results': self.get_serializer(activities, many=True).data,
+        })
\ No newline at end of file
@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Sin conexiones persistentes: con ASGI el código síncrono de cada petición
+# puede correr en un hilo distinto y las conexiones abiertas en esos hilos no
+# se cierran al terminar la petición (se irían acumulando)
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -10,6 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
+import sys
+import tempfile
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +50,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestIdMiddleware',
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -66,14 +74,77 @@ CORS_ALLOW_ALL_ORIGINS = True  # Solo para desarrollo
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.DefaultCursorPagination',
+    'PAGE_SIZE': 50,
+    # JSON con orjson si está instalado (api/renderers.py) y MessagePack
+    # (Accept / Content-Type: application/msgpack) si lo está msgpack
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        *(['api.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        *(['api.renderers.MessagePackParser'] if find_spec('msgpack') else []),
+    ],
+}
+
+# Ajustes de las funcionalidades de api/. Cada módulo tiene sus valores por
+# defecto (y su explicación) en el propio módulo; aquí solo va lo que
+# cambia, p. ej. FEED = {'FANOUT_LIMIT': 5000}:
+#   COMPRESSION (api/middleware.py): compresión brotli/gzip de las respuestas
+#   LEADERBOARDS (api/leaderboards.py), recalculados con `manage.py compact_leaderboards`
+#   SIMILARITY (api/similarity.py), con `manage.py compute_similarities`
+#   FEED (api/feed.py): feed de actividad de los usuarios seguidos
+#   TOKEN_AUTH_CACHE (api/authentication.py): caché de tokens por proceso; un token
+#     revocado en otro worker sigue valiendo hasta TTL segundos (300 por defecto)
+#   TMDB (api/tmdb.py): pasarela de metadatos de TMDB
+#   SQLITE (api/sqlite.py): PRAGMAs de cada conexión y mantenimiento periódico
+#   REPLICATION (api/routers.py): réplicas de lectura
+
+# Tamaño máximo de página que puede pedir un cliente con ?page_size=
+API_MAX_PAGE_SIZE = 200
+
+# Clientes que pueden leer /api/metrics sin ser staff (p. ej. el scraper de Prometheus)
+API_METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('API_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip]
+
+# Caché de Django (por proceso)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'letterboxd-clone',
+    },
+    # Lo que tienen que ver todos los procesos: las fijaciones al primario tras
+    # una escritura (api/routers.py) y la versión del listado público
+    # (api/caching.py). En producción, Redis o Memcached
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'letterboxd-clone-shared'),
+    },
 }
 
+# Segundos que se sirve una página del listado de watchlists públicas (api/caching.py);
+# los cambios la invalidan antes a través de la versión
+PUBLIC_WATCHLISTS_CACHE_TTL = 300
+PUBLIC_WATCHLISTS_VERSION_CACHE = 'shared'
+
+# Reparto de las posiciones de una watchlist cuando se alargan demasiado (api/ranking.py):
+# 'background' en un hilo aparte, 'inline' en la propia petición tras el commit
+WATCHLIST_REBALANCE = os.environ.get('WATCHLIST_REBALANCE', 'background')
+
+# Pasarela de metadatos de TMDB: la clave y, si se quiere, otra URL (p. ej. un servidor falso)
+TMDB = {'API_KEY': os.environ.get('TMDB_API_KEY', '')}
+if os.environ.get('TMDB_BASE_URL'):
+    TMDB['BASE_URL'] = os.environ['TMDB_BASE_URL']
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -101,7 +172,31 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Las transacciones piden el bloqueo de escritura al empezar (BEGIN IMMEDIATE)
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        # Conexiones persistentes: la caché de páginas y el mmap son por conexión.
+        # Con ASGI no se reutilizan (backend/asgi.py pone DB_CONN_MAX_AGE=0)
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Réplicas de lectura (api/routers.py). En local, DATABASE_REPLICAS=ruta1,ruta2
+# añade réplicas SQLite que se copian del primario con `manage.py replicate`.
+# Con PostgreSQL se añaden aquí los alias de las réplicas (con 'TEST':
+# {'MIRROR': 'default'}) y se listan en REPLICATION['REPLICAS']
+for _index, _path in enumerate(path for path in os.environ.get('DATABASE_REPLICAS', '').split(',') if path):
+    DATABASES[f'replica{_index + 1}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _path,
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+REPLICATION = {
+    'REPLICAS': [alias for alias in DATABASES if alias != 'default'],
+    'PIN_CACHE': 'shared',
 }
 
 
@@ -136,6 +231,50 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Logging
+# Registros JSON de una línea con el id de la petición. Los eventos por fila
+# (logger 'api.rows') van en WARNING por defecto, así que en producción apenas
+# cuestan una comprobación de nivel; si se activan pasan por un muestreo.
+# Niveles por logger: API_LOG_LEVELS="api.views=DEBUG,api.rows=DEBUG"
+# Los comandos de manage.py (test, seed_data, compute_similarities...) salvo
+# runserver solo escriben los avisos si no se pide otro nivel con API_LOG_LEVEL
+
+_COMMAND = sys.argv[1] if len(sys.argv) > 1 and os.path.basename(sys.argv[0]) == 'manage.py' else None
+API_LOG_LEVELS = {
+    'api': os.environ.get('API_LOG_LEVEL', 'INFO' if _COMMAND in (None, 'runserver') else 'WARNING'),
+    'api.rows': 'WARNING',
+}
+for _item in os.environ.get('API_LOG_LEVELS', '').split(','):
+    _name, _, _level = _item.partition('=')
+    if _name.strip() and _level.strip():
+        API_LOG_LEVELS[_name.strip()] = _level.strip().upper()
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'api.log.RequestIdFilter'},
+        'row_sampling': {'()': 'api.log.SamplingFilter', 'rate': 5, 'burst': 20},
+    },
+    'formatters': {
+        'structured': {'()': 'api.log.StructuredFormatter'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'structured',
+            'filters': ['request_id'],
+        },
+    },
+    'loggers': {
+        name: {'level': level}
+        for name, level in API_LOG_LEVELS.items()
+    },
+}
+LOGGING['loggers']['api'].update(handlers=['console'], propagate=False)
+LOGGING['loggers']['api.rows']['filters'] = ['row_sampling']
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
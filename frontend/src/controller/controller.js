@@ -268,10 +268,7 @@ export async function loadHome() {
   
   const userRatings = {};
   if (store.currentUser) {
-    for (const movie of movies) {
-      const rating = await Model.getUserRatingForTMDBMovie(movie.id);
-      if (rating) userRatings[movie.id] = rating;
-    }
+    Object.assign(userRatings, await Model.getUserRatingsForTMDBMovies(movies.map(movie => movie.id)));
   }
   
   View.renderTrendingMovies(movies, userRatings);
@@ -361,10 +358,7 @@ async function handleViewWatchlist(watchlistId) {
   
   const userRatings = {};
   if (store.currentUser) {
-    for (const movie of movies) {
-      const rating = await Model.getUserRatingForTMDBMovie(movie.id);
-      if (rating) userRatings[movie.id] = rating;
-    }
+    Object.assign(userRatings, await Model.getUserRatingsForTMDBMovies(movies.map(movie => movie.id)));
   }
   
   View.renderWatchlistView(watchlist, movies, userRatings);
@@ -395,10 +389,7 @@ async function handleRenameWatchlist() {
   
   const userRatings = {};
   if (store.currentUser) {
-    for (const movie of movies) {
-      const rating = await Model.getUserRatingForTMDBMovie(movie.id);
-      if (rating) userRatings[movie.id] = rating;
-    }
+    Object.assign(userRatings, await Model.getUserRatingsForTMDBMovies(movies.map(movie => movie.id)));
   }
   
   View.renderWatchlistView(store.currentWatchlist, movies, userRatings);
@@ -432,10 +423,7 @@ async function handleSaveRenameWatchlist() {
     const movies = await Model.getWatchlistMovies(store.currentWatchlist.id);
     const userRatings = {};
     if (store.currentUser) {
-      for (const movie of movies) {
-        const rating = await Model.getUserRatingForTMDBMovie(movie.id);
-        if (rating) userRatings[movie.id] = rating;
-      }
+      Object.assign(userRatings, await Model.getUserRatingsForTMDBMovies(movies.map(movie => movie.id)));
     }
     View.renderWatchlistView(store.currentWatchlist, movies, userRatings);
     return;
@@ -457,10 +445,7 @@ async function handleSaveRenameWatchlist() {
   
   const userRatings = {};
   if (store.currentUser) {
-    for (const movie of movies) {
-      const rating = await Model.getUserRatingForTMDBMovie(movie.id);
-      if (rating) userRatings[movie.id] = rating;
-    }
+    Object.assign(userRatings, await Model.getUserRatingsForTMDBMovies(movies.map(movie => movie.id)));
   }
   
   View.renderWatchlistView(updated, movies, userRatings);
@@ -550,10 +535,7 @@ async function handleAddMovieToWatchlist(watchlistId, movie) {
     
     const userRatings = {};
     if (store.currentUser) {
-      for (const movie of movies) {
-        const rating = await Model.getUserRatingForTMDBMovie(movie.id);
-        if (rating) userRatings[movie.id] = rating;
-      }
+      Object.assign(userRatings, await Model.getUserRatingsForTMDBMovies(movies.map(movie => movie.id)));
     }
     
     View.renderWatchlistView(store.currentWatchlist, movies, userRatings);
@@ -576,10 +558,7 @@ async function handleRemoveMovieFromWatchlist(movieId) {
   
   const userRatings = {};
   if (store.currentUser) {
-    for (const movie of movies) {
-      const rating = await Model.getUserRatingForTMDBMovie(movie.id);
-      if (rating) userRatings[movie.id] = rating;
-    }
+    Object.assign(userRatings, await Model.getUserRatingsForTMDBMovies(movies.map(movie => movie.id)));
   }
   
   View.renderWatchlistView(store.currentWatchlist, movies, userRatings);
@@ -934,10 +913,7 @@ export async function showTrending() {
   
   const userRatings = {};
   if (store.currentUser) {
-    for (const movie of movies) {
-      const rating = await Model.getUserRatingForTMDBMovie(movie.id);
-      if (rating) userRatings[movie.id] = rating;
-    }
+    Object.assign(userRatings, await Model.getUserRatingsForTMDBMovies(movies.map(movie => movie.id)));
   }
   
   View.renderTrendingMovies(movies, userRatings);
@@ -1056,10 +1032,7 @@ async function loadSearchPage() {
   
   const userRatings = {};
   if (store.currentUser) {
-    for (const movie of results.results) {
-      const rating = await Model.getUserRatingForTMDBMovie(movie.id);
-      if (rating) userRatings[movie.id] = rating;
-    }
+    Object.assign(userRatings, await Model.getUserRatingsForTMDBMovies(results.results.map(movie => movie.id)));
   }
   
   View.renderSearchResults(results, userRatings);
@@ -1075,10 +1048,7 @@ async function loadGenrePage() {
   
   const userRatings = {};
   if (store.currentUser) {
-    for (const movie of results.results) {
-      const rating = await Model.getUserRatingForTMDBMovie(movie.id);
-      if (rating) userRatings[movie.id] = rating;
-    }
+    Object.assign(userRatings, await Model.getUserRatingsForTMDBMovies(results.results.map(movie => movie.id)));
   }
   
   View.renderMoviesByGenre(results, currentGenreName, userRatings);
@@ -1094,10 +1064,7 @@ async function loadFilteredPage() {
   
   const userRatings = {};
   if (store.currentUser) {
-    for (const movie of results.results) {
-      const rating = await Model.getUserRatingForTMDBMovie(movie.id);
-      if (rating) userRatings[movie.id] = rating;
-    }
+    Object.assign(userRatings, await Model.getUserRatingsForTMDBMovies(results.results.map(movie => movie.id)));
   }
   
   View.renderFilteredMovies(results, currentFilters, userRatings);
@@ -1,5 +1,5 @@
 // model/model.js
-import { API_URL, TMDB_KEY, TMDB_URL } from '../utils/utils.js';
+import { API_URL, TMDB_KEY, TMDB_URL, fetchAllPages } from '../utils/utils.js';
 import store from '../store/store.js';
 
 // ==================== AUTH ====================
@@ -183,7 +183,7 @@ export async function createWatchlist(userId, name, isPublic) {
 
 export async function getUserWatchlists(userId) {
   try {
-    const res = await fetch(`${API_URL}/watchlists/`, {
+    const res = await fetchAllPages(`${API_URL}/watchlists/`, {
       headers: getAuthHeaders()
     });
 
@@ -217,7 +217,7 @@ export async function getUserWatchlists(userId) {
 export async function getPublicWatchlists() {
   try {
     // Para watchlists públicas, ahora CON autenticación
-    const res = await fetch(`${API_URL}/watchlists/`, {
+    const res = await fetchAllPages(`${API_URL}/watchlists/`, {
       headers: getAuthHeaders()  // Añadir headers de autenticación
     });
     
@@ -230,7 +230,7 @@ export async function getPublicWatchlists() {
         
         // Opción 1: Intentar sin autenticación como fallback
         try {
-          const fallbackRes = await fetch(`${API_URL}/watchlists/`);
+          const fallbackRes = await fetchAllPages(`${API_URL}/watchlists/`);
           if (fallbackRes.ok) {
             const allWatchlists = await fallbackRes.json();
             const publicWatchlists = allWatchlists.filter(watchlist => 
@@ -267,51 +267,33 @@ export async function getWatchlistMovies(watchlistId) {
   try {
     console.log(`🎬 Getting movies for watchlist ${watchlistId}`);
     
-    // Primero obtener las relaciones watchlist-movie
-    const relRes = await fetch(
-      `${API_URL}/watchlist-movies/?watchlist=${watchlistId}`,
+    // El contenido llega en una sola petición por página, con los detalles
+    // de TMDB ya incluidos desde la caché del backend
+    const relRes = await fetchAllPages(
+      `${API_URL}/watchlists/${watchlistId}/contents/?embed=tmdb`,
       {
         headers: getAuthHeaders()
       }
     );
     
     if (!relRes.ok) {
-      console.error("❌ Error fetching watchlist movies relations:", relRes.status);
+      console.error("❌ Error fetching watchlist contents:", relRes.status);
       return [];
     }
 
     const relations = await relRes.json();
-    console.log(`📊 Found ${relations.length} movie relations for watchlist ${watchlistId}`);
-    console.log("📋 Relations data:", relations);
+    console.log(`📊 Found ${relations.length} movies in watchlist ${watchlistId}`);
 
     const movies = [];
     
-    // Para cada relación, obtener los detalles de la película
-    for (const rel of relations) {
+    // Para cada película, usar los detalles incluidos o pedirlos a TMDB si faltan
+    for (const movie of relations) {
       try {
-        // Verificar que tenemos un movieId válido
-        const movieId = rel.movieId || (rel.movie && rel.movie.id);
-        if (!movieId) {
-          console.error("⚠️ No movieId found in relation:", rel);
+        if (movie.tmdb) {
+          movies.push(movie.tmdb);
           continue;
         }
         
-        console.log(`🎞️ Fetching movie with ID: ${movieId}`);
-        
-        // Obtener la película local primero
-        const movieRes = await fetch(`${API_URL}/movies/${movieId}/`, {
-          headers: getAuthHeaders()
-        });
-        
-        if (!movieRes.ok) {
-          console.error(`❌ Error fetching movie ${movieId}:`, movieRes.status);
-          continue;
-        }
-        
-        const movie = await movieRes.json();
-        console.log(`✅ Local movie found:`, movie);
-        
-        // Luego obtener los detalles de TMDB
         const tmdbRes = await fetch(
           `${TMDB_URL}/movie/${movie.externalId}?api_key=${TMDB_KEY}`
         );
@@ -397,26 +379,7 @@ export async function toggleWatchlistPrivacy(watchlistId, isPublic) {
 // ==================== DELETE WATCHLIST ====================
 export async function deleteWatchlist(watchlistId) {
   try {
-    // Primero eliminar todas las relaciones de películas
-    const relRes = await fetch(
-      `${API_URL}/watchlist-movies/?watchlist=${watchlistId}`,
-      {
-        headers: getAuthHeaders()
-      }
-    );
-    
-    if (relRes.ok) {
-      const relations = await relRes.json();
-      
-      for (const rel of relations) {
-        await fetch(`${API_URL}/watchlist-movies/${rel.id}/`, {
-          method: "DELETE",
-          headers: getAuthHeaders()
-        });
-      }
-    }
-
-    // Luego eliminar la watchlist
+    // Las relaciones con películas se borran en cascada en el servidor
     const deleteRes = await fetch(`${API_URL}/watchlists/${watchlistId}/`, {
       method: "DELETE",
       headers: getAuthHeaders()
@@ -469,41 +432,33 @@ export async function verifyWatchlistOwnership(watchlistId) {
     return false;
   }
 }
-// Actualiza ensureMovieExists para usar la nueva función
+// Alta idempotente de la película local a partir del id de TMDB (una sola petición)
+async function ensureLocalMovie(tmdbId) {
+  const res = await fetch(`${API_URL}/movies/by-external/${tmdbId}/`, {
+    method: "PUT",
+    headers: getAuthHeaders()
+  });
+  
+  if (!res.ok) {
+    const errorText = await res.text();
+    console.error("Error ensuring movie:", res.status, errorText);
+    return null;
+  }
+  
+  return res.json();
+}
+
 export async function ensureMovieExists(tmdbMovie) {
   try {
     console.log(`Checking/creating movie for TMDB ID: ${tmdbMovie.id}, Title: ${tmdbMovie.title}`);
     
-    // Usar la nueva función mejorada
-    const existingMovie = await findLocalMovieByExternalId(tmdbMovie.id);
-    
-    if (existingMovie) {
-      console.log(`✅ Movie ${tmdbMovie.id} already exists with ID: ${existingMovie.id}`);
-      return existingMovie.id;
-    }
-    
-    console.log(`🆕 Creating new movie for TMDB ID: ${tmdbMovie.id}`);
-    
-    const movieData = {
-      externalId: tmdbMovie.id
-    };
-    
-    console.log("Sending movie data:", movieData);
-    
-    const createRes = await fetch(`${API_URL}/movies/`, {
-      method: "POST",
-      headers: getAuthHeaders(),
-      body: JSON.stringify(movieData)
-    });
+    const movie = await ensureLocalMovie(tmdbMovie.id);
     
-    if (!createRes.ok) {
-      const errorText = await createRes.text();
-      console.error("Error creating movie:", createRes.status, errorText);
+    if (!movie) {
       return null;
     }
     
-    const movie = await createRes.json();
-    console.log(`✅ Created new movie with ID: ${movie.id} for TMDB ID: ${movie.externalId}`);
+    console.log(`✅ Movie ${tmdbMovie.id} available with ID: ${movie.id}`);
     return movie.id;
   } catch (error) {
     console.error("Error in ensureMovieExists:", error);
@@ -518,38 +473,16 @@ export async function addMovieToWatchlist(watchlistId, tmdbMovie) {
     console.log(`🎬 Adding movie ${tmdbMovie.id} "${tmdbMovie.title}" to watchlist ${watchlistId}`);
     
     // 1. Asegurar que la película existe localmente
-    let movieId;
-    
-    // Primero intentar encontrar la película existente
-    const existingMovie = await findLocalMovieByExternalId(tmdbMovie.id);
+    const movie = await ensureLocalMovie(tmdbMovie.id);
     
-    if (existingMovie) {
-      movieId = existingMovie.id;
-      console.log(`✅ Using existing movie ID: ${movieId}`);
-    } else {
-      // Crear nueva película
-      console.log(`🆕 Creating new movie for TMDB ID: ${tmdbMovie.id} - ${tmdbMovie.title}`);
-      
-      const createRes = await fetch(`${API_URL}/movies/`, {
-        method: "POST",
-        headers: getAuthHeaders(),
-        body: JSON.stringify({
-          externalId: tmdbMovie.id
-        })
-      });
-      
-      if (!createRes.ok) {
-        const errorText = await createRes.text();
-        console.error("❌ Error creating movie:", createRes.status, errorText);
-        alert("Error creating movie record");
-        return false;
-      }
-      
-      const newMovie = await createRes.json();
-      movieId = newMovie.id;
-      console.log(`✅ Created new movie with ID: ${movieId} (TMDB: ${newMovie.externalId})`);
+    if (!movie) {
+      alert("Error creating movie record");
+      return false;
     }
     
+    const movieId = movie.id;
+    console.log(`✅ Using movie ID: ${movieId}`);
+    
     // 2. Crear la relación
     const requestData = {
       watchlistId: watchlistId,
@@ -605,62 +538,24 @@ export async function removeMovieFromWatchlist(watchlistId, tmdbMovieId) {
   try {
     console.log(`Removing movie ${tmdbMovieId} from watchlist ${watchlistId}`);
     
-    // 1. Buscar la película local
-    const movieRes = await fetch(
-      `${API_URL}/movies?externalId=${tmdbMovieId}`,
-      {
-        headers: getAuthHeaders()
-      }
-    );
-    
-    if (!movieRes.ok) {
-      console.error("Error finding movie:", movieRes.status);
-      return false;
-    }
-    
-    const movies = await movieRes.json();
-    console.log(`Found ${movies.length} movies with externalId ${tmdbMovieId}`);
-
-    if (!movies.length) {
-      console.error("Movie not found");
-      return false;
-    }
-
-    const localMovieId = movies[0].id;
-    console.log(`Using local movie ID: ${localMovieId}`);
-    
-    // 2. Buscar la relación (usando el endpoint correcto)
-    const relRes = await fetch(
-      `${API_URL}/watchlist-movies/?watchlist=${watchlistId}&movie=${localMovieId}`,
-      {
-        headers: getAuthHeaders()
-      }
-    );
+    // Un solo cambio en bloque con el id de TMDB
+    const res = await fetch(`${API_URL}/watchlists/${watchlistId}/bulk/`, {
+      method: "POST",
+      headers: getAuthHeaders(),
+      body: JSON.stringify({ idType: "externalId", remove: [tmdbMovieId] })
+    });
     
-    if (!relRes.ok) {
-      console.error("Error finding watchlist-movie relation:", relRes.status);
+    if (!res.ok) {
+      console.error("Error removing movie from watchlist:", res.status);
       return false;
     }
     
-    const relations = await relRes.json();
-    console.log(`Found ${relations.length} relations`);
-
-    if (!relations.length) {
+    const result = await res.json();
+    if (!result.removed) {
       console.error("Relation not found");
       return false;
     }
 
-    // 3. Eliminar la relación
-    const deleteRes = await fetch(`${API_URL}/watchlist-movies/${relations[0].id}/`, {
-      method: "DELETE",
-      headers: getAuthHeaders()
-    });
-    
-    if (!deleteRes.ok) {
-      console.error("Error deleting relation:", deleteRes.status);
-      return false;
-    }
-
     console.log("✅ Movie removed from watchlist successfully");
     return true;
     
@@ -673,8 +568,9 @@ export async function removeMovieFromWatchlist(watchlistId, tmdbMovieId) {
 export async function getMovieRating(movieId) {
   if (!store.currentUser) return null;
   
-  const res = await fetch(
-    `${API_URL}/ratings?userId=${store.currentUser.id}&movieId=${movieId}`
+  const res = await fetchAllPages(
+    `${API_URL}/ratings/?userId=${store.currentUser.id}&movie=${movieId}`,
+    { headers: getAuthHeaders() }
   );
   const ratings = await res.json();
   return ratings[0] || null;
@@ -686,8 +582,8 @@ export async function getAverageRating(movieId) {
   try {
     console.log(`Getting average rating for movie ${movieId}`);
     
-    // Usar el parámetro 'movie' en lugar de 'movieId'
-    const res = await fetch(`${API_URL}/ratings/?movie=${movieId}`, {
+    // Las estadísticas vienen precalculadas desde el backend
+    const res = await fetch(`${API_URL}/movies/${movieId}/stats/`, {
       headers: getAuthHeaders()
     });
     
@@ -696,13 +592,12 @@ export async function getAverageRating(movieId) {
       return null;
     }
     
-    const ratings = await res.json();
-    console.log(`Found ${ratings.length} ratings for movie ${movieId}`);
+    const stats = await res.json();
+    console.log(`Found ${stats.count} ratings for movie ${movieId}`);
     
-    if (ratings.length === 0) return null;
+    if (stats.count === 0) return null;
     
-    const sum = ratings.reduce((acc, rating) => acc + rating.score, 0);
-    const average = (sum / ratings.length).toFixed(1);
+    const average = stats.mean.toFixed(1);
     console.log(`Average rating: ${average}`);
     
     return average;
@@ -721,7 +616,7 @@ export async function getLocalMovieByExternalId(externalId) {
     const externalIdNum = parseInt(externalId);
     
     // IMPORTANTE: Usar el parámetro 'externalId' correctamente
-    const res = await fetch(`${API_URL}/movies/?externalId=${externalId}`, {
+    const res = await fetchAllPages(`${API_URL}/movies/?externalId=${externalId}`, {
       headers: getAuthHeaders()
     });
     
@@ -766,7 +661,7 @@ export async function findLocalMovieByExternalId(externalId) {
     const externalIdNum = parseInt(externalId);
     
     // Usar el endpoint que filtra por externalId
-    const res = await fetch(`${API_URL}/movies/?externalId=${externalId}`, {
+    const res = await fetchAllPages(`${API_URL}/movies/?externalId=${externalId}`, {
       headers: getAuthHeaders()
     });
     
@@ -822,7 +717,7 @@ export async function getUserRatingForTMDBMovie(tmdbId) {
   
   try {
     // Primero busca la película local
-    const movieRes = await fetch(`${API_URL}/movies?externalId=${tmdbId}`, {
+    const movieRes = await fetchAllPages(`${API_URL}/movies/?externalId=${tmdbId}`, {
       headers: getAuthHeaders()
     });
     
@@ -844,9 +739,9 @@ export async function getUserRatingForTMDBMovie(tmdbId) {
     const localMovieId = movies[0].id;
     console.log(`Looking for rating for movie ${localMovieId} (TMDB: ${tmdbId})`);
     
-    // Buscar ratings y filtrar LOCALMENTE por movieId
-    const ratingRes = await fetch(
-      `${API_URL}/ratings/?userId=${store.currentUser.id}`,
+    // Buscar el rating del usuario para esta película
+    const ratingRes = await fetchAllPages(
+      `${API_URL}/ratings/?userId=${store.currentUser.id}&movie=${localMovieId}`,
       {
         headers: getAuthHeaders()
       }
@@ -878,6 +773,37 @@ export async function getUserRatingForTMDBMovie(tmdbId) {
   }
 }
 
+// Puntuaciones del usuario para una rejilla de películas de TMDB en una sola petición.
+// Devuelve { tmdbId: { score } } solo para las películas que el usuario ha puntuado
+export async function getUserRatingsForTMDBMovies(tmdbIds) {
+  if (!store.currentUser || !tmdbIds.length) return {};
+  
+  try {
+    const res = await fetch(`${API_URL}/movies/resolve/`, {
+      method: "POST",
+      headers: getAuthHeaders(),
+      body: JSON.stringify({ externalIds: tmdbIds.slice(0, 100) })
+    });
+    
+    if (!res.ok) {
+      console.warn("Error resolving movies:", res.status);
+      return {};
+    }
+    
+    const resolved = await res.json();
+    const userRatings = {};
+    resolved.forEach(movie => {
+      if (movie.userScore !== null) {
+        userRatings[movie.externalId] = { movieId: movie.id, score: movie.userScore };
+      }
+    });
+    return userRatings;
+  } catch (error) {
+    console.error("Error getting user ratings:", error);
+    return {};
+  }
+}
+
 export async function rateMovie(movieId, score) {
   if (!store.currentUser) {
     console.error("No user logged in for rating");
@@ -887,9 +813,9 @@ export async function rateMovie(movieId, score) {
   try {
     console.log(`Rating movie ${movieId} with score ${score}`);
     
-    // Buscar TODOS los ratings del usuario
-    const allRatingsRes = await fetch(
-      `${API_URL}/ratings/?userId=${store.currentUser.id}`,
+    // Buscar el rating del usuario para esta película
+    const allRatingsRes = await fetchAllPages(
+      `${API_URL}/ratings/?userId=${store.currentUser.id}&movie=${movieId}`,
       {
         headers: getAuthHeaders()
       }
@@ -960,30 +886,19 @@ export async function rateMovie(movieId, score) {
 }
 
 export async function getRatingCount(movieId) {
-  const res = await fetch(`${API_URL}/ratings?movieId=${movieId}`);
-  const ratings = await res.json();
-  return ratings.length;
+  const res = await fetch(`${API_URL}/movies/${movieId}/stats/`, {
+    headers: getAuthHeaders()
+  });
+  const stats = await res.json();
+  return stats.count;
 }
 
 export async function getMovieComments(tmdbId) {
   try {
     console.log(`Getting comments for TMDB movie: ${tmdbId}`);
     
-    // Obtener TODOS los comentarios
-    const res = await fetch(`${API_URL}/comments/`, {
-      headers: getAuthHeaders()
-    });
-    
-    if (!res.ok) {
-      console.error("Error fetching comments:", res.status);
-      return [];
-    }
-    
-    let allComments = await res.json();
-    console.log(`Received ${allComments.length} total comments from API`);
-    
-    // Filtrar manualmente: necesitamos encontrar la película local primero
-    const movieRes = await fetch(`${API_URL}/movies?externalId=${tmdbId}`, {
+    // Primero encontrar la película local
+    const movieRes = await fetchAllPages(`${API_URL}/movies/?externalId=${tmdbId}`, {
       headers: getAuthHeaders()
     });
     
@@ -1001,12 +916,17 @@ export async function getMovieComments(tmdbId) {
     
     const localMovieId = movies[0].id;
     
-    // Filtrar comentarios por localMovieId
-    const filteredComments = allComments.filter(comment => {
-      const commentMovieId = comment.movieId || (comment.movie && comment.movie.id);
-      return commentMovieId === localMovieId;
+    // Pedir solo los comentarios de esta película
+    const res = await fetchAllPages(`${API_URL}/comments/?movie=${localMovieId}`, {
+      headers: getAuthHeaders()
     });
     
+    if (!res.ok) {
+      console.error("Error fetching comments:", res.status);
+      return [];
+    }
+    
+    const filteredComments = await res.json();
     console.log(`Filtered to ${filteredComments.length} comments for movie ${localMovieId}`);
     
     return filteredComments;
@@ -1030,49 +950,15 @@ export async function addComment(tmdbId, text) {
     console.log(`Adding comment for TMDB movie: ${tmdbId}`);
     
     // 1. Obtener o crear la película local
-    let localMovieId;
+    const movie = await ensureLocalMovie(tmdbId);
     
-    // Buscar la película en la base de datos
-    const movieRes = await fetch(`${API_URL}/movies?externalId=${tmdbId}`, {
-      headers: getAuthHeaders()
-    });
-    
-    if (movieRes.ok) {
-      const movies = await movieRes.json();
-      if (movies.length > 0) {
-        localMovieId = movies[0].id;
-        console.log(`✅ Found existing movie with ID: ${localMovieId}, externalId: ${movies[0].externalId}`);
-      }
+    if (!movie) {
+      alert("Error creating movie record");
+      return null;
     }
     
-    // Si no existe, crear una NUEVA con el ID correcto
-    if (!localMovieId) {
-      console.log(`🆕 Creating new movie for TMDB ID: ${tmdbId}`);
-      
-      // IMPORTANTE: Crear la película con el externalId CORRECTO
-      const movieData = {
-        externalId: tmdbId  // Usar el tmdbId real
-      };
-      
-      console.log("Creating movie with data:", movieData);
-      
-      const createRes = await fetch(`${API_URL}/movies/`, {
-        method: "POST",
-        headers: getAuthHeaders(),
-        body: JSON.stringify(movieData)
-      });
-
-      if (!createRes.ok) {
-        const errorText = await createRes.text();
-        console.error("Error creating movie:", createRes.status, errorText);
-        alert("Error creating movie record");
-        return null;
-      }
-      
-      const newMovie = await createRes.json();
-      localMovieId = newMovie.id;
-      console.log(`✅ Created new movie with ID: ${localMovieId} and externalId: ${newMovie.externalId}`);
-    }
+    const localMovieId = movie.id;
+    console.log(`✅ Using movie with ID: ${localMovieId}, externalId: ${movie.externalId}`);
     
     // 2. Crear el comentario
     const commentData = {
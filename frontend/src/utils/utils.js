@@ -6,6 +6,31 @@ export const API_URL = "http://localhost:8000/api"; // Django API
 export const TMDB_KEY = "9fcfa50488cf85409f7494574642e9e0";
 export const TMDB_URL = "https://api.themoviedb.org/3";
 
+// Las listas de la API vienen paginadas por cursor: { next, previous, results }
+export function unwrapResults(data) {
+  if (Array.isArray(data)) return data;
+  return (data && data.results) || [];
+}
+
+// Sustituto de fetch para listas: sigue los enlaces "next" y devuelve
+// una respuesta cuyo json() es el array completo de resultados
+export async function fetchAllPages(url, options = {}) {
+  const results = [];
+  let nextUrl = url;
+  let res = null;
+
+  while (nextUrl) {
+    res = await fetch(nextUrl, options);
+    if (!res.ok) return res;
+
+    const data = await res.json();
+    results.push(...unwrapResults(data));
+    nextUrl = Array.isArray(data) ? null : data.next;
+  }
+
+  return { ok: true, status: res.status, json: async () => results };
+}
+
 // Funciones de utilidad general
 export const Utils = {
   navigate(to) {